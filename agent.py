@@ -1,12 +1,63 @@
 import google.generativeai as genai
+import asyncio
+import hashlib
 import os
 import json
 import logging
+import time
+from jinja2 import Template
+from analysis_cache import AnalysisCache, make_cache_key
+from utils import retry_with_backoff
+from config import ANALYSIS_CACHE_FILE, ANALYSIS_CACHE_TTL_HOURS, ANALYSIS_CACHE_MAX_ENTRIES, GEMINI_TIMEOUT_SECONDS
 
 logger = logging.getLogger(__name__)
 
+PROMPT_FILE = "system_prompt.txt"
+PROMPT_CHECK_INTERVAL = 1.0  # Seconds between mtime checks of PROMPT_FILE
+
+# Structured output for analyze_messages_batch: one result per input conversation, keyed by index
+BATCH_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer"},
+                    "priority": {"type": "integer"},
+                    "summary": {"type": "string"},
+                    "action_required": {"type": "boolean"},
+                    "deadline": {"type": "string", "nullable": True},
+                    "reply_text": {"type": "string", "nullable": True},
+                    "save_memory": {"type": "string", "nullable": True}
+                },
+                "required": ["index", "priority", "summary", "action_required"]
+            }
+        }
+    },
+    "required": ["results"]
+}
+
 class Agent:
     def __init__(self):
+        # Compiled system prompt, reloaded only when the file changes
+        self._prompt_template = None
+        self._prompt_signature = None  # (mtime_ns, size) of the loaded file
+        self._prompt_checked_at = 0.0
+        self.prompt_version = None  # Short content hash of the loaded prompt
+        self.prompt_reloads = 0
+        self.prompt_renders = 0
+        self.prompt_render_ms_total = 0.0
+        self.prompt_render_ms_last = 0.0
+        self.warm_up_seconds = None  # Gemini channel warm-up at startup
+        self.llm_in_flight = 0  # Gemini requests currently awaiting a response
+
+        # Persistent cache of analysis results (repeated inputs skip the LLM)
+        self.analysis_cache = None
+        if ANALYSIS_CACHE_TTL_HOURS > 0:
+            self.analysis_cache = AnalysisCache(ANALYSIS_CACHE_FILE, ttl_seconds=ANALYSIS_CACHE_TTL_HOURS * 3600, max_entries=ANALYSIS_CACHE_MAX_ENTRIES)
+
         self.api_key = os.getenv("GENAI_KEY")
         if not self.api_key:
             logger.warning("GENAI_KEY not found. Agent will not function correctly.")
@@ -22,7 +73,24 @@ class Agent:
                 logger.info(f"Available model: {m.name}")
             raise e
 
-    async def analyze_message(self, message_text: str, sender_info: str, memory_text: str = "") -> dict:
+    def _analysis_cache_key(self, message_text, sender_info, memory_text):
+        try:
+            self._get_prompt_template()  # Make sure prompt_version reflects the current file
+        except Exception:
+            pass
+        return make_cache_key(message_text, sender_info, memory_text, self.prompt_version)
+
+    def get_cached_analysis(self, message_text: str, sender_info: str, memory_text: str = ""):
+        """Returns a stored analysis for this exact input, or None."""
+        if not self.analysis_cache:
+            return None
+        return self.analysis_cache.get(self._analysis_cache_key(message_text, sender_info, memory_text))
+
+    def _store_analysis(self, message_text, sender_info, memory_text, result):
+        if self.analysis_cache:
+            self.analysis_cache.put(self._analysis_cache_key(message_text, sender_info, memory_text), result)
+
+    async def analyze_message(self, message_text: str, sender_info: str, memory_text: str = "", check_cache: bool = True) -> dict:
         """
         Analyzes a message to determine importance and generate a summary.
         Returns a dictionary: { "priority": int, "summary": str, "action_required": bool, "deadline": str, "reply_text": str, "save_memory": str }
@@ -30,34 +98,130 @@ class Agent:
         if not self.api_key:
             return {"priority": 0, "summary": "No API Key", "action_required": False}
 
-        # Load Prompt from File for easy management
-        try:
-            from jinja2 import Template
-            with open("system_prompt.txt", "r") as f:
-                template_str = f.read()
-                template = Template(template_str)
-                prompt = template.render(memory_text=memory_text, message_text=message_text)
-        except Exception as e:
-            logger.error(f"Failed to load system_prompt.txt: {e}")
-            # Fallback (Generic)
-            prompt = f"Analyze this chat: {message_text}. Memory: {memory_text}. Json output."
+        if check_cache:
+            cached = self.get_cached_analysis(message_text, sender_info, memory_text)
+            if cached is not None:
+                logger.info("Analysis served from cache.")
+                return cached
+
+        prompt = self._render_prompt(memory_text, message_text)
         
         try:
-            response = await self.model.generate_content_async(prompt, generation_config={"response_mime_type": "application/json"})
-            return json.loads(response.text)
+            response = await self._generate(prompt, generation_config={"response_mime_type": "application/json"})
+            result = json.loads(response.text)
+            self._store_analysis(message_text, sender_info, memory_text, result)
+            return result
         except Exception as e:
             logger.error(f"Error analyzing message: {e}")
             return {"priority": 0, "summary": "Analysis failed", "action_required": False}
 
-    async def summarize_discussions(self, buffer_text: str) -> str:
+    def _get_prompt_template(self):
+        """Returns the compiled system prompt, recompiling only when the file content changes."""
+        now = time.monotonic()
+        if self._prompt_template is not None and now - self._prompt_checked_at < PROMPT_CHECK_INTERVAL:
+            return self._prompt_template
+        self._prompt_checked_at = now
+
+        stat = os.stat(PROMPT_FILE)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._prompt_signature:
+            return self._prompt_template
+
+        with open(PROMPT_FILE, "r") as f:
+            template_str = f.read()
+        self._prompt_signature = signature
+
+        version = hashlib.sha256(template_str.encode()).hexdigest()[:12]
+        if version != self.prompt_version:
+            self._prompt_template = Template(template_str)
+            self.prompt_version = version
+            self.prompt_reloads += 1
+            logger.info(f"Loaded {PROMPT_FILE} (version {version}).")
+        return self._prompt_template
+
+    def _render_prompt(self, memory_text, message_text):
+        """Renders the system prompt with the given memory and chat context."""
+        try:
+            template = self._get_prompt_template()
+        except Exception as e:
+            logger.error(f"Failed to load {PROMPT_FILE}: {e}")
+            template = self._prompt_template  # Keep serving the last good version
+
+        if template is None:
+            # Fallback (Generic)
+            return f"Analyze this chat: {message_text}. Memory: {memory_text}. Json output."
+
+        started = time.perf_counter()
+        prompt = template.render(memory_text=memory_text, message_text=message_text)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.prompt_renders += 1
+        self.prompt_render_ms_total += elapsed_ms
+        self.prompt_render_ms_last = elapsed_ms
+        return prompt
+
+    def get_prompt_stats(self):
+        return {
+            "version": self.prompt_version,
+            "reloads": self.prompt_reloads,
+            "renders": self.prompt_renders,
+            "render_ms_last": round(self.prompt_render_ms_last, 3),
+            "render_ms_avg": round(self.prompt_render_ms_total / self.prompt_renders, 3) if self.prompt_renders else None
+        }
+
+    async def analyze_messages_batch(self, items: list) -> list:
+        """
+        Analyzes several conversations that share the same memory context in one request.
+        items: list of (message_text, sender_info, memory_text, item_memory_text) tuples, where
+        memory_text is shared by every item and item_memory_text (e.g. the long-term memories
+        retrieved for that conversation) is placed next to its conversation.
+        Returns a list aligned with items; entries the model did not answer are None.
+        Raises if the request itself fails so callers can fall back to per-message calls.
+        """
+        if not self.api_key:
+            return [{"priority": 0, "summary": "No API Key", "action_required": False} for _ in items]
+
+        conversations = "\n\n".join(
+            f"=== Conversation {i} (from {sender_info}) ===\n"
+            + (f"[Memory for this conversation]\n{item_memory_text}\n[Chat]\n" if item_memory_text else "")
+            + message_text
+            for i, (message_text, sender_info, _, item_memory_text) in enumerate(items)
+        )
+        prompt = self._render_prompt(items[0][2], conversations)
+        prompt += f"""
+
+BATCH MODE:
+The Chat Context above contains {len(items)} independent conversations, numbered 0 to {len(items) - 1}.
+Apply the task above to EACH conversation separately (its last message is its Trigger).
+Output JSON only: {{"results": [{{"index": <conversation number>, ...the fields above...}}]}} with exactly one entry per conversation.
+"""
+
+        response = await self._generate(prompt, generation_config={
+            "response_mime_type": "application/json",
+            "response_schema": BATCH_RESPONSE_SCHEMA
+        })
+        data = json.loads(response.text)
+
+        results = [None] * len(items)
+        for result in data.get("results", []):
+            index = result.pop("index", None)
+            if isinstance(index, int) and 0 <= index < len(items) and results[index] is None:
+                message_text, sender_info, memory_text, item_memory_text = items[index]
+                results[index] = result
+                self._store_analysis(message_text, sender_info, join_memory_text(memory_text, item_memory_text), result)
+        return results
+
+    async def summarize_discussions(self, buffer_text: str, with_usage: bool = False):
         """
-        Summarizes a list of discussion points into a cohesive daily report.
+        Summarizes discussion points (raw, or already condensed per chat) into a cohesive daily report.
+        With with_usage, returns (text, total_tokens).
         """
-        if not buffer_text: return "No meaningful discussions to report."
+        if not buffer_text:
+            text = "No meaningful discussions to report."
+            return (text, 0) if with_usage else text
         
         prompt = f"""
         You are a helpful assistant summarizing the day's group chats.
-        Here are the raw discussion points, grouped by chat:
+        Here are the discussion points (raw, or pre-summarized per chat), grouped by chat:
         
         {buffer_text}
         
@@ -70,11 +234,74 @@ class Agent:
         """
         
         try:
-            response = await self.model.generate_content_async(prompt)
-            return response.text
+            response = await self._generate(prompt)
+            text, tokens = response.text, self._total_tokens(response)
         except Exception as e:
             logger.error(f"Error generating summary: {e}")
-            return "Failed to generate summary."
+            text, tokens = "Failed to generate summary.", 0
+        return (text, tokens) if with_usage else text
+
+    async def summarize_chat_points(self, chat_name: str, points_text: str, previous_summary: str = None):
+        """
+        Condenses one chat's discussion points, folding them into previous_summary if given
+        (rolling per-chat summaries and the map step of the group digest).
+        Returns (summary, total_tokens); summary is None on failure.
+        """
+        if previous_summary:
+            intro = f"""Here is the running summary of the Telegram group "{chat_name}" so far:
+
+        {previous_summary}
+
+        Update it with the new discussion points below."""
+        else:
+            intro = f'Condense the following discussion points from the Telegram group "{chat_name}".'
+
+        prompt = f"""
+        {intro}
+        Keep decisions, requests, deadlines, names and open questions. Drop greetings and chatter.
+        Output at most 8 short bullet points in Markdown, nothing else.
+
+        {points_text}
+        """
+
+        try:
+            response = await self._generate(prompt)
+            return response.text, self._total_tokens(response)
+        except Exception as e:
+            logger.error(f"Error summarizing chat {chat_name}: {e}")
+            return None, 0
+
+    @retry_with_backoff(retries=2, backoff_in_seconds=1, max_backoff_in_seconds=10, breaker="gemini")
+    async def _generate(self, prompt, **kwargs):
+        """All Gemini calls: retried on transient errors, failing fast while the Gemini circuit is open."""
+        kwargs.setdefault("request_options", {"timeout": GEMINI_TIMEOUT_SECONDS})
+        self.llm_in_flight += 1
+        try:
+            return await self.model.generate_content_async(prompt, **kwargs)
+        finally:
+            self.llm_in_flight -= 1
+
+    async def warm_up(self):
+        """
+        Opens the Gemini channel at startup with a cheap token count, so the first real message
+        doesn't pay for DNS, TLS and channel setup. Returns the seconds taken, or None.
+        """
+        if not getattr(self, "model", None):
+            return None
+        start = time.perf_counter()
+        try:
+            await self.model.count_tokens_async("ping", request_options={"timeout": GEMINI_TIMEOUT_SECONDS})
+        except Exception as e:
+            logger.warning(f"Gemini warm-up failed: {e}")
+            return None
+        self.warm_up_seconds = round(time.perf_counter() - start, 3)
+        logger.info(f"Gemini channel warmed in {self.warm_up_seconds}s.")
+        return self.warm_up_seconds
+
+    def _total_tokens(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        return getattr(usage, "total_token_count", 0) or 0
+
     async def analyze_context_batch(self, history_text: str) -> list:
         """
         Analyzes a batch of chat history to extract persistent user facts.
@@ -106,9 +333,118 @@ class Agent:
         """
 
         try:
-            response = await self.model.generate_content_async(prompt, generation_config={"response_mime_type": "application/json"})
+            response = await self._generate(prompt, generation_config={"response_mime_type": "application/json"})
             data = json.loads(response.text)
             return data.get("facts", [])
         except Exception as e:
             logger.error(f"Error analyzing context batch: {e}")
             return []
+
+
+def join_memory_text(memory_text, item_memory_text):
+    """The full memory context of one message: the shared block plus its own retrieved memories."""
+    return f"{memory_text}\n\n{item_memory_text}" if item_memory_text else memory_text
+
+
+class AnalysisBatcher:
+    """
+    Collects analyze requests that arrive within a short window and sends them to the model
+    as one batch (per distinct shared memory context; per-message memories travel with their
+    item). Failed or unanswered items fall back to Agent.analyze_message.
+    """
+    def __init__(self, agent, window_ms=250, max_size=8, max_chars=24000):
+        self.agent = agent
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self.max_chars = max_chars
+        self._batches = {}  # memory_text -> {"items": [...], "futures": [...], "chars": int, "timer": TimerHandle}
+        self._tasks = set()
+
+        # Counters
+        self.batches_sent = 0
+        self.batched_messages = 0
+        self.fallbacks = 0
+
+    async def analyze(self, message_text: str, sender_info: str, memory_text: str = "", item_memory_text: str = "") -> dict:
+        """
+        memory_text is the context shared across messages (batches are grouped by it);
+        item_memory_text is specific to this message, such as its retrieved long-term memories.
+        """
+        full_memory_text = join_memory_text(memory_text, item_memory_text)
+        if self.window <= 0 or self.max_size <= 1:
+            return await self.agent.analyze_message(message_text, sender_info, full_memory_text)
+
+        cached = self.agent.get_cached_analysis(message_text, sender_info, full_memory_text)
+        if cached is not None:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        size = len(message_text) + len(sender_info or "") + len(item_memory_text)
+
+        batch = self._batches.get(memory_text)
+        if batch and batch["chars"] + size > self.max_chars:
+            self._flush(memory_text)
+            batch = None
+        if batch is None:
+            batch = {"items": [], "futures": [], "chars": 0, "timer": None}
+            batch["timer"] = loop.call_later(self.window, self._flush, memory_text)
+            self._batches[memory_text] = batch
+
+        future = loop.create_future()
+        batch["items"].append((message_text, sender_info, memory_text, item_memory_text))
+        batch["futures"].append(future)
+        batch["chars"] += size
+
+        if len(batch["items"]) >= self.max_size:
+            self._flush(memory_text)
+        return await future
+
+    def _flush(self, key):
+        batch = self._batches.pop(key, None)
+        if not batch:
+            return
+        batch["timer"].cancel()
+        task = asyncio.create_task(self._run(batch["items"], batch["futures"]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, items, futures):
+        try:
+            results = await self._analyze(items)
+            for future, result in zip(futures, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _analyze(self, items):
+        if len(items) == 1:
+            results = [None]
+        else:
+            try:
+                results = await self.agent.analyze_messages_batch(items)
+                self.batches_sent += 1
+                self.batched_messages += sum(1 for r in results if r is not None)
+            except Exception as e:
+                logger.error(f"Batch analysis of {len(items)} messages failed, falling back to single calls: {e}")
+                results = [None] * len(items)
+
+        missing = [i for i, r in enumerate(results) if r is None]
+        if len(items) > 1:
+            self.fallbacks += len(missing)
+        singles = await asyncio.gather(*(
+            self.agent.analyze_message(items[i][0], items[i][1], join_memory_text(items[i][2], items[i][3]), check_cache=False)
+            for i in missing
+        ))
+        for i, result in zip(missing, singles):
+            results[i] = result
+        return results
+
+    def get_stats(self):
+        return {
+            "batches_sent": self.batches_sent,
+            "batched_messages": self.batched_messages,
+            "fallbacks": self.fallbacks
+        }
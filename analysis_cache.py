@@ -0,0 +1,104 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+def normalize_text(text):
+    """Casefolds and collapses whitespace so trivially different copies share a key."""
+    return re.sub(r"\s+", " ", (text or "").casefold()).strip()
+
+def make_cache_key(context_text, sender, memory_text, prompt_version):
+    """Content address of an analysis: normalized context, sender, memory and prompt version."""
+    memory_hash = hashlib.sha256((memory_text or "").encode()).hexdigest()
+    material = "\x1f".join([normalize_text(context_text), sender or "", memory_hash, prompt_version or ""])
+    return hashlib.sha256(material.encode()).hexdigest()
+
+class AnalysisCache:
+    """
+    Persistent (SQLite) cache of LLM analysis results keyed by content hash.
+    Entries expire after ttl_seconds; beyond max_entries the least recently used are evicted.
+    """
+    def __init__(self, db_path="analysis_cache.db", ttl_seconds=72 * 3600, max_entries=5000):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_accessed ON analyses (accessed)")
+        self.conn.commit()
+        self._size = self.conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the cached result dict, or None on miss/expiry."""
+        row = self.conn.execute("SELECT result, created FROM analyses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row and now - row[1] <= self.ttl_seconds:
+            self.hits += 1
+            with self.conn:
+                self.conn.execute("UPDATE analyses SET accessed = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+        if row:
+            with self.conn:
+                self.conn.execute("DELETE FROM analyses WHERE key = ?", (key,))
+            self._size -= 1
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO analyses (key, result, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now)
+            )
+            if cursor.rowcount:
+                self._size += 1
+            else:
+                self.conn.execute("UPDATE analyses SET result = ?, created = ?, accessed = ? WHERE key = ?",
+                                  (json.dumps(result), now, now, key))
+
+        if self._size > self.max_entries:
+            self._evict(now)
+
+    def _evict(self, now):
+        """Drops expired entries, then the least recently used down to 90% of max_entries."""
+        with self.conn:
+            expired = self.conn.execute("DELETE FROM analyses WHERE created < ?", (now - self.ttl_seconds,)).rowcount
+            self._size -= expired
+            excess = self._size - int(self.max_entries * 0.9)
+            if excess > 0:
+                self.conn.execute(
+                    "DELETE FROM analyses WHERE key IN (SELECT key FROM analyses ORDER BY accessed LIMIT ?)",
+                    (excess,)
+                )
+                self._size -= excess
+        self.evictions += expired + max(excess, 0)
+        logger.info(f"Analysis cache evicted {expired + max(excess, 0)} entries.")
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "llm_calls_saved": self.hits,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None
+        }
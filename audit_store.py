@@ -0,0 +1,325 @@
+import bisect
+import gzip
+import json
+import logging
+import os
+import shutil
+import sqlite3
+
+from task_index import like_pattern, MAX_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+QUERY_DB_FILE = "entries.db"  # SQLite index of entry locations and filterable fields
+CHECKPOINT_EVERY = 64  # Entries between sparse index checkpoints
+
+class AuditStore:
+    """
+    Append-only JSONL audit log split into segments, rotated by date or size.
+    Closed segments can be gzip-compressed. A sparse index (every CHECKPOINT_EVERY entries:
+    timestamp, byte offset) lets "newest N" and "since T" reads skip straight to the right spot.
+    Filtered, paginated queries go through a SQLite index (entries.db) of each entry's segment,
+    offset and filterable fields; it is rebuilt from the segments if missing or behind.
+    """
+    def __init__(self, directory="audit_log", max_segment_bytes=5 * 1024 * 1024, compress=True, legacy_file="audit_log.json", read_only=False):
+        self.directory = directory
+        self.read_only = read_only  # For offline readers (e.g. triage training) next to a running agent
+        self.max_segment_bytes = max_segment_bytes
+        self.compress = compress
+        self.segments = []  # Oldest first: {"file", "date", "first_ts", "last_ts", "count", "size", "checkpoints": [[ts, offset], ...]}
+        self._fh = None
+        self.version = 0  # Bumped on every append (dashboard response cache key)
+        self.db = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+        if not read_only:
+            self._open_query_index()
+        if legacy_file and not read_only:
+            self._migrate_legacy(legacy_file)
+
+    # --- Index -----------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load_index(self):
+        try:
+            with open(self._path(INDEX_FILE), 'r') as f:
+                self.segments = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.segments = []
+
+        # Segments missing from the index (crash before it was saved) and the active segment,
+        # whose in-memory metadata is only persisted on rotation, are rebuilt by scanning.
+        indexed = {s["file"] for s in self.segments}
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith("audit-") and name not in indexed:
+                self.segments.append(self._scan_segment(name))
+        self.segments.sort(key=lambda s: s["file"])
+        if self.segments and not self.segments[-1]["file"].endswith(".gz"):
+            self.segments[-1] = self._scan_segment(self.segments[-1]["file"], repair=not self.read_only)
+
+    def _save_index(self):
+        tmp_path = self._path(INDEX_FILE + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self.segments, f)
+        os.replace(tmp_path, self._path(INDEX_FILE))
+
+    def _scan_segment(self, name, repair=False):
+        """Builds segment metadata by reading it; with repair, truncates a torn final line."""
+        meta = {"file": name, "date": name.split("-")[1], "first_ts": None, "last_ts": None, "count": 0, "size": 0, "checkpoints": []}
+        opener = gzip.open if name.endswith(".gz") else open
+        offset = 0
+        with opener(self._path(name), 'rb') as f:
+            for line in f:
+                try:
+                    ts = json.loads(line)["timestamp"]
+                except (ValueError, KeyError):
+                    break
+                self._track(meta, ts, offset)
+                offset += len(line)
+        meta["size"] = offset
+
+        if repair and os.path.getsize(self._path(name)) > offset:
+            logger.warning(f"Truncating torn audit entry at end of {name}.")
+            with open(self._path(name), 'r+b') as f:
+                f.truncate(offset)
+        return meta
+
+    def _track(self, meta, ts, offset):
+        if meta["count"] % CHECKPOINT_EVERY == 0:
+            meta["checkpoints"].append([ts, offset])
+        if meta["first_ts"] is None:
+            meta["first_ts"] = ts
+        meta["last_ts"] = ts
+        meta["count"] += 1
+
+    # --- Query index -----------------------------------------------------
+
+    @staticmethod
+    def _segment_key(name):
+        return name[:-3] if name.endswith(".gz") else name  # Stable across compression
+
+    def _open_query_index(self):
+        self.db = sqlite3.connect(self._path(QUERY_DB_FILE))
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY AUTOINCREMENT, segment TEXT NOT NULL, "
+            "offset INTEGER NOT NULL, ts TEXT NOT NULL, sender TEXT COLLATE NOCASE, priority INTEGER, text TEXT, "
+            "UNIQUE (segment, offset))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_ts ON entries (ts)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_sender ON entries (sender, id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_priority ON entries (priority, id)")
+        self.db.commit()
+
+        # Catch up with entries written before the index existed (or after a crash)
+        added = 0
+        for meta in self.segments:
+            key = self._segment_key(meta["file"])
+            with self.db:
+                self.db.execute("DELETE FROM entries WHERE segment = ? AND offset >= ?", (key, meta["size"]))  # Torn tail
+            count, last = self.db.execute("SELECT COUNT(*), MAX(offset) FROM entries WHERE segment = ?", (key,)).fetchone()
+            if count >= meta["count"]:
+                continue
+            opener = gzip.open if meta["file"].endswith(".gz") else open
+            rows, offset = [], 0
+            with opener(self._path(meta["file"]), 'rb') as f:
+                for line in f:
+                    if last is None or offset > last:
+                        try:
+                            rows.append(self._index_row(key, offset, json.loads(line)))
+                        except ValueError:
+                            pass
+                    offset += len(line)
+            with self.db:
+                self.db.executemany("INSERT OR IGNORE INTO entries (segment, offset, ts, sender, priority, text) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            added += len(rows)
+        if added:
+            logger.info(f"Indexed {added} audit entries for queries.")
+
+    @staticmethod
+    def _index_row(segment, offset, entry):
+        evaluation = entry.get("evaluation") or {}
+        text = " ".join(filter(None, [entry.get("text"), evaluation.get("summary")]))
+        return (segment, offset, entry.get("timestamp", ""), entry.get("sender") or "", evaluation.get("priority"), text)
+
+    # --- Writes ----------------------------------------------------------
+
+    def _active_segment(self, date):
+        """Returns the segment to append to, rotating on date change or size limit."""
+        active = self.segments[-1] if self.segments else None
+        if active and active["date"] == date and active["size"] < self.max_segment_bytes and not active["file"].endswith(".gz"):
+            return active
+
+        if active:
+            self._close_segment(active)
+
+        seq = sum(1 for s in self.segments if s["date"] == date)
+        meta = {"file": f"audit-{date}-{seq:04d}.jsonl", "date": date, "first_ts": None, "last_ts": None, "count": 0, "size": 0, "checkpoints": []}
+        self.segments.append(meta)
+        self._save_index()
+        return meta
+
+    def _close_segment(self, meta):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+        if self.compress and not meta["file"].endswith(".gz"):
+            source = self._path(meta["file"])
+            with open(source, 'rb') as src, gzip.open(source + ".gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(source)
+            meta["file"] += ".gz"
+        self._save_index()
+
+    def append(self, entry):
+        """Appends one entry (must carry an ISO 'timestamp')."""
+        ts = entry["timestamp"]
+        meta = self._active_segment(ts[:10].replace("-", ""))
+        if self._fh is None:
+            self._fh = open(self._path(meta["file"]), 'ab')
+
+        line = (json.dumps(entry) + "\n").encode()
+        self._fh.write(line)
+        self._fh.flush()
+        offset = meta["size"]
+        self._track(meta, ts, offset)
+        meta["size"] += len(line)
+        self.version += 1
+        if self.db:
+            with self.db:
+                self.db.execute("INSERT OR IGNORE INTO entries (segment, offset, ts, sender, priority, text) VALUES (?, ?, ?, ?, ?, ?)",
+                                self._index_row(self._segment_key(meta["file"]), offset, entry))
+
+    def _migrate_legacy(self, legacy_file):
+        """Imports a pre-existing audit_log.json (newest first) once."""
+        if self.segments or not os.path.exists(legacy_file):
+            return
+        try:
+            with open(legacy_file, 'r') as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Failed to read legacy audit log: {e}")
+            return
+        for entry in sorted(entries, key=lambda e: e.get("timestamp", "")):
+            if entry.get("timestamp"):
+                self.append(entry)
+        os.replace(legacy_file, legacy_file + ".migrated")
+        logger.info(f"Migrated {len(entries)} entries from {legacy_file}.")
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+        self._save_index()
+        if self.db:
+            self.db.close()
+            self.db = None
+
+    # --- Reads -----------------------------------------------------------
+
+    def _read_from(self, meta, offset):
+        """Yields parsed entries of a segment starting at an (uncompressed) byte offset."""
+        if meta is self.segments[-1] and self._fh:
+            self._fh.flush()
+        opener = gzip.open if meta["file"].endswith(".gz") else open
+        with opener(self._path(meta["file"]), 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def _tail(self, meta, n):
+        """Last n entries of a segment, oldest first."""
+        start = max(meta["count"] - n, 0)
+        checkpoint = start // CHECKPOINT_EVERY
+        entries = list(self._read_from(meta, meta["checkpoints"][checkpoint][1]))
+        return entries[start - checkpoint * CHECKPOINT_EVERY:]
+
+    def newest(self, limit=100):
+        """Returns up to `limit` entries, newest first."""
+        result = []
+        for meta in reversed(self.segments):
+            if len(result) >= limit:
+                break
+            if meta["count"]:
+                result.extend(reversed(self._tail(meta, limit - len(result))))
+        return result
+
+    def since(self, ts, limit=None):
+        """Returns entries with timestamp > ts, newest first (at most `limit`, keeping the newest)."""
+        result = []
+        for meta in self.segments:
+            if not meta["count"] or meta["last_ts"] <= ts:
+                continue
+            timestamps = [cp[0] for cp in meta["checkpoints"]]
+            checkpoint = max(bisect.bisect_right(timestamps, ts) - 1, 0)
+            result.extend(e for e in self._read_from(meta, meta["checkpoints"][checkpoint][1]) if e.get("timestamp", "") > ts)
+        result.reverse()
+        return result[:limit] if limit else result
+
+    def _read_at(self, locations):
+        """Entries at (segment key, offset) locations, in the given order (one pass per segment)."""
+        by_key = {self._segment_key(m["file"]): m for m in self.segments}
+        found = {}
+        for key in {k for k, _ in locations}:
+            meta = by_key.get(key)
+            if not meta:
+                continue
+            if meta is self.segments[-1] and self._fh:
+                self._fh.flush()
+            opener = gzip.open if meta["file"].endswith(".gz") else open
+            with opener(self._path(meta["file"]), 'rb') as f:
+                # Ascending seeks, so a gzip segment is decompressed at most once
+                for offset in sorted(o for k, o in locations if k == key):
+                    f.seek(offset)
+                    try:
+                        found[(key, offset)] = json.loads(f.readline())
+                    except ValueError:
+                        continue
+        return [found[loc] for loc in locations if loc in found]
+
+    def query(self, limit=100, cursor=None, since=None, until=None, sender=None, min_priority=None, max_priority=None, text=None):
+        """
+        One page of entries, newest first, matching the filters (text is a case-insensitive
+        "contains" over the message and its summary). Returns (entries, next cursor or None).
+        """
+        where, params = [], []
+        if cursor is not None:
+            where.append("id < ?"); params.append(int(cursor))
+        if since:
+            where.append("ts >= ?"); params.append(since)
+        if until:
+            where.append("ts < ?"); params.append(until)
+        if sender:
+            where.append("sender = ?"); params.append(sender)
+        if min_priority is not None:
+            where.append("priority >= ?"); params.append(min_priority)
+        if max_priority is not None:
+            where.append("priority <= ?"); params.append(max_priority)
+        if text:
+            where.append("text LIKE ? ESCAPE '\\'"); params.append(like_pattern(text))
+
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        sql = "SELECT id, segment, offset FROM entries" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id DESC LIMIT ?"
+        rows = self.db.execute(sql, params + [limit + 1]).fetchall()
+        next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+        return self._read_at([(segment, offset) for _, segment, offset in rows[:limit]]), next_cursor
+
+    def iter_newest(self):
+        """Yields every entry, newest first (segment by segment)."""
+        for meta in reversed(self.segments):
+            if meta["count"]:
+                yield from reversed(list(self._read_from(meta, 0)))
+
+    def get_stats(self):
+        return {
+            "segments": len(self.segments),
+            "entries": sum(s["count"] for s in self.segments),
+            "bytes": sum(s["size"] for s in self.segments),
+            "indexed": self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] if self.db else None
+        }
@@ -0,0 +1,58 @@
+"""
+Micro-benchmark: compiled RelevanceMatcher vs. the previous per-keyword `in` scan.
+Run from the repo root: python -m benchmarks.keyword_matcher
+"""
+import random
+import string
+import timeit
+
+from keyword_matcher import RelevanceMatcher
+
+GROUP_TRIGGER_KEYWORDS = ['everyone', 'all', 'channel', 'team', 'guys', '@everyone', '@all', '@channel']
+KEYWORDS = ['deploy', 'invoice', 'urgent', 'deadline', 'contract', 'Alice', 'Smith', 'alice_dev'] + [f"project{i}" for i in range(20)]
+
+def legacy_relevant(text, caption, is_group):
+    """The relevant_filter keyword logic as it was before the compiled matcher."""
+    if text:
+        lowered = text.lower()
+        if any(k.lower() in lowered for k in KEYWORDS):
+            return True
+        if is_group and any(k.lower() in lowered for k in GROUP_TRIGGER_KEYWORDS):
+            return True
+    if caption:
+        lowered = caption.lower()
+        if any(k.lower() in lowered for k in KEYWORDS):
+            return True
+        if is_group and any(k.lower() in lowered for k in GROUP_TRIGGER_KEYWORDS):
+            return True
+    return False
+
+def make_corpus(n=2000, seed=7):
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(500)]
+    corpus = []
+    for _ in range(n):
+        text = " ".join(rng.choices(words, k=rng.randint(3, 40)))
+        if rng.random() < 0.05:
+            text += " " + rng.choice(KEYWORDS + GROUP_TRIGGER_KEYWORDS)
+        corpus.append(text)
+    return corpus
+
+def main():
+    corpus = make_corpus()
+    matcher = RelevanceMatcher(KEYWORDS, GROUP_TRIGGER_KEYWORDS)
+
+    # Both implementations must agree in substring mode
+    assert all(legacy_relevant(t, None, True) == matcher.matches(t, True) for t in corpus)
+
+    runs = 20
+    legacy = timeit.timeit(lambda: [legacy_relevant(t, None, True) for t in corpus], number=runs)
+    compiled = timeit.timeit(lambda: [matcher.matches(t, True) for t in corpus], number=runs)
+    per_msg = lambda total: total / (runs * len(corpus)) * 1e6
+
+    print(f"messages: {len(corpus)}  keywords: {len(KEYWORDS)} + {len(GROUP_TRIGGER_KEYWORDS)} group triggers")
+    print(f"legacy any(k in text): {per_msg(legacy):.2f} us/msg")
+    print(f"compiled matcher:      {per_msg(compiled):.2f} us/msg  ({legacy / compiled:.1f}x)")
+
+if __name__ == "__main__":
+    main()
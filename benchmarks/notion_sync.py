@@ -0,0 +1,131 @@
+"""
+Benchmark: NotionSync.get_tasks (paginated database query, full and incremental) against a
+local stub of the Notion API, compared with the previous workspace-wide search.
+Run from the repo root: python -m benchmarks.notion_sync
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("NOTION_DATABASE_ID", "bench-db")
+os.environ.setdefault("NOTION_TOKEN", "bench-token")
+os.environ["LINK_INDEX_FILE"] = os.path.join(tempfile.mkdtemp(), "task_links.db")
+
+from notion_sync import NotionSync
+from utils import TokenBucket
+
+PAGE_SIZE = 100
+LATENCY_SECONDS = 0.002  # Simulated round trip per request
+UNRELATED_PAGES = 2000  # Other workspace pages returned by search
+
+def make_page(i, db_id, edited):
+    return {
+        "id": f"page-{i}",
+        "parent": {"database_id": db_id},
+        "last_edited_time": edited.strftime("%Y-%m-%dT%H:%M:00.000Z"),
+        "properties": {
+            "Name": {"title": [{"text": {"content": f"Task {i}"}}]},
+            "Status": {"status": {"name": random.choice(["Active", "Done", "Rejected"])}},
+            "Priority": {"number": random.randint(1, 5)},
+            "Sender": {"rich_text": [{"text": {"content": "bench"}}]},
+            "Link": {"url": f"https://t.me/c/1/{i}"},
+            "AgentComments": {"rich_text": []}
+        }
+    }
+
+def matches(page, condition):
+    if "and" in condition:
+        return all(matches(page, c) for c in condition["and"])
+    if condition.get("timestamp") == "last_edited_time":
+        return page["last_edited_time"] >= condition["last_edited_time"]["on_or_after"]
+    prop = page["properties"][condition["property"]]
+    if "status" in condition:
+        return prop["status"]["name"] == condition["status"]["equals"]
+    return prop["number"] >= condition["number"]["greater_than_or_equal_to"]
+
+class StubDatabases:
+    def __init__(self, stub):
+        self.stub = stub
+
+    async def query(self, database_id, filter=None, sorts=None, start_cursor=None, page_size=PAGE_SIZE):
+        self.stub.requests += 1
+        await asyncio.sleep(LATENCY_SECONDS)
+        key = repr(filter)
+        if key not in self.stub.results:  # Server-side work, done once per query rather than per page
+            pages = [p for p in self.stub.pages if not filter or matches(p, filter)]
+            self.stub.results[key] = sorted(pages, key=lambda p: p["last_edited_time"], reverse=True)
+        pages = self.stub.results[key]
+        start = int(start_cursor or 0)
+        chunk = pages[start:start + page_size]
+        more = start + page_size < len(pages)
+        return {"results": chunk, "has_more": more, "next_cursor": str(start + page_size) if more else None}
+
+class StubNotion:
+    """Just enough of AsyncClient: databases.query with cursors/filters, and search."""
+    def __init__(self, n, db_id):
+        now = datetime(2026, 1, 1)
+        self.pages = [make_page(i, db_id, now - timedelta(minutes=i)) for i in range(n)]
+        self.unrelated = [make_page(f"x{i}", "other-db", now - timedelta(minutes=i)) for i in range(UNRELATED_PAGES)]
+        self.databases = StubDatabases(self)
+        self.results = {}
+        self.requests = 0
+
+    async def search(self, filter=None, sort=None):
+        self.requests += 1
+        await asyncio.sleep(LATENCY_SECONDS)
+        everything = sorted(self.pages + self.unrelated, key=lambda p: p["last_edited_time"], reverse=True)
+        return {"results": everything[:PAGE_SIZE], "has_more": True}
+
+    def edit(self, count):
+        edited = datetime(2026, 1, 2).strftime("%Y-%m-%dT%H:%M:00.000Z")
+        for page in random.sample(self.pages, count):
+            page["last_edited_time"] = edited
+        self.results = {}
+
+async def legacy_get_tasks(sync):
+    """The previous implementation: first page of a workspace search, filtered in Python."""
+    response = await sync._get_client().search(filter={"value": "page", "property": "object"},
+                                               sort={"direction": "descending", "timestamp": "last_edited_time"})
+    target = sync.database_id.replace("-", "")
+    return [sync._page_to_task(p) for p in response["results"]
+            if p.get("parent", {}).get("database_id", "").replace("-", "") == target]
+
+async def timed(stub, coro):
+    stub.requests = 0
+    start = time.perf_counter()
+    tasks = await coro
+    return tasks, time.perf_counter() - start, stub.requests
+
+async def bench(n):
+    random.seed(n)
+    sync = NotionSync()
+    stub = StubNotion(n, sync.database_id)
+    sync.notion = stub
+    sync.rate_limiter = TokenBucket(10_000)  # Measure client cost, not Notion's 3 req/s limit
+
+    rows = []
+    tasks, seconds, requests = await timed(stub, legacy_get_tasks(sync))
+    rows.append(("legacy search", len(tasks), requests, seconds))
+    tasks, seconds, requests = await timed(stub, sync.get_tasks())
+    rows.append(("full query", len(tasks), requests, seconds))
+    watermark = max(t["last_edited_time"] for t in tasks)
+    tasks, seconds, requests = await timed(stub, sync.get_tasks(status="active", min_priority=4))
+    rows.append(("filtered (active, P>=4)", len(tasks), requests, seconds))
+    stub.edit(25)
+    tasks, seconds, requests = await timed(stub, sync.get_tasks(edited_since=watermark))
+    rows.append(("incremental (25 edits)", len(tasks), requests, seconds))
+
+    print(f"\n{n} tasks (+{UNRELATED_PAGES} unrelated workspace pages), {LATENCY_SECONDS * 1000:.0f} ms per request")
+    for name, count, requests, seconds in rows:
+        floor = requests / 3  # Seconds at Notion's 3 req/s
+        print(f"  {name:<26} {count:>6} tasks  {requests:>4} requests  {seconds * 1000:>8.1f} ms  (>= {floor:.1f}s at 3 req/s)")
+
+def main():
+    for n in (1_000, 10_000):
+        asyncio.run(bench(n))
+
+if __name__ == "__main__":
+    main()
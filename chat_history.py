@@ -0,0 +1,81 @@
+import logging
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+def format_history_line(msg):
+    """Formats a message as a single 'Sender: text' context line."""
+    sender_name = msg.chat.title or "Unknown"
+    if msg.from_user:
+        sender_name = msg.from_user.first_name
+    return f"{sender_name}: {msg.text or '[Media]'}"
+
+class ChatHistoryCache:
+    """
+    Bounded per-chat ring buffers of recent messages, fed from live updates.
+    Idle chats are evicted LRU once max_chats is exceeded.
+    """
+    def __init__(self, per_chat=10, max_chats=500):
+        self.per_chat = per_chat
+        self.max_chats = max_chats
+        self.chats = OrderedDict()  # chat_id -> {"warm": bool, "lines": deque of (msg_id, line)}
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_entry(self, chat_id):
+        entry = self.chats.get(chat_id)
+        if entry is None:
+            entry = {"warm": False, "lines": deque(maxlen=self.per_chat)}
+            self.chats[chat_id] = entry
+            if len(self.chats) > self.max_chats:
+                self.chats.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.chats.move_to_end(chat_id)
+        return entry
+
+    def record(self, message):
+        """Appends a live message to its chat's ring buffer."""
+        entry = self._get_entry(message.chat.id)
+        lines = entry["lines"]
+        if lines and lines[-1][0] >= message.id:
+            return  # Duplicate or out-of-order delivery
+        lines.append((message.id, format_history_line(message)))
+        # A full ring holds the same window get_chat_history would return
+        if len(lines) == self.per_chat:
+            entry["warm"] = True
+
+    def seed(self, chat_id, messages):
+        """Fills a cold chat from a get_chat_history result (oldest first)."""
+        entry = self._get_entry(chat_id)
+        merged = {msg.id: format_history_line(msg) for msg in messages}
+        merged.update(dict(entry["lines"]))
+        entry["lines"] = deque(sorted(merged.items()), maxlen=self.per_chat)
+        entry["warm"] = True
+
+    def get_recent(self, chat_id, limit=None, upto_id=None):
+        """
+        Returns the last `limit` context lines (oldest first), or None if the chat is cold.
+        upto_id excludes messages that arrived after the one being processed.
+        """
+        entry = self.chats.get(chat_id)
+        if entry is None or not entry["warm"]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.chats.move_to_end(chat_id)
+        lines = [line for msg_id, line in entry["lines"] if upto_id is None or msg_id <= upto_id]
+        return lines[-limit:] if limit else lines
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "chats": len(self.chats),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None
+        }
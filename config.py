@@ -11,6 +11,8 @@ SESSION_STRING = os.getenv("SESSION_STRING")  # For persistent sessions in conta
 # Keyword Filter Configuration
 KEYWORD_FILTER_STR = os.getenv("KEYWORD_FILTER", "")
 KEYWORD_FILTER = [k.strip() for k in KEYWORD_FILTER_STR.split(",") if k.strip()]
+# Match keywords as whole words only (e.g. "all" no longer matches "really")
+KEYWORD_MATCH_WHOLE_WORDS = os.getenv("KEYWORD_MATCH_WHOLE_WORDS", "false").lower() == "true"
 
 # Auto-Reply Toggle
 ENABLE_AUTO_REPLY = os.getenv("ENABLE_AUTO_REPLY", "true").lower() == "true"
@@ -21,6 +23,12 @@ WORKING_HOURS_END = int(os.getenv("WORKING_HOURS_END", "18"))
 # Long-term Memory Config
 ENABLE_LONG_TERM_MEMORY = os.getenv("ENABLE_LONG_TERM_MEMORY", "true").lower() == "true"
 MEMORY_FILE_PATH = os.getenv("MEMORY_FILE_PATH", "memory.json")
+# Only the most relevant facts (BM25 against the chat context) are injected into each prompt
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "8"))
+MEMORY_MAX_CHARS = int(os.getenv("MEMORY_MAX_CHARS", "1500"))
+# Near-duplicate facts (word-bigram similarity >= this, 0 disables) are rejected, or merged keeping the longer wording
+MEMORY_DEDUP_THRESHOLD = float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.85"))
+MEMORY_DEDUP_MODE = os.getenv("MEMORY_DEDUP_MODE", "reject")
 
 # Group Trigger Keywords (Implicit Mentions)
 GROUP_TRIGGER_KEYWORDS = [
@@ -33,3 +41,83 @@ GROUP_TRIGGER_KEYWORDS = [
     '@all', 
     '@channel'
 ]
+
+# Local Task Mirror (serves reads without a Notion round-trip)
+TASK_MIRROR_FILE = os.getenv("TASK_MIRROR_FILE", "tasks.json")
+TASK_MIRROR_REFRESH_SECONDS = int(os.getenv("TASK_MIRROR_REFRESH_SECONDS", "300"))
+# Refreshes are incremental (pages edited since the last sync); a full sync also catches deletions
+TASK_MIRROR_FULL_SYNC_SECONDS = int(os.getenv("TASK_MIRROR_FULL_SYNC_SECONDS", "3600"))
+# Changes are written to TASK_MIRROR_FILE at most once per this window (0 writes on every change)
+TASK_MIRROR_SAVE_DELAY_MS = int(os.getenv("TASK_MIRROR_SAVE_DELAY_MS", "1000"))
+
+# Local Link Index (message link -> Notion page id, for deduplication)
+LINK_INDEX_FILE = os.getenv("LINK_INDEX_FILE", "task_links.db")
+
+# Per-chat Message History Cache (context for analysis)
+CHAT_HISTORY_SIZE = int(os.getenv("CHAT_HISTORY_SIZE", "10"))
+CHAT_HISTORY_MAX_CHATS = int(os.getenv("CHAT_HISTORY_MAX_CHATS", "500"))
+
+# Message Processing Pipeline
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+PIPELINE_MAX_PENDING = int(os.getenv("PIPELINE_MAX_PENDING", "100"))
+
+# Micro-batched LLM Analysis (0 window = one request per message)
+ANALYSIS_BATCH_WINDOW_MS = int(os.getenv("ANALYSIS_BATCH_WINDOW_MS", "250"))
+ANALYSIS_BATCH_MAX_SIZE = int(os.getenv("ANALYSIS_BATCH_MAX_SIZE", "8"))
+ANALYSIS_BATCH_MAX_CHARS = int(os.getenv("ANALYSIS_BATCH_MAX_CHARS", "24000"))
+
+# Analysis Result Cache (0 TTL = disabled)
+ANALYSIS_CACHE_FILE = os.getenv("ANALYSIS_CACHE_FILE", "analysis_cache.db")
+ANALYSIS_CACHE_TTL_HOURS = int(os.getenv("ANALYSIS_CACHE_TTL_HOURS", "72"))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+
+# Local Pre-LLM Triage (train with: python triage.py train)
+TRIAGE_ENABLED = os.getenv("TRIAGE_ENABLED", "true").lower() == "true"
+TRIAGE_MODEL_PATH = os.getenv("TRIAGE_MODEL_PATH", "triage_model.json")
+TRIAGE_THRESHOLD = float(os.getenv("TRIAGE_THRESHOLD", "0.97"))
+# Shadow mode scores every message and tracks agreement with the LLM, but never skips the LLM
+TRIAGE_SHADOW_MODE = os.getenv("TRIAGE_SHADOW_MODE", "true").lower() == "true"
+
+# Audit Log (append-only JSONL segments)
+AUDIT_LOG_DIR = os.getenv("AUDIT_LOG_DIR", "audit_log")
+AUDIT_SEGMENT_MAX_BYTES = int(os.getenv("AUDIT_SEGMENT_MAX_BYTES", str(5 * 1024 * 1024)))
+AUDIT_COMPRESS_SEGMENTS = os.getenv("AUDIT_COMPRESS_SEGMENTS", "true").lower() == "true"
+
+# Discussion Buffer group commit window (0 = append each point immediately)
+DISCUSSION_GROUP_COMMIT_MS = int(os.getenv("DISCUSSION_GROUP_COMMIT_MS", "0"))
+# Rolling per-chat summaries: refresh after this many new points, or once a chat is idle
+DISCUSSION_ROLLING_POINTS = int(os.getenv("DISCUSSION_ROLLING_POINTS", "20"))
+DISCUSSION_ROLLING_IDLE_SECONDS = int(os.getenv("DISCUSSION_ROLLING_IDLE_SECONDS", "300"))
+
+# Group digest map-reduce (buffers over DIGEST_CHUNK_CHARS are condensed per chat first)
+DIGEST_CHUNK_CHARS = int(os.getenv("DIGEST_CHUNK_CHARS", "12000"))
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "4"))
+
+# Scheduler (daily briefing cron, learning interval)
+SCHEDULER_STATE_FILE = os.getenv("SCHEDULER_STATE_FILE", "scheduler_state.json")
+BRIEFING_CRON = os.getenv("BRIEFING_CRON", "0 9 * * *")
+LEARNING_INTERVAL_HOURS = float(os.getenv("LEARNING_INTERVAL_HOURS", "6"))
+SCHEDULER_CATCH_UP = os.getenv("SCHEDULER_CATCH_UP", "once")  # once | skip
+SCHEDULER_JITTER_SECONDS = int(os.getenv("SCHEDULER_JITTER_SECONDS", "30"))
+
+# Notion write outbox (durable, coalescing) and shared request rate limit
+NOTION_OUTBOX_FILE = os.getenv("NOTION_OUTBOX_FILE", "notion_outbox.db")
+NOTION_RATE_LIMIT = float(os.getenv("NOTION_RATE_LIMIT", "3"))  # Requests per second
+# How long cached AgentComments text is trusted before comment writes re-read the page
+NOTION_COMMENT_CACHE_SECONDS = int(os.getenv("NOTION_COMMENT_CACHE_SECONDS", "120"))
+
+# Shared HTTP connection pool (one keep-alive pool for every httpx-based backend)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"  # Needs the h2 package
+# Per-backend request timeouts
+NOTION_TIMEOUT_SECONDS = float(os.getenv("NOTION_TIMEOUT_SECONDS", "30"))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+
+# Dashboard API response cache: JSON bodies at least this large are also served gzipped
+RESPONSE_GZIP_MIN_BYTES = int(os.getenv("RESPONSE_GZIP_MIN_BYTES", "1024"))
+
+# Dashboard live events (SSE): events kept for reconnecting clients, keep-alive interval
+EVENT_REPLAY_SIZE = int(os.getenv("EVENT_REPLAY_SIZE", "500"))
+SSE_HEARTBEAT_SECONDS = int(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
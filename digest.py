@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+
+from config import DIGEST_CHUNK_CHARS, DIGEST_CONCURRENCY, DISCUSSION_ROLLING_IDLE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DIGEST_HEADER = "Here are today's discussion points, grouped by chat:\n\n"
+
+class DiscussionDigester:
+    """
+    Builds the group digest from running per-chat summaries. A background loop folds new
+    points into each chat's summary once it has DISCUSSION_ROLLING_POINTS of them or goes idle,
+    so a digest only merges those summaries plus a small unsummarized tail. The result is
+    cached by buffer version.
+
+    If the merged text is still over chunk_chars, chats with a tail are caught up first (map,
+    concurrent under a semaphore, chunked per chunk_chars within a chat), then chat sections
+    are condensed in groups level by level (reduce) until one final call fits.
+    """
+    def __init__(self, agent, buffer, chunk_chars=DIGEST_CHUNK_CHARS, concurrency=DIGEST_CONCURRENCY):
+        self.agent = agent
+        self.buffer = buffer
+        self.chunk_chars = chunk_chars
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._chat_locks = {}
+        self._cached_version = None
+        self._cached_text = None
+
+        self.last_stats = {}
+        self.cache_hits = 0
+        self.rolling_updates = 0
+        self.rolling_tokens = 0
+
+    # --- Rolling summaries -----------------------------------------------
+
+    async def run_rolling_updates(self, idle_seconds=DISCUSSION_ROLLING_IDLE_SECONDS):
+        """Background loop keeping per-chat summaries current."""
+        logger.info("Rolling discussion summaries started.")
+        while True:
+            await self.buffer.wait_rolling_due(idle_seconds)
+            chats = self.buffer.due_chats(idle_seconds)
+            if not chats:
+                continue
+            try:
+                stats = {"tokens": 0}
+                await self._update_chats(chats, stats)
+                self.rolling_tokens += stats["tokens"]
+            except Exception as e:
+                logger.error(f"Rolling summary update failed: {e}")
+
+    async def _update_chats(self, chats, stats):
+        await asyncio.gather(*(self._update_chat(chat, stats) for chat in chats))
+
+    async def _update_chat(self, chat, stats):
+        """Folds a chat's unsummarized points into its running summary."""
+        lock = self._chat_locks.setdefault(chat, asyncio.Lock())
+        async with lock:
+            generation = self.buffer.generation
+            count, chunks = self.buffer.get_tail(chat, self.chunk_chars)
+            if not chunks:
+                return
+
+            if len(chunks) > 1:
+                # Condense oversized tails chunk by chunk before folding them in
+                parts = await asyncio.gather(*(self._condense(chat, chunk, stats) for chunk in chunks))
+                if None in parts:
+                    return
+                points_text = "\n".join(parts)
+            else:
+                points_text = chunks[0]
+
+            async with self.semaphore:
+                summary, tokens = await self.agent.summarize_chat_points(chat, points_text, self.buffer.get_rolling_summary(chat))
+            stats["tokens"] += tokens
+            if summary:
+                self.buffer.set_rolling_summary(chat, summary.strip(), count, generation)
+                self.rolling_updates += 1
+
+    async def _condense(self, name, text, stats):
+        async with self.semaphore:
+            summary, tokens = await self.agent.summarize_chat_points(name, text)
+        stats["tokens"] += tokens
+        return summary.strip() if summary else None
+
+    # --- Digest ----------------------------------------------------------
+
+    def _sections(self):
+        """[(chat, text)]: running summary plus unsummarized tail for every chat."""
+        sections = []
+        for chat in self.buffer.get_chats():
+            summary = self.buffer.get_rolling_summary(chat)
+            _, chunks = self.buffer.get_tail(chat, self.chunk_chars)
+            parts = []
+            if summary:
+                parts.append("Summary so far:\n" + summary)
+            if chunks:
+                parts.append(("New points:\n" if summary else "") + "\n".join(chunks))
+            if parts:
+                sections.append((chat, "\n".join(parts)))
+        return sections
+
+    def _compose(self, sections):
+        return "\n\n".join(f"### {chat}\n{text}" for chat, text in sections)
+
+    async def build(self):
+        """Returns the digest text, or "" when the buffer is empty."""
+        version = self.buffer.version
+        if version == self._cached_version:
+            self.cache_hits += 1
+            return self._cached_text
+        if not self.buffer.buffer:
+            return ""
+
+        start = time.perf_counter()
+        stats = {"cached_chats": 0, "caught_up_chats": 0, "levels": 0, "map_seconds": 0.0, "reduce_seconds": 0.0, "tokens": 0}
+        stats["cached_chats"] = sum(1 for chat in self.buffer.get_chats() if self.buffer.get_rolling_summary(chat))
+
+        sections = self._sections()
+        if len(self._compose(sections)) > self.chunk_chars:
+            map_start = time.perf_counter()
+            behind = [chat for chat in self.buffer.get_chats() if self.buffer.pending_count(chat)]
+            stats["caught_up_chats"] = len(behind)
+            await self._update_chats(behind, stats)
+            sections = self._sections()
+            stats["map_seconds"] = time.perf_counter() - map_start
+
+        reduce_start = time.perf_counter()
+        text = await self._reduce(sections, stats)
+        stats["reduce_seconds"] = time.perf_counter() - reduce_start
+
+        stats["total_seconds"] = time.perf_counter() - start
+        self.last_stats = {k: round(v, 3) if isinstance(v, float) else v for k, v in stats.items()}
+        logger.info(f"Digest built: {self.last_stats}")
+
+        # Only cache a good digest of a buffer that didn't change meanwhile
+        if text != "Failed to generate summary." and self.buffer.version == version:
+            self._cached_version, self._cached_text = version, text
+        return text
+
+    async def _reduce(self, sections, stats):
+        """Condenses groups of chat sections until they fit one final summarization call."""
+        while len(sections) > 1 and len(self._compose(sections)) > self.chunk_chars:
+            groups, current, size = [], [], 0
+            for chat, text in sections:
+                if current and size + len(text) > self.chunk_chars:
+                    groups.append(current)
+                    current, size = [], 0
+                current.append((chat, text))
+                size += len(text)
+            groups.append(current)
+            if len(groups) == len(sections):
+                break  # Every chat alone is over budget; nothing left to merge
+
+            stats["levels"] += 1
+            names = [", ".join(chat for chat, _ in group) for group in groups]
+            condensed = await asyncio.gather(*(self._condense(name, self._compose(group), stats) for name, group in zip(names, groups)))
+            # A failed group keeps its (trimmed) input so it doesn't vanish from the digest
+            sections = [(name, summary or self._compose(group)[:self.chunk_chars // len(groups)])
+                        for name, group, summary in zip(names, groups, condensed)]
+
+        stats["levels"] += 1
+        summary, tokens = await self.agent.summarize_discussions(DIGEST_HEADER + self._compose(sections), with_usage=True)
+        stats["tokens"] += tokens
+        return summary
+
+    def get_stats(self):
+        return {
+            "last_build": dict(self.last_stats),
+            "cache_hits": self.cache_hits,
+            "rolling_updates": self.rolling_updates,
+            "rolling_tokens": self.rolling_tokens
+        }
@@ -1,20 +1,47 @@
+import asyncio
 import json
 import os
 from datetime import datetime
 import logging
+import time
+from config import DISCUSSION_GROUP_COMMIT_MS, DISCUSSION_ROLLING_POINTS
+from event_bus import event_bus
 
 logger = logging.getLogger(__name__)
 
-ACTIVE_BUFFER_FILE = "discussions.json"
+ACTIVE_BUFFER_FILE = "discussions.json"  # Snapshot
+ACTIVE_LOG_FILE = "discussions.log"  # Points appended since the snapshot, one JSON per line
 HISTORY_FILE = "daily_history.json"
+ROLLING_FILE = "discussion_summaries.json"  # Running per-chat summaries of the active buffer
 
 class DiscussionBuffer:
-    def __init__(self):
+    def __init__(self, group_commit_ms=DISCUSSION_GROUP_COMMIT_MS, rolling_points=DISCUSSION_ROLLING_POINTS):
+        self.group_commit = group_commit_ms / 1000
+        self._log = None
+        self._pending_lines = []
+        self._flush_handle = None
+
+        # Rolling per-chat summaries: version bumps on every change (digest cache key),
+        # generation bumps on clear so in-flight summary updates of a cleared buffer are dropped
+        self.rolling_points = rolling_points
+        self.version = 0
+        self.generation = 0
+        self._rolling_due = None  # asyncio.Event, created on first use inside the loop
+        self._last_point_at = {}  # chat -> monotonic time of its newest point
+        self.history_version = 0  # Bumped when a daily summary is archived
+
+        # Recover: snapshot + replay of the append log, then fold both into a fresh snapshot
         self.buffer = self._load_buffer()
+        replayed = self._replay_log()
+        if replayed:
+            logger.info(f"Recovered {replayed} discussion points from {ACTIVE_LOG_FILE}.")
+        self._compact()
+        self._index_chats()
+        self.rolling = self._load_rolling()
         self._ensure_history_file()
 
     def _load_buffer(self):
-        """Loads active buffer from disk."""
+        """Loads the buffer snapshot from disk."""
         if os.path.exists(ACTIVE_BUFFER_FILE):
             try:
                 with open(ACTIVE_BUFFER_FILE, "r") as f:
@@ -23,10 +50,67 @@ class DiscussionBuffer:
                 return []
         return []
 
-    def _save_buffer(self):
-        """Saves active buffer to disk."""
-        with open(ACTIVE_BUFFER_FILE, "w") as f:
+    def _replay_log(self):
+        """Appends points logged after the last snapshot. A torn final line is ignored."""
+        if not os.path.exists(ACTIVE_LOG_FILE):
+            return 0
+        count = 0
+        with open(ACTIVE_LOG_FILE, "r") as f:
+            for line in f:
+                try:
+                    self.buffer.append(json.loads(line))
+                    count += 1
+                except json.JSONDecodeError:
+                    logger.warning("Skipping torn discussion log entry.")
+        return count
+
+    def _compact(self):
+        """Writes the whole buffer as a snapshot and starts an empty log."""
+        self._discard_pending()
+        if self._log:
+            self._log.close()
+            self._log = None
+
+        tmp_file = ACTIVE_BUFFER_FILE + ".tmp"
+        with open(tmp_file, "w") as f:
             json.dump(self.buffer, f, indent=2)
+        os.replace(tmp_file, ACTIVE_BUFFER_FILE)
+        # Only truncate the log once the snapshot containing its points is in place
+        open(ACTIVE_LOG_FILE, "w").close()
+
+    def _append_lines(self, lines):
+        if self._log is None:
+            self._log = open(ACTIVE_LOG_FILE, "a")
+        self._log.write("".join(lines))
+        self._log.flush()
+
+    def _flush_pending(self):
+        """Group commit: writes all points buffered during the commit window at once."""
+        self._flush_handle = None
+        if self._pending_lines:
+            lines, self._pending_lines = self._pending_lines, []
+            self._append_lines(lines)
+
+    def _discard_pending(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._pending_lines = []
+
+    def _running_loop(self):
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+    def close(self):
+        """Flushes pending points (call on shutdown)."""
+        if self._flush_handle:
+            self._flush_handle.cancel()
+        self._flush_pending()
+        if self._log:
+            self._log.close()
+            self._log = None
 
     def _ensure_history_file(self):
         """Ensures history file exists."""
@@ -43,7 +127,21 @@ class DiscussionBuffer:
             "summary": summary
         }
         self.buffer.append(point)
-        self._save_buffer()
+        self._by_chat.setdefault(chat_name, []).append(point)
+        self._last_point_at[chat_name] = time.monotonic()
+        self.version += 1
+        if self.pending_count(chat_name) >= self.rolling_points:
+            self._wake_rolling()
+
+        # Write-ahead: one appended line per point (grouped per commit window if enabled)
+        line = json.dumps(point) + "\n"
+        loop = self._running_loop() if self.group_commit > 0 else None
+        if loop:
+            self._pending_lines.append(line)
+            if not self._flush_handle:
+                self._flush_handle = loop.call_later(self.group_commit, self._flush_pending)
+        else:
+            self._append_lines([line])
         logger.info(f"Buffered discussion point from {sender} in {chat_name}")
 
     def get_all(self):
@@ -67,10 +165,103 @@ class DiscussionBuffer:
             
         return text
 
+    # --- Rolling per-chat summaries ------------------------------------
+
+    def _index_chats(self):
+        self._by_chat = {}
+        for p in self.buffer:
+            self._by_chat.setdefault(p['chat'], []).append(p)
+
+    def _load_rolling(self):
+        """Loads running summaries, dropping any that cover more points than the buffer holds."""
+        try:
+            with open(ROLLING_FILE, "r") as f:
+                rolling = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return {chat: r for chat, r in rolling.items() if r["count"] <= len(self._by_chat.get(chat, []))}
+
+    def _save_rolling(self):
+        tmp_file = ROLLING_FILE + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.rolling, f, indent=2)
+        os.replace(tmp_file, ROLLING_FILE)
+
+    def _wake_rolling(self):
+        if self._rolling_due is None and self._running_loop():
+            self._rolling_due = asyncio.Event()
+        if self._rolling_due:
+            self._rolling_due.set()
+
+    async def wait_rolling_due(self, timeout):
+        """Waits until a chat reaches rolling_points new points, or timeout seconds."""
+        if self._rolling_due is None:
+            self._rolling_due = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._rolling_due.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._rolling_due.clear()
+
+    def pending_count(self, chat):
+        """Points of a chat not yet folded into its running summary."""
+        covered = self.rolling.get(chat, {}).get("count", 0)
+        return len(self._by_chat.get(chat, [])) - covered
+
+    def due_chats(self, idle_seconds):
+        """Chats with rolling_points new points, or any new points and idle for idle_seconds."""
+        now = time.monotonic()
+        due = []
+        for chat in self._by_chat:
+            pending = self.pending_count(chat)
+            idle = now - self._last_point_at.get(chat, 0) >= idle_seconds
+            if pending >= self.rolling_points or (pending and idle):
+                due.append(chat)
+        return due
+
+    def get_tail(self, chat, max_chars):
+        """
+        Returns (point count, chunks) for a chat's unsummarized points, each chunk at most
+        max_chars (a single oversized point becomes its own chunk). Pass the count back to
+        set_rolling_summary once the chunks are folded in.
+        """
+        points = self._by_chat.get(chat, [])
+        covered = self.rolling.get(chat, {}).get("count", 0)
+        chunks, current, size = [], [], 0
+        for p in points[covered:]:
+            line = f"- [{p['sender']}]: {p['summary']}"
+            if current and size + len(line) + 1 > max_chars:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            current.append(line)
+            size += len(line) + 1
+        if current:
+            chunks.append("\n".join(current))
+        return len(points), chunks
+
+    def get_rolling_summary(self, chat):
+        return self.rolling.get(chat, {}).get("summary")
+
+    def set_rolling_summary(self, chat, summary, count, generation):
+        """Stores a chat's running summary covering its first `count` points."""
+        if generation != self.generation:
+            return  # Buffer was cleared while the summary was being generated
+        self.rolling[chat] = {"summary": summary, "count": count}
+        self._save_rolling()
+
+    def get_chats(self):
+        return list(self._by_chat)
+
     def clear(self):
         """Clears the active buffer."""
         self.buffer = []
-        self._save_buffer()
+        self._compact()
+        self._index_chats()
+        self._last_point_at = {}
+        self.rolling = {}
+        self._save_rolling()
+        self.version += 1
+        self.generation += 1
 
     def archive_daily_summary(self, summary_text):
         """Archives the generated summary to history."""
@@ -91,6 +282,8 @@ class DiscussionBuffer:
         
         with open(HISTORY_FILE, "w") as f:
             json.dump(history, f, indent=2)
+        self.history_version += 1
+        event_bus.publish("digest.archive", entry)
             
         logger.info("Archived daily discussion summary.")
 
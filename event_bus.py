@@ -0,0 +1,108 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+
+from config import EVENT_REPLAY_SIZE
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 256  # Events a slow client may fall behind before it is told to resync
+
+class Subscription:
+    """One live consumer (a dashboard SSE connection). Iterate with `await sub.get()`."""
+    def __init__(self, bus):
+        self.bus = bus
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def _offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout=None):
+        """Next event, a synthetic "resync" event after an overflow, or None on timeout."""
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return self.bus.resync_event()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus.subscribers.discard(self)
+
+class EventBus:
+    """
+    In-process publish/subscribe for dashboard deltas. Publishing never blocks: each subscriber
+    has a bounded queue, and one that overflows gets a "resync" (refetch everything) instead of
+    stalling the publisher. The last EVENT_REPLAY_SIZE events are kept so a reconnecting client
+    can resume from its Last-Event-ID.
+
+    Event types: task.upsert (task), task.remove ({id}), task.rename ({old_id, new_id}),
+    tasks.reset, audit.append (entry), digest.archive (entry), notice ({text, level}), resync.
+    """
+    def __init__(self, replay_size=EVENT_REPLAY_SIZE):
+        self.subscribers = set()
+        self.recent = deque(maxlen=replay_size)
+        # Ids start at the clock so ones from before a restart are always older
+        self.next_id = int(time.time() * 1000)
+
+        # Counters
+        self.published = {}  # type -> count
+        self.overflows = 0
+
+    def publish(self, event_type, data=None):
+        event = {"id": self.next_id, "type": event_type, "data": data}
+        self.next_id += 1
+        self.recent.append(event)
+        self.published[event_type] = self.published.get(event_type, 0) + 1
+        for sub in list(self.subscribers):
+            was_overflowed = sub.overflowed
+            sub._offer(event)
+            if sub.overflowed and not was_overflowed:
+                self.overflows += 1
+                logger.warning("Event subscriber fell behind; it will be told to resync.")
+        return event
+
+    def subscribe(self, last_event_id=None):
+        """
+        Registers a subscriber. With last_event_id, events it missed are queued first (or a
+        resync if they are no longer buffered).
+        """
+        sub = Subscription(self)
+        if last_event_id is not None:
+            oldest = self.recent[0]["id"] if self.recent else self.next_id
+            if oldest > last_event_id + 1:
+                sub.overflowed = True  # The gap is older than the replay buffer (or this process)
+            else:
+                for event in self.recent:
+                    if event["id"] > last_event_id:
+                        sub._offer(event)
+        self.subscribers.add(sub)
+        return sub
+
+    def resync_event(self):
+        # Carries the latest id so the client resumes from here after refetching
+        return {"id": self.next_id - 1, "type": "resync", "data": None}
+
+    @staticmethod
+    def format_sse(event):
+        return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+    def get_stats(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "overflows": self.overflows,
+            "last_id": self.next_id - 1
+        }
+
+# Shared by TaskManager, DiscussionBuffer, the listener and the /api/events endpoint
+event_bus = EventBus()
@@ -0,0 +1,128 @@
+import importlib.util
+import logging
+import time
+
+import httpx
+
+from config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_SECONDS, HTTP2_ENABLED
+
+logger = logging.getLogger(__name__)
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps the shared connection pool to count requests in flight (saturation) and to time
+    new TCP connects and TLS handshakes through httpcore's trace extension.
+    """
+    def __init__(self, transport, max_connections):
+        self.transport = transport
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated_requests = 0
+        self.requests = 0
+        self.connects = 0
+        self.connect_seconds = 0.0
+        self.tls_handshakes = 0
+        self.tls_seconds = 0.0
+
+    def _tracer(self):
+        """Trace callback for one request; start times live in it, so concurrent connects don't mix."""
+        started = {}
+
+        async def trace(event, info):
+            self._record(started, event)
+        return trace
+
+    def _record(self, started, event):
+        kind, _, phase = event.rpartition(".")
+        if kind in ("connection.connect_tcp", "connection.start_tls"):
+            if phase == "started":
+                started[kind] = time.perf_counter()
+            elif phase == "complete" and kind in started:
+                elapsed = time.perf_counter() - started.pop(kind)
+                if kind == "connection.connect_tcp":
+                    self.connects += 1
+                    self.connect_seconds += elapsed
+                else:
+                    self.tls_handshakes += 1
+                    self.tls_seconds += elapsed
+
+    async def handle_async_request(self, request):
+        self.requests += 1
+        if self.in_flight >= self.max_connections:
+            self.saturated_requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        request.extensions.setdefault("trace", self._tracer())
+        try:
+            return await self.transport.handle_async_request(request)
+        finally:
+            self.in_flight -= 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+class HttpPool:
+    """
+    One keep-alive connection pool shared by every HTTP backend. Each backend gets its own
+    httpx.AsyncClient (SDKs such as notion-client rewrite base_url/headers on the client they
+    are given) over the same transport, with its own timeout.
+    """
+    def __init__(self, max_connections=HTTP_MAX_CONNECTIONS, max_keepalive=HTTP_MAX_KEEPALIVE,
+                 keepalive_seconds=HTTP_KEEPALIVE_SECONDS, http2=HTTP2_ENABLED):
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP2_ENABLED is set but the h2 package is not installed; using HTTP/1.1.")
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_seconds)
+        self.transport = None
+        self.clients = {}
+        self.warmups = {}  # url -> {"seconds", "status" or "error"}
+
+    def client(self, name, timeout):
+        """Returns the (cached) client for a backend, creating the shared transport on first use."""
+        if self.transport is None:
+            self.transport = InstrumentedTransport(httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2),
+                                                   self.limits.max_connections)
+        if name not in self.clients:
+            self.clients[name] = httpx.AsyncClient(transport=self.transport, timeout=timeout)
+        return self.clients[name]
+
+    async def warm(self, name, url, timeout):
+        """Opens (and keeps alive) a connection to url with a cheap HEAD request."""
+        start = time.perf_counter()
+        try:
+            response = await self.client(name, timeout).head(url)
+            self.warmups[url] = {"seconds": round(time.perf_counter() - start, 3), "status": response.status_code}
+        except httpx.HTTPError as e:
+            self.warmups[url] = {"seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+            logger.warning(f"Failed to pre-warm {url}: {e}")
+
+    async def close(self):
+        if self.transport:
+            await self.transport.aclose()  # Closing clients would close the shared transport once per client
+            self.transport = None
+            self.clients = {}
+
+    def get_stats(self):
+        t = self.transport
+        if t is None:
+            return {"started": False}
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "in_flight": t.in_flight,
+            "peak_in_flight": t.peak_in_flight,
+            "peak_utilization": round(min(t.peak_in_flight / self.limits.max_connections, 1.0), 3),
+            "saturated_requests": t.saturated_requests,  # Had to wait for a free connection
+            "requests": t.requests,
+            "new_connections": t.connects,
+            "connection_reuse_ratio": round(1 - t.connects / t.requests, 3) if t.requests else None,
+            "avg_connect_ms": round(t.connect_seconds / t.connects * 1000, 1) if t.connects else None,
+            "avg_tls_ms": round(t.tls_seconds / t.tls_handshakes * 1000, 1) if t.tls_handshakes else None,
+            "warmups": self.warmups
+        }
+
+# Shared by NotionSync and any future HTTP backend
+http_pool = HttpPool()
@@ -0,0 +1,77 @@
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _trie_to_pattern(node):
+    """Emits a regex for a prefix trie so shared prefixes are only matched once."""
+    alternatives = []
+    is_optional = False
+    for char in sorted(node):
+        if char == "":
+            is_optional = True
+            continue
+        alternatives.append(re.escape(char) + _trie_to_pattern(node[char]))
+
+    if not alternatives:
+        return ""
+    if len(alternatives) == 1 and not is_optional:
+        return alternatives[0]
+    return "(?:" + "|".join(alternatives) + ")" + ("?" if is_optional else "")
+
+class KeywordMatcher:
+    """
+    Matches a text against many keywords in one pass.
+    Keywords are casefolded, merged into a prefix trie (Aho-Corasick style) and compiled
+    into a single regex, so the scan runs inside the C regex engine rather than in Python.
+    """
+    def __init__(self, keywords, whole_words=False):
+        self.keywords = sorted({k.strip().casefold() for k in keywords if k and k.strip()})
+        self.whole_words = whole_words
+        self._regex = self._compile()
+
+    def _compile(self):
+        if not self.keywords:
+            return None
+
+        trie = {}
+        for keyword in self.keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = {}
+
+        pattern = _trie_to_pattern(trie)
+        if self.whole_words:
+            # Lookarounds instead of \b so keywords like "@all" still get a boundary check
+            pattern = r"(?<!\w)(?:" + pattern + r")(?!\w)"
+        return re.compile(pattern)
+
+    def search_folded(self, folded_text):
+        """Matches an already casefolded text."""
+        return self._regex is not None and self._regex.search(folded_text) is not None
+
+    def search(self, text):
+        return bool(text) and self.search_folded(text.casefold())
+
+class RelevanceMatcher:
+    """
+    Holds the compiled matchers for general keywords (any chat) and group trigger words (groups only).
+    rebuild() compiles new matchers first and swaps them in with a single assignment.
+    """
+    def __init__(self, keywords=(), group_keywords=(), whole_words=False):
+        self.whole_words = whole_words
+        self._compiled = (KeywordMatcher(keywords, whole_words), KeywordMatcher(group_keywords, whole_words))
+
+    def rebuild(self, keywords, group_keywords):
+        compiled = (KeywordMatcher(keywords, self.whole_words), KeywordMatcher(group_keywords, self.whole_words))
+        self._compiled = compiled
+        logger.info(f"Keyword matcher rebuilt ({len(compiled[0].keywords)} keywords, {len(compiled[1].keywords)} group triggers).")
+
+    def matches(self, text, is_group=False):
+        """True if text contains a keyword, or (in groups) a group trigger word."""
+        if not text:
+            return False
+        keywords, group_keywords = self._compiled
+        folded = text.casefold()
+        return keywords.search_folded(folded) or (is_group and group_keywords.search_folded(folded))
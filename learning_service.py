@@ -1,9 +1,11 @@
 import json
 import logging
-import asyncio
 import os
+import time
 from datetime import datetime, timezone
 
+from metrics import LEARNING_STAGE_SECONDS
+
 logger = logging.getLogger(__name__)
 
 class LearningService:
@@ -38,21 +40,19 @@ class LearningService:
         Incremental Learning: Reads new audit logs and asks AI for broad context facts.
         """
         logger.info("Running Incremental Context Learning...")
-        
-        # 1. Fetch Audit Logs
-        all_logs = await self.task_manager.get_audit_log(limit=1000) # Get deep history
-        if not all_logs: 
-            return
+        started = time.perf_counter()
+        try:
+            await self._digest_context(batch_size)
+        finally:
+            LEARNING_STAGE_SECONDS.labels("total").observe(time.perf_counter() - started)
 
-        # 2. Filter New Logs
-        new_logs = []
-        if not self.last_ts:
-            new_logs = all_logs[:batch_size] # First run: take most recent batch_size
-        else:
-            for log in all_logs:
-                if log['timestamp'] > self.last_ts:
-                    new_logs.append(log)
-            # Re-sort to chronological for coherent reading if needed, but reverse is fine for check
+    async def _digest_context(self, batch_size):
+        # 1. Fetch New Audit Logs (first run: most recent batch_size)
+        with LEARNING_STAGE_SECONDS.time("fetch"):
+            if not self.last_ts:
+                new_logs = await self.task_manager.get_audit_log(limit=batch_size)
+            else:
+                new_logs = await self.task_manager.get_audit_log(limit=1000, since=self.last_ts)
         
         if not new_logs:
             logger.info("No new logs to learn from.")
@@ -68,14 +68,16 @@ class LearningService:
         history_text = "\n".join([f"[{l['timestamp']}] {l['sender']}: {l['text']}" for l in new_logs])
         
         # 4. Analyze
-        facts = await self.agent.analyze_context_batch(history_text)
+        with LEARNING_STAGE_SECONDS.time("analyze"):
+            facts = await self.agent.analyze_context_batch(history_text)
         
         # 5. Save Facts
         added_count = 0
-        if facts:
-            for fact in facts:
-                if self.memory_manager.add_memory(fact):
-                    added_count += 1
+        with LEARNING_STAGE_SECONDS.time("save"):
+            if facts:
+                for fact in facts:
+                    if self.memory_manager.add_memory(fact):
+                        added_count += 1
         
         logger.info(f"Context Learning Complete. Added {added_count} new facts.")
         
@@ -90,21 +92,4 @@ class LearningService:
         logger.info("Running Feedback Learning Loop...")
         # TODO: This requires deeper integration with TaskManager to get Rejected tasks
         # For now, let's implement the structure
-        pass 
-
-    async def start_scheduler(self):
-        """Background loop."""
-        logger.info("Learning Service Scheduler Started.")
-        while True:
-            try:
-                await self.digest_context()
-                # await self.learn_from_feedback()
-                
-                # Sleep 6 hours
-                await asyncio.sleep(6 * 3600)
-            except asyncio.CancelledError:
-                logger.info("Learning Scheduler stopped.")
-                break
-            except Exception as e:
-                logger.error(f"Learning Scheduler Error: {e}")
-                await asyncio.sleep(600) # Retry after 10 mins
+        pass
@@ -0,0 +1,55 @@
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+class LinkIndex:
+    """
+    Durable message link -> Notion page id index (SQLite).
+    Used for task deduplication without a Notion round-trip.
+    """
+    def __init__(self, db_path="task_links.db"):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS links (link TEXT PRIMARY KEY, page_id TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        self._seeded = None
+
+    def is_seeded(self):
+        """True once a full crawl of the database has been recorded."""
+        if self._seeded is None:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'seeded'").fetchone()
+            self._seeded = bool(row and row[0] == "1")
+        return self._seeded
+
+    def seed(self, pairs):
+        """Bulk-loads (link, page_id) pairs from a full crawl and marks the index as seeded."""
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO links (link, page_id) VALUES (?, ?)", pairs)
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seeded', '1')")
+        self._seeded = True
+        logger.info(f"Link index seeded ({self.count()} links).")
+
+    def get(self, link):
+        """Returns the page id for a link, or None."""
+        if not link: return None
+        row = self.conn.execute("SELECT page_id FROM links WHERE link = ?", (link,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, link, page_id):
+        if not link or not page_id: return
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO links (link, page_id) VALUES (?, ?)", (link, page_id))
+
+    def remove(self, link):
+        if not link: return
+        with self.conn:
+            self.conn.execute("DELETE FROM links WHERE link = ?", (link,))
+
+    def add_many(self, pairs):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO links (link, page_id) VALUES (?, ?)", pairs)
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM links").fetchone()[0]
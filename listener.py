@@ -1,11 +1,15 @@
 from pyrogram import Client, filters, handlers
 import pyrogram
-from config import API_ID, API_HASH, SESSION_STRING, KEYWORD_FILTER, ENABLE_AUTO_REPLY, ENABLE_LONG_TERM_MEMORY, WORKING_HOURS_START, WORKING_HOURS_END
-from agent import Agent
+from config import API_ID, API_HASH, SESSION_STRING, KEYWORD_FILTER, KEYWORD_MATCH_WHOLE_WORDS, GROUP_TRIGGER_KEYWORDS, ENABLE_AUTO_REPLY, ENABLE_LONG_TERM_MEMORY, WORKING_HOURS_START, WORKING_HOURS_END, CHAT_HISTORY_SIZE, CHAT_HISTORY_MAX_CHATS, PIPELINE_WORKERS, PIPELINE_MAX_PENDING, ANALYSIS_BATCH_WINDOW_MS, ANALYSIS_BATCH_MAX_SIZE, ANALYSIS_BATCH_MAX_CHARS, TRIAGE_ENABLED, TRIAGE_MODEL_PATH, TRIAGE_THRESHOLD, TRIAGE_SHADOW_MODE
+from agent import Agent, AnalysisBatcher
 from task_manager import TaskManager
+from utils import retry_with_backoff
+from event_bus import event_bus
+from metrics import MESSAGE_STAGE_SECONDS, MESSAGES_RECEIVED, MESSAGES_FILTERED, MESSAGES_ANALYZED, TASKS_CREATED, BRIEFING_STAGE_SECONDS
 import logging
 import asyncio
 import os
+import time
 import sys
 from datetime import datetime
 import session_manager
@@ -14,11 +18,20 @@ logger = logging.getLogger(__name__)
 
 # Initialize Agent & Task Manager
 intelligence_agent = Agent()
+analysis_batcher = AnalysisBatcher(intelligence_agent, window_ms=ANALYSIS_BATCH_WINDOW_MS, max_size=ANALYSIS_BATCH_MAX_SIZE, max_chars=ANALYSIS_BATCH_MAX_CHARS)
 tm = TaskManager()
 from discussion_buffer import DiscussionBuffer
 discussion_buffer = DiscussionBuffer()
 from memory_manager import MemoryManager
 memory_manager = MemoryManager()
+from chat_history import ChatHistoryCache, format_history_line
+chat_history = ChatHistoryCache(per_chat=CHAT_HISTORY_SIZE, max_chats=CHAT_HISTORY_MAX_CHATS)
+from triage import TriageClassifier, is_noise_label
+triage = TriageClassifier.load(TRIAGE_MODEL_PATH) if TRIAGE_ENABLED else TriageClassifier()
+from keyword_matcher import RelevanceMatcher
+relevance_matcher = RelevanceMatcher(KEYWORD_FILTER, GROUP_TRIGGER_KEYWORDS, whole_words=KEYWORD_MATCH_WHOLE_WORDS)
+from digest import DiscussionDigester
+digester = DiscussionDigester(intelligence_agent, discussion_buffer)
 
 # Initialize Client
 if SESSION_STRING:
@@ -28,6 +41,16 @@ else:
     app = Client("telegram_agent_session_local", api_id=API_ID, api_hash=API_HASH)
 
 async def message_handler(client, message):
+    """Hands relevant messages to the processing pipeline (per-chat FIFO, bounded)."""
+    MESSAGES_RECEIVED.inc()
+    await message_pipeline.submit(message.chat.id, client, message)
+
+async def process_message(client, message):
+    """Analyzes one message (timed end to end; the stages are timed inside)."""
+    with MESSAGE_STAGE_SECONDS.time("total"):
+        await _process_message(client, message)
+
+async def _process_message(client, message):
     # DEBUG: Log everything to understand what's happening
     sender_name = message.chat.title or message.chat.first_name or "Unknown"
     logger.info(f"DEBUG: Received msg from {sender_name} | ID: {message.chat.id} | Type: {message.chat.type} | Outgoing: {message.outgoing}")
@@ -35,42 +58,71 @@ async def message_handler(client, message):
     # Skip potential spam or minimal messages
     if not message.text or len(message.text) < 2:
         logger.info("Skipping: Text too short or empty")
+        MESSAGES_FILTERED.labels("empty").inc()
         return
 
     sender = message.chat.title if message.chat.title else message.chat.first_name
     logger.info(f"Processing message from {sender}...")
 
-    # Fetch recent context (last 10 messages) for better analysis
-    history = []
-    try:
-        async for msg in client.get_chat_history(message.chat.id, limit=10):
-            sender_name = msg.chat.title or msg.from_user.first_name or "Unknown"
-            if msg.from_user:
-                sender_name = msg.from_user.first_name
-            history.append(f"{sender_name}: {msg.text or '[Media]'}")
-        history.reverse() # Oldest first
-    except Exception as e:
-        logger.warning(f"Failed to fetch history: {e}")
-        history = [f"{sender}: {message.text}"]
+    # Local triage: confident noise skips history, Notion reads and the LLM entirely.
+    # Never applied to my own messages (Saved Messages notes are always analyzed).
+    with MESSAGE_STAGE_SECONDS.time("triage"):
+        noise_score = triage.score(message.text) if not message.outgoing else None
+    if noise_score is not None and not TRIAGE_SHADOW_MODE and noise_score >= TRIAGE_THRESHOLD:
+        triage.skipped += 1
+        MESSAGES_FILTERED.labels("triage").inc()
+        logger.info(f"Triage: skipping LLM for likely noise (score {noise_score:.3f})")
+        try:
+            await tm.log_audit(
+                message_data={"sender": sender, "text": message.text},
+                evaluation={"priority": 4, "summary": "Triage: likely noise", "action_required": False, "source": "triage", "noise_score": round(noise_score, 3)}
+            )
+        except Exception as e:
+            logger.error(f"Audit log failed: {e}")
+        return
+
+    # Recent context (last N messages) for better analysis, from the local ring buffer when warm
+    history_started = time.perf_counter()
+    history = chat_history.get_recent(message.chat.id, limit=CHAT_HISTORY_SIZE, upto_id=message.id)
+    if history is None:
+        try:
+            fetched = []
+            async for msg in client.get_chat_history(message.chat.id, limit=CHAT_HISTORY_SIZE):
+                fetched.append(msg)
+            fetched.reverse() # Oldest first
+            chat_history.seed(message.chat.id, fetched)
+            history = [format_history_line(msg) for msg in fetched]
+        except Exception as e:
+            logger.warning(f"Failed to fetch history: {e}")
+            history = [f"{sender}: {message.text}"]
+    MESSAGE_STAGE_SECONDS.labels("history").observe(time.perf_counter() - history_started)
 
     context_text = "\n".join(history)
 
     # Get Memory & Learning Context
-    recent_done = await tm.get_recent_done_tasks(limit=5)
-    preferences = await tm.get_preference_examples(limit=5)
+    with MESSAGE_STAGE_SECONDS.time("task_context"):
+        recent_done = await tm.get_recent_done_tasks(limit=5)
+        preferences = await tm.get_preference_examples(limit=5)
     
     memory_text = "Recent Finished Tasks:\n" + "\n".join([f"- {t['summary']}" for t in recent_done])
     memory_text += "\n\nUser Preferences (Learning):\n"
     memory_text += "ACCEPTED Tasks:\n" + "\n".join([f"- [P{t['priority']}] {t['summary']} (from {t['sender']}) " + (f"| Note: {', '.join(t['comments'])}" if t['comments'] else "") for t in preferences['accepted']])
     memory_text += "\nREJECTED Tasks:\n" + "\n".join([f"- [P{t['priority']}] {t['summary']} (from {t['sender']}) " + (f"| Note: {', '.join(t['comments'])}" if t['comments'] else "") for t in preferences['rejected']])
     
-    # Inject Long-term Memory
+    # Inject Long-term Memory (retrieved per message, so it is kept out of the shared batch context)
+    relevant_memories = ""
     if ENABLE_LONG_TERM_MEMORY:
-        memory_text += "\n\n" + memory_manager.get_memories_text()
+        with MESSAGE_STAGE_SECONDS.time("memory"):
+            relevant_memories = memory_manager.get_relevant_memories_text(context_text)
 
     # Analyze with context AND memory
-    analysis = await intelligence_agent.analyze_message(context_text, sender, memory_text)
+    with MESSAGE_STAGE_SECONDS.time("analyze"):
+        analysis = await analysis_batcher.analyze(context_text, sender, memory_text, relevant_memories)
+    MESSAGES_ANALYZED.inc()
     logger.info(f"Analysis: {analysis}")
+
+    if noise_score is not None:
+        triage.record(noise_score, TRIAGE_THRESHOLD, is_noise_label(analysis))
     
     # SAVE MEMORY
     if ENABLE_LONG_TERM_MEMORY and analysis.get('save_memory'):
@@ -78,10 +130,11 @@ async def message_handler(client, message):
 
     # LOG AUDIT
     try:
-        await tm.log_audit(
-            message_data={"sender": sender, "text": message.text or "[Media/No Text]"},
-            evaluation=analysis
-        )
+        with MESSAGE_STAGE_SECONDS.time("audit"):
+            await tm.log_audit(
+                message_data={"sender": sender, "text": message.text or "[Media/No Text]"},
+                evaluation=analysis
+            )
     except Exception as e:
         logger.error(f"Audit log failed: {e}")
         
@@ -112,7 +165,8 @@ async def message_handler(client, message):
             logger.info(f"🤖 Auto-Replying to {sender}: {reply_text}")
             # Append disclaimer since we only auto-reply OFF working hours
             final_text = f"{reply_text}\n\n_(🤖 Auto-reply: Out of working hours)_"
-            await message.reply_text(final_text)
+            with MESSAGE_STAGE_SECONDS.time("auto_reply"):
+                await message.reply_text(final_text)
         except Exception as e:
             logger.error(f"Failed to auto-reply: {e}")
 
@@ -127,30 +181,42 @@ async def message_handler(client, message):
             except Exception:
                 pass
                 
-            task_result = await tm.add_task(
-                priority=analysis.get('priority', 0),
-                summary=analysis.get('summary', 'No summary'),
-                sender=sender,
-                link=safe_link,
-                deadline=analysis.get('deadline'),
-                user_id=message.chat.id
-            )
+            with MESSAGE_STAGE_SECONDS.time("create_task"):
+                task_result = await tm.add_task(
+                    priority=analysis.get('priority', 0),
+                    summary=analysis.get('summary', 'No summary'),
+                    sender=sender,
+                    link=safe_link,
+                    deadline=analysis.get('deadline'),
+                    user_id=message.chat.id
+                )
             
             if not task_result.get("is_new", True):
                 logger.info(f"Task already exists: {safe_link}. Skipping notification.")
                 return
+            TASKS_CREATED.inc()
+
+            event_bus.publish("notice", {"text": f"New task from {sender} (P{analysis.get('priority', 0)})", "level": "success"})
 
             # Notify user (Silent Mode: Only to Saved Messages)
             notification_text = f"✅ **Task Added from {sender}**\nPriority: {analysis.get('priority', 0)}\nSummary: {analysis.get('summary', 'No summary')}\nLink: {safe_link}"
             
             # If the source was NOT Saved Messages, send a copy to Saved Messages so I know.
             if message.chat.id != (await client.get_me()).id:
-                await client.send_message("me", notification_text)
+                with MESSAGE_STAGE_SECONDS.time("notify"):
+                    await send_to_saved_messages(client, notification_text)
             
             # REMOVED: await message.reply(...) for confirmation to avoid annoying sender.
         except Exception as e:
             logger.error(f"Failed to add task: {e}")
 
+from message_pipeline import MessagePipeline
+message_pipeline = MessagePipeline(process_message, workers=PIPELINE_WORKERS, max_pending=PIPELINE_MAX_PENDING)
+
+async def history_recorder(client, message):
+    """Feeds every incoming/outgoing message into the per-chat history cache."""
+    chat_history.record(message)
+
 async def group_digest_listener(client, message):
     """Buffers group messages for daily summary."""
     # Only process Group/Supergroup
@@ -170,6 +236,11 @@ async def group_digest_listener(client, message):
     if len(text) > 10:
         discussion_buffer.add_point(message.chat.title or "Unknown Group", sender_name, text)
 
+@retry_with_backoff(retries=2, backoff_in_seconds=2, breaker="telegram")
+async def send_to_saved_messages(client: Client, text: str):
+    """Sends to Saved Messages; retried on flood waits and transient errors, failing fast while Telegram is down."""
+    return await client.send_message("me", text)
+
 async def command_handler(client, message):
     """Handles commands like /summary."""
     command = message.text.split()[0].lower()
@@ -178,12 +249,11 @@ async def command_handler(client, message):
         logger.info("Generating On-Demand Summary...")
         await message.reply("🔄 Generating Group Discussion Digest...")
         
-        buffer_text = discussion_buffer.get_grouped_text()
-        if not buffer_text:
+        summary = await digester.build()
+        if not summary:
              await message.reply("📭 No discussions recorded today.")
              return
              
-        summary = await intelligence_agent.summarize_discussions(buffer_text)
         await message.reply(summary)
         
         # Archive it? command usually implies just viewing. 
@@ -194,8 +264,11 @@ async def send_daily_briefing(app: Client, tm: TaskManager):
     """Sends a daily summary of top tasks AND discussion digest."""
     logger.info("Generating Daily Briefing...")
     
+    started = time.perf_counter()
+
     # Part 1: Tasks
-    data = await tm.get_daily_briefing_tasks()
+    with BRIEFING_STAGE_SECONDS.time("tasks"):
+        data = await tm.get_daily_briefing_tasks()
     task_text = ""
     
     if data['top_tasks']:
@@ -210,13 +283,14 @@ async def send_daily_briefing(app: Client, tm: TaskManager):
              
     # Part 2: Group Digest
     digest_text = ""
-    buffer_content = discussion_buffer.get_grouped_text()
-    if buffer_content:
+    if discussion_buffer.buffer:
         logger.info("Summarizing Group Discussions...")
-        digest_text = await intelligence_agent.summarize_discussions(buffer_content)
+        with BRIEFING_STAGE_SECONDS.time("digest"):
+            digest_text = await digester.build()
         # Archive
-        discussion_buffer.archive_daily_summary(digest_text)
-        discussion_buffer.clear() # Clear buffer after daily report
+        with BRIEFING_STAGE_SECONDS.time("archive"):
+            discussion_buffer.archive_daily_summary(digest_text)
+            discussion_buffer.clear() # Clear buffer after daily report
     
     # Combine
     final_text = "☀️ **Good Morning! Here is your Daily Briefing:**\n\n"
@@ -231,33 +305,14 @@ async def send_daily_briefing(app: Client, tm: TaskManager):
     
     # Send to Saved Messages (Me)
     try:
-        await app.send_message("me", final_text)
+        with BRIEFING_STAGE_SECONDS.time("send"):
+            await send_to_saved_messages(app, final_text)
         logger.info("Daily Briefing Sent.")
     except Exception as e:
         logger.error(f"Failed to send briefing: {e}")
+    BRIEFING_STAGE_SECONDS.labels("total").observe(time.perf_counter() - started)
 
-async def scheduler(app: Client, tm: TaskManager):
-    """Simple loop to check time and send briefing."""
-    # Send one immediately on startup for testing/engagement
-    await asyncio.sleep(5) # Wait for connection
-    await send_daily_briefing(app, tm)
-    
-    logger.info("Scheduler started.")
-    while True:
-        # Loop every hour to check if it's 9am
-        # For production use apscheduler, but this is fine for MVP
-        import datetime
-        now = datetime.datetime.now()
-        if now.hour == 9 and now.minute == 0:
-             await send_daily_briefing(app, tm)
-             await asyncio.sleep(61) # Sleep past the minute
-        await asyncio.sleep(50)
-
-
-
-
-
-def is_message_relevant(message, me_id, dynamic_keywords):
+def is_message_relevant(message, me_id, matcher):
     """Refactored logic to check if a message is relevant for the agent."""
     # 1. Saved Messages (Chat "me")
     if message.chat.id == me_id:
@@ -278,14 +333,8 @@ def is_message_relevant(message, me_id, dynamic_keywords):
         return True
     
     # 5. Keywords
-    if message.text:
-        text = message.text.lower()
-        if any(k.lower() in text for k in dynamic_keywords):
-            return True
-    if message.caption:
-        caption = message.caption.lower()
-        if any(k.lower() in caption for k in dynamic_keywords):
-            return True
+    if matcher.matches(message.text or message.caption):
+        return True
             
     return False
 
@@ -304,7 +353,7 @@ def get_message_link(message):
         chat_id_str = chat_id_str[4:]
     return f"https://t.me/c/{chat_id_str}/{message.id}"
 
-async def run_catch_up(app: Client, dynamic_keywords):
+async def run_catch_up(app: Client, matcher):
     """Scans recent dialogs for missed messages during downtime."""
     logger.info("♻️ Running Startup Catch-Up...")
     
@@ -341,7 +390,7 @@ async def run_catch_up(app: Client, dynamic_keywords):
             
             for msg in history:
                 # Basic relevance check
-                if is_message_relevant(msg, me_id, dynamic_keywords):
+                if is_message_relevant(msg, me_id, matcher):
                     # Deduplication Check
                     msg_link = get_message_link(msg)
                     if msg_link in existing_links:
@@ -350,7 +399,7 @@ async def run_catch_up(app: Client, dynamic_keywords):
                         continue
                         
                     try:
-                        await message_handler(app, msg)
+                        await process_message(app, msg)
                         count += 1
                         # Add to local set to prevent adding same task twice in one run
                         existing_links.add(msg_link) 
@@ -382,42 +431,23 @@ async def start_listener():
     
     # Custom Filter: Start Listener
     # 1. Replies to ME
-    # 2. Keywords (Dynamic)
+    # 2. Keywords (Dynamic) and Group "Everyone" triggers, via the compiled matcher
     async def relevant_filter(_, __, message):
-        # We need 'me' ID for the helper, but inside filter it's hard to get async 'me' every time.
-        # We'll use a cached ID or just checking 'is_self' on message objects.
-        # For efficiency, we replicate the logic slightly or use the helper if we had 'me_id'.
-        # Since 'is_message_relevant' needs me_id for Saved Messages check, we can rely on filters.chat("me") for that.
-        
+        # Saved Messages are covered by filters.chat("me"), so 'me' ID isn't needed here.
         if message.reply_to_message and message.reply_to_message.from_user and message.reply_to_message.from_user.is_self:
             return True
-        
-        if message.text:
-            text = message.text.lower()
-            if any(k.lower() in text for k in dynamic_keywords):
-                return True
-            
-            # Group "Everyone" Check
-            from config import GROUP_TRIGGER_KEYWORDS
-            if message.chat.type in [pyrogram.enums.ChatType.GROUP, pyrogram.enums.ChatType.SUPERGROUP]:
-                 if any(k.lower() in text for k in GROUP_TRIGGER_KEYWORDS):
-                     return True
-
-        if message.caption:
-            caption = message.caption.lower()
-            if any(k.lower() in caption for k in dynamic_keywords):
-                return True
-            
-            # Group "Everyone" Check (Caption)
-            from config import GROUP_TRIGGER_KEYWORDS
-            if message.chat.type in [pyrogram.enums.ChatType.GROUP, pyrogram.enums.ChatType.SUPERGROUP]:
-                 if any(k.lower() in caption for k in GROUP_TRIGGER_KEYWORDS):
-                     return True
-                
+
+        is_group = message.chat.type in (pyrogram.enums.ChatType.GROUP, pyrogram.enums.ChatType.SUPERGROUP)
+        if relevance_matcher.matches(message.text or message.caption, is_group):
+            return True
+        MESSAGES_FILTERED.labels("irrelevant").inc()
         return False
 
     custom_relevance_filter = filters.create(relevant_filter)
 
+    # Register History Recorder (Catch-all, runs before every other group)
+    app.add_handler(handlers.MessageHandler(history_recorder), group=-1)
+
     # Register Group Digest Listener (Catch-all for groups)
     app.add_handler(handlers.MessageHandler(group_digest_listener, filters.group), group=1)
     
@@ -447,6 +477,7 @@ async def start_listener():
         return
 
     # If valid, start
+    message_pipeline.start()
     await app.start()
     
     # Init Keywords
@@ -454,18 +485,16 @@ async def start_listener():
     if me.first_name: dynamic_keywords.append(me.first_name)
     if me.last_name: dynamic_keywords.append(me.last_name)
     if me.username: dynamic_keywords.append(me.username)
+    relevance_matcher.rebuild(dynamic_keywords, GROUP_TRIGGER_KEYWORDS)
     logger.info(f"Initialized Keyword Filter: {dynamic_keywords}")
     
     # START CATCH-UP
     # Disabled to prevent duplicates: Pyrogram automatically fetches missed updates on persistent sessions.
-    # await run_catch_up(app, dynamic_keywords)
+    # await run_catch_up(app, relevance_matcher)
     logger.info("Startup Catch-Up DISABLED (Relying on Native Updates)")
     
-    # Start Scheduler
-    asyncio.create_task(scheduler(app, tm))
-
     try:
-        await app.send_message("me", "⚡ **Agent Just Started** ⚡\n_Group Digest Active._")
+        await send_to_saved_messages(app, "⚡ **Agent Just Started** ⚡\n_Group Digest Active._")
         logger.info("Startup message sent to 'me'")
     except Exception as e:
         logger.error(f"Failed to send startup message: {e}")
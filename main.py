@@ -2,7 +2,7 @@ import asyncio
 import logging
 import uvicorn
 # Load Config & Env FIRST
-from config import API_ID, API_HASH
+from config import API_ID, API_HASH, SCHEDULER_STATE_FILE, BRIEFING_CRON, LEARNING_INTERVAL_HOURS, SCHEDULER_CATCH_UP, SCHEDULER_JITTER_SECONDS, NOTION_TIMEOUT_SECONDS
 
 # Fix for Pyrogram import in Python 3.14+ (requires event loop for sync wrapper)
 try:
@@ -10,7 +10,8 @@ try:
 except RuntimeError:
     asyncio.set_event_loop(asyncio.new_event_loop())
 
-from listener import start_listener, tm, app as client_app, intelligence_agent, memory_manager
+from listener import start_listener, tm, app as client_app, intelligence_agent, memory_manager, chat_history, message_pipeline, analysis_batcher, triage, discussion_buffer, digester, send_daily_briefing, send_to_saved_messages
+from http_pool import http_pool
 import server
 import pyrogram
 
@@ -29,7 +30,7 @@ async def on_task_done(summary: str):
     """Callback when a task is marked done via the Web UI."""
     try:
         if client_app.is_connected:
-            await client_app.send_message("me", f"✅ **Task Completed**\n_{summary}_")
+            await send_to_saved_messages(client_app, f"✅ **Task Completed**\n_{summary}_")
     except Exception as e:
         logger.error(f"Failed to send completion notification: {e}")
 
@@ -50,6 +51,13 @@ async def main():
     # Dependency Injection
     server.task_manager = tm
     server.notification_callback = on_task_done
+    server.chat_history = chat_history
+    server.message_pipeline = message_pipeline
+    server.analysis_batcher = analysis_batcher
+    server.agent = intelligence_agent
+    server.triage = triage
+    server.discussion_buffer = discussion_buffer
+    server.digester = digester
 
     logger.info("Starting Telegram Intelligence Agent...")
     
@@ -57,15 +65,34 @@ async def main():
     await start_listener()
     
     logger.info("Telegram Client Connected.")
+
+    # Pre-warm the shared HTTP pool and the Gemini channel so first requests skip connection setup
+    await asyncio.gather(http_pool.warm("notion", "https://api.notion.com", NOTION_TIMEOUT_SECONDS),
+                         intelligence_agent.warm_up())
     logger.info("Starting Web Dashboard at http://localhost:8000...")
 
     # 2. Run Server as background task
     server_task = asyncio.create_task(run_server())
 
-    # 3. Start Learning Service (Background)
+    # 3. Scheduled jobs: daily briefing (cron) and context learning (interval)
     from learning_service import LearningService
+    from scheduler import Scheduler
     rec_service = LearningService(intelligence_agent, memory_manager, tm)
-    learning_task = asyncio.create_task(rec_service.start_scheduler())
+    job_scheduler = Scheduler(SCHEDULER_STATE_FILE)
+    job_scheduler.add_cron("daily_briefing", BRIEFING_CRON, lambda: send_daily_briefing(client_app, tm),
+                           catch_up=SCHEDULER_CATCH_UP, jitter=SCHEDULER_JITTER_SECONDS)
+    job_scheduler.add_interval("context_learning", LEARNING_INTERVAL_HOURS * 3600, rec_service.digest_context,
+                               catch_up=SCHEDULER_CATCH_UP, jitter=SCHEDULER_JITTER_SECONDS, retry_seconds=600)
+    server.job_scheduler = job_scheduler
+    scheduler_task = asyncio.create_task(job_scheduler.run())
+
+    # 4. Keep the local task mirror in sync with Notion and drain queued writes to it (Background)
+    mirror_task = asyncio.create_task(tm.start_refresh_loop())
+    link_index_task = asyncio.create_task(tm.warm_link_index())
+    outbox_task = asyncio.create_task(tm.outbox.run())
+
+    # 5. Keep per-chat discussion summaries rolling so digests are instant (Background)
+    digest_task = asyncio.create_task(digester.run_rolling_updates())
 
     # 3. Idle until signal
     try:
@@ -75,6 +102,9 @@ async def main():
     finally:
         logger.info("Shutting down services...")
         
+        # Drain in-flight messages first: the Notion writes they make still need the outbox
+        await message_pipeline.stop()
+
         # Stop Server
         server_task.cancel()
         try:
@@ -82,12 +112,41 @@ async def main():
         except asyncio.CancelledError:
             pass
 
-        # Stop Learning Service
-        learning_task.cancel()
+        # Stop Scheduler
+        scheduler_task.cancel()
         try:
-            await learning_task
+            await scheduler_task
         except asyncio.CancelledError:
             pass
+
+        # Stop Task Mirror Refresh
+        mirror_task.cancel()
+        link_index_task.cancel()
+        for task in (mirror_task, link_index_task):
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        # Stop the Notion outbox once what is due has gone out (the rest stays on disk for the next start)
+        await tm.outbox.drain()
+        outbox_task.cancel()
+        try:
+            await outbox_task
+        except asyncio.CancelledError:
+            pass
+
+        # Stop Rolling Summaries
+        digest_task.cancel()
+        try:
+            await digest_task
+        except asyncio.CancelledError:
+            pass
+
+        tm.audit_store.close()
+        tm.mirror.close()
+        discussion_buffer.close()
+        await http_pool.close()
             
         logger.info("Stopping Telegram Client...")
         if client_app.is_connected:
@@ -1,15 +1,41 @@
 import json
 import logging
+import math
 import os
+import re
 
-from config import MEMORY_FILE_PATH
+from config import MEMORY_FILE_PATH, MEMORY_TOP_K, MEMORY_MAX_CHARS, MEMORY_DEDUP_THRESHOLD, MEMORY_DEDUP_MODE
+from minhash_index import MinHashIndex, shingles
 
 logger = logging.getLogger(__name__)
 
+TOKEN_RE = re.compile(r"\w+")
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+def tokenize(text):
+    # Light plural folding so "calls" matches "call"
+    return [t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t
+            for t in TOKEN_RE.findall(text.casefold())]
+
 class MemoryManager:
-    def __init__(self, storage_file=None):
+    def __init__(self, storage_file=None, dedup_threshold=MEMORY_DEDUP_THRESHOLD, dedup_mode=MEMORY_DEDUP_MODE):
         self.storage_file = storage_file or MEMORY_FILE_PATH
+        self.dedup_mode = dedup_mode  # "reject" keeps the existing fact, "merge" keeps the longer wording
         self.memories = self._load_memories()
+        self._build_indexes(dedup_threshold)
+
+    def _build_indexes(self, dedup_threshold):
+        # Inverted index over facts for BM25 retrieval
+        self._postings = {}  # term -> {fact index: term frequency}
+        self._doc_lengths = []
+        self._total_length = 0
+        # Exact and near-duplicate (MinHash) indexes
+        self._fact_set = set(self.memories)
+        self._near_index = MinHashIndex(dedup_threshold) if 0 < dedup_threshold <= 1 else None
+        for doc_id, fact in enumerate(self.memories):
+            self._index_fact(fact, doc_id)
 
     def _load_memories(self):
         if not os.path.exists(self.storage_file):
@@ -33,19 +59,149 @@ class MemoryManager:
         """Adds a new fact if it doesn't already exist."""
         if not fact or not isinstance(fact, str): return False
         
-        # Deduplication (Simple exact match)
-        if fact in self.memories:
+        # Deduplication (Exact match)
+        if fact in self._fact_set:
             logger.info(f"Memory already exists: {fact}")
             return False
+
+        # Deduplication (Near match, e.g. LLM paraphrases)
+        near = self.find_near_duplicate(fact)
+        if near is not None:
+            doc_id, similarity = near
+            existing = self.memories[doc_id]
+            if self.dedup_mode == "merge" and len(fact) > len(existing):
+                self._replace_fact(doc_id, fact)
+                self._save_memories()
+                logger.info(f"Memory merged (similarity {similarity:.2f}): {existing} -> {fact}")
+            else:
+                logger.info(f"Near-duplicate memory rejected (similarity {similarity:.2f}): {fact} ~ {existing}")
+            return False
             
         self.memories.append(fact)
+        self._fact_set.add(fact)
+        self._index_fact(fact, len(self.memories) - 1)
         self._save_memories()
         logger.info(f"Memory saved: {fact}")
         return True
 
+    def find_near_duplicate(self, fact: str):
+        """Returns (fact index, similarity) of a stored near-duplicate, or None."""
+        if not self._near_index:
+            return None
+        return self._near_index.find_near(shingles(tokenize(fact)))
+
+    def _replace_fact(self, doc_id, fact):
+        old = self.memories[doc_id]
+        self._unindex_fact(old, doc_id)
+        self._fact_set.discard(old)
+        self.memories[doc_id] = fact
+        self._fact_set.add(fact)
+        self._index_fact(fact, doc_id)
+
+    def compact(self):
+        """Rewrites memory.json without near-duplicates. Returns the number of facts removed."""
+        facts = self.memories
+        self.memories = []
+        self._build_indexes(self._near_index.threshold if self._near_index else 0)
+        for fact in facts:
+            if fact in self._fact_set:
+                continue
+            near = self.find_near_duplicate(fact)
+            if near is not None:
+                if self.dedup_mode == "merge" and len(fact) > len(self.memories[near[0]]):
+                    self._replace_fact(near[0], fact)
+                continue
+            self.memories.append(fact)
+            self._fact_set.add(fact)
+            self._index_fact(fact, len(self.memories) - 1)
+        self._save_memories()
+        return len(facts) - len(self.memories)
+
     def get_memories_text(self):
         """Returns a formatted string of memories for the prompt."""
         if not self.memories:
             return "No long-term memories yet."
         
         return "Long-term Memory (Facts):" + "".join([f"\n- {m}" for m in self.memories])
+
+    def _index_fact(self, fact, doc_id):
+        """Adds a fact to the inverted and near-duplicate indexes."""
+        tokens = tokenize(fact)
+        for term in tokens:
+            postings = self._postings.setdefault(term, {})
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+        if doc_id == len(self._doc_lengths):
+            self._doc_lengths.append(len(tokens))
+        else:
+            self._doc_lengths[doc_id] = len(tokens)
+        self._total_length += len(tokens)
+        if self._near_index:
+            self._near_index.add(doc_id, shingles(tokens))
+
+    def _unindex_fact(self, fact, doc_id):
+        for term in set(tokenize(fact)):
+            postings = self._postings.get(term)
+            if postings:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._doc_lengths[doc_id]
+        if self._near_index:
+            self._near_index.remove(doc_id)
+
+    def search(self, query: str, top_k: int = MEMORY_TOP_K):
+        """Returns up to top_k (score, fact) pairs ranked by BM25 against the query."""
+        if not self.memories or not query:
+            return []
+
+        n = len(self._doc_lengths)
+        avg_length = (self._total_length / n) or 1
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(score, self.memories[doc_id]) for doc_id, score in ranked]
+
+    def get_relevant_memories_text(self, query: str, top_k: int = MEMORY_TOP_K, max_chars: int = MEMORY_MAX_CHARS):
+        """
+        Returns a prompt block with only the facts most relevant to the query, within max_chars.
+        If fewer than top_k facts match, the newest facts fill the remaining slots.
+        """
+        if not self.memories:
+            return "No long-term memories yet."
+
+        selected = [fact for _, fact in self.search(query, top_k)]
+        for fact in reversed(self.memories):
+            if len(selected) >= top_k:
+                break
+            if fact not in selected:
+                selected.append(fact)
+
+        text = "Long-term Memory (Facts):"
+        for fact in selected:
+            line = f"\n- {fact}"
+            if len(text) + len(line) > max_chars:
+                break
+            text += line
+        return text
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Long-term memory maintenance.")
+    parser.add_argument("command", choices=["compact"], help="compact: remove near-duplicate facts from the memory file")
+    parser.add_argument("--file", default=MEMORY_FILE_PATH)
+    parser.add_argument("--threshold", type=float, default=MEMORY_DEDUP_THRESHOLD, help="Word-bigram Jaccard similarity (0-1, estimated with MinHash) treated as duplicate")
+    args = parser.parse_args()
+
+    manager = MemoryManager(args.file, dedup_threshold=args.threshold)
+    before = len(manager.memories)
+    removed = manager.compact()
+    print(f"Compacted {args.file}: {before} -> {len(manager.memories)} facts ({removed} duplicates removed).")
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class MessagePipeline:
+    """
+    Bounded ingestion queue feeding a pool of async workers.
+    Messages from the same chat are handled one at a time in arrival order;
+    different chats are handled in parallel.
+    """
+    def __init__(self, handler, workers=4, max_pending=100):
+        self.handler = handler
+        self.num_workers = workers
+        self.max_pending = max_pending
+
+        self._pending = {}  # chat_id -> deque of handler args; present while queued or being handled
+        self._ready = None  # chat ids with pending work and no worker on them
+        self._slots = None  # Backpressure: one slot per queued or running message
+        self._idle = None
+        self._in_flight = 0
+        self._workers = []
+        self._accepting = False
+
+        # Counters
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        """Creates the queue primitives on the running loop and spawns the workers."""
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+        self._accepting = True
+        logger.info(f"Message pipeline started ({self.num_workers} workers, max {self.max_pending} pending).")
+
+    async def submit(self, chat_id, *args):
+        """Queues a message for its chat. Waits while the pipeline is full."""
+        if not self._accepting:
+            logger.warning(f"Message pipeline not accepting work. Dropping message for chat {chat_id}.")
+            return
+
+        await self._slots.acquire()
+        self._in_flight += 1
+        self._idle.clear()
+
+        queue = self._pending.get(chat_id)
+        if queue is None:
+            self._pending[chat_id] = deque([args])
+            self._ready.put_nowait(chat_id)
+        else:
+            # A worker already owns this chat; it picks this up after the earlier messages
+            queue.append(args)
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            queue = self._pending[chat_id]
+            args = queue.popleft()
+            try:
+                await self.handler(*args)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Pipeline handler failed for chat {chat_id}: {e}")
+            finally:
+                self._slots.release()
+                self._in_flight -= 1
+                if queue:
+                    # Re-queue behind other chats so one busy chat can't starve the rest
+                    self._ready.put_nowait(chat_id)
+                else:
+                    del self._pending[chat_id]
+                if self._in_flight == 0:
+                    self._idle.set()
+
+    async def stop(self, timeout=30.0):
+        """Stops accepting messages, drains what is queued, then stops the workers."""
+        if not self._workers:
+            return
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            logger.info("Message pipeline drained.")
+        except asyncio.TimeoutError:
+            logger.warning(f"Message pipeline drain timed out with {self._in_flight} messages pending.")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def get_stats(self):
+        return {
+            "depth": self._in_flight,
+            "active_chats": len(self._pending),
+            "processed": self.processed,
+            "failed": self.failed
+        }
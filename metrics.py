@@ -0,0 +1,173 @@
+import bisect
+import math
+import time
+
+# Latency buckets (seconds): sub-millisecond local work up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REGISTRY = []  # Every metric, in registration order (the /metrics output order)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._children = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        """Child for one label combination (resolve once and keep it on hot paths)."""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self._samples())
+        return "\n".join(lines)
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class Counter(_Metric):
+    """Monotonic count. Unlabelled counters can be used directly: COUNTER.inc()."""
+    kind = "counter"
+    _new_child = _CounterChild
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        if not self.label_names:
+            self._default = self.labels()
+            self.inc = self._default.inc
+
+    def _samples(self):
+        for values, child in self._children.items():
+            yield self.name, _format_labels(self.label_names, values), child.value
+
+class Gauge(_Metric):
+    """
+    Point-in-time value read from a callback at scrape time, so it costs nothing between scrapes.
+    The callback returns a number (or None to skip), or with labels a dict of label tuple -> number.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn, labels=()):
+        super().__init__(name, help_text, labels)
+        self.fn = fn
+
+    def _samples(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return
+        if value is None:
+            return
+        if not self.label_names:
+            yield self.name, "", value
+            return
+        for values, v in value.items():
+            if v is not None:
+                yield self.name, _format_labels(self.label_names, values), v
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Per bucket (not cumulative); the last is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        """Context manager observing the duration of its block."""
+        return _Timer(self)
+
+class Histogram(_Metric):
+    """Distribution of observations (latencies in seconds) over fixed buckets."""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help_text, labels)
+        if not self.label_names:
+            self._default = self.labels()
+            self.observe = self._default.observe
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def time(self, *label_values):
+        """Context manager observing its block's duration: `with HIST.time("stage"): ...`."""
+        return _Timer(self.labels(*label_values))
+
+    def _samples(self):
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), child.counts):
+                cumulative += count
+                labels = _format_labels(self.label_names + ("le",), values + (_format_value(bound),))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.label_names, values)
+            yield f"{self.name}_sum", labels, child.sum
+            yield f"{self.name}_count", labels, child.count
+
+def render():
+    """All registered metrics in the Prometheus text exposition format (0.0.4)."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+# --- Message processing ----------------------------------------------------
+
+MESSAGE_STAGE_SECONDS = Histogram("agent_message_stage_seconds", "Time spent in each stage of message processing.", labels=("stage",))
+MESSAGES_RECEIVED = Counter("agent_messages_received_total", "Messages handed to the processing pipeline.")
+MESSAGES_FILTERED = Counter("agent_messages_filtered_total", "Messages dropped before LLM analysis.", labels=("reason",))
+MESSAGES_ANALYZED = Counter("agent_messages_analyzed_total", "Messages analyzed by the LLM (or served from the analysis cache).")
+TASKS_CREATED = Counter("agent_tasks_created_total", "Tasks created from messages (duplicates excluded).")
+
+# --- Scheduled jobs --------------------------------------------------------
+
+BRIEFING_STAGE_SECONDS = Histogram("agent_briefing_stage_seconds", "Time spent in each stage of the daily briefing.", labels=("stage",))
+LEARNING_STAGE_SECONDS = Histogram("agent_learning_stage_seconds", "Time spent in each stage of context learning.", labels=("stage",))
@@ -0,0 +1,77 @@
+import hashlib
+import random
+
+# Facts are short (~10 words), so a small signature with 2-row bands keeps recall near 1 at
+# threshold ~0.85; false candidates are cheap because every candidate is verified exactly.
+NUM_PERMUTATIONS = 16
+ROWS_PER_BAND = 2
+_PRIME = (1 << 31) - 1
+
+# Fixed seed so signatures are stable across restarts
+_rng = random.Random(1729)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+def shingles(tokens):
+    """
+    Word shingles used for similarity: the set of bigrams (the unigram for one-word text).
+    Bigrams keep word order, so facts that share a template but differ in the value
+    ("...in the morning before 11am" vs "...in the afternoon after 2pm") score low.
+    """
+    if len(tokens) < 2:
+        return frozenset(tokens)
+    return frozenset(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+
+def jaccard(a, b):
+    # Text without any words (e.g. only emoji) carries nothing to compare, so it never matches
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def minhash(shingle_set):
+    """MinHash signature (one minimum per permutation) of a shingle set."""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "big") for s in shingle_set] or [0]
+    return tuple(min([(a * h + b) % _PRIME for h in hashes]) for a, b in _PERMUTATIONS)
+
+class MinHashIndex:
+    """
+    Near-duplicate lookup over shingle sets with MinHash LSH.
+    Signatures are split into bands; items sharing any band become candidates,
+    and candidates are confirmed with exact Jaccard similarity >= threshold.
+    """
+    def __init__(self, threshold=0.85):
+        self.threshold = threshold
+        self._buckets = [{} for _ in range(NUM_PERMUTATIONS // ROWS_PER_BAND)]  # per band: band tuple -> set of ids
+        self._items = {}  # id -> (shingle set, signature)
+
+    def _bands(self, signature):
+        return [signature[i:i + ROWS_PER_BAND] for i in range(0, NUM_PERMUTATIONS, ROWS_PER_BAND)]
+
+    def add(self, item_id, shingle_set):
+        signature = minhash(shingle_set)
+        self._items[item_id] = (shingle_set, signature)
+        for buckets, band in zip(self._buckets, self._bands(signature)):
+            buckets.setdefault(band, set()).add(item_id)
+
+    def remove(self, item_id):
+        item = self._items.pop(item_id, None)
+        if item is None:
+            return
+        for buckets, band in zip(self._buckets, self._bands(item[1])):
+            bucket = buckets.get(band)
+            if bucket:
+                bucket.discard(item_id)
+                if not bucket:
+                    del buckets[band]
+
+    def find_near(self, shingle_set):
+        """Returns (id, similarity) of the most similar indexed item at or above threshold, or None."""
+        candidates = set()
+        for buckets, band in zip(self._buckets, self._bands(minhash(shingle_set))):
+            candidates.update(buckets.get(band, ()))
+
+        best = None
+        for item_id in candidates:
+            similarity = jaccard(shingle_set, self._items[item_id][0])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (item_id, similarity)
+        return best
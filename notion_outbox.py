@@ -0,0 +1,272 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import uuid
+
+from utils import classify_error, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+LOCAL_PREFIX = "local:"
+MAX_BACKOFF_SECONDS = 300
+
+class OutboxError(Exception):
+    """A queued Notion mutation was given up on."""
+
+class Ticket:
+    """
+    Handle for a queued mutation. `await ticket` waits until Notion confirmed it and returns the
+    operation's result (the page id for creates), or raises OutboxError.
+    """
+    def __init__(self, op_id, page_id, future):
+        self.op_id = op_id
+        self.page_id = page_id  # Local id ("local:...") until a create is confirmed
+        self._future = future
+
+    def done(self):
+        return self._future.done()
+
+    async def _wait(self):
+        ok, value = await asyncio.shield(self._future)
+        if not ok:
+            raise OutboxError(value)
+        return value
+
+    def __await__(self):
+        return self._wait().__await__()
+
+class NotionOutbox:
+    """
+    Durable (SQLite) queue of Notion mutations, drained by one background task through the
+    NotionSync token bucket. Callers update local state right away and get a Ticket.
+
+    Pending operations on the same page are coalesced: property updates merge into one
+    pages.update (the last value of each property wins) and comment additions/deletions merge
+    into one read-modify-write. Pages created locally get a "local:..." id that later operations
+    may target; they are sent once the create is confirmed and the real id is known.
+    """
+    def __init__(self, notion_sync, db_path="notion_outbox.db", max_attempts=8, on_created=None, on_failed=None):
+        self.notion_sync = notion_sync
+        self.max_attempts = max_attempts
+        self.on_created = on_created  # (local_id, page_id)
+        self.on_failed = on_failed  # (kind, page_id, payload)
+
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ops (id INTEGER PRIMARY KEY AUTOINCREMENT, page_id TEXT NOT NULL, kind TEXT NOT NULL, "
+            "payload TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL DEFAULT 0, created REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ops_page ON ops (page_id, kind)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ops_due ON ops (next_attempt)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS id_map (local_id TEXT PRIMARY KEY, page_id TEXT NOT NULL)")
+        self.conn.commit()
+
+        self._futures = {}  # op id -> future shared by every caller coalesced into it
+        self._inflight = None
+        self._wakeup = asyncio.Event()
+
+        # Counters
+        self.enqueued = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+
+    # --- Enqueue ---------------------------------------------------------
+
+    def create(self, task):
+        """Queues a page creation. The ticket's page_id is the local id to use until confirmed."""
+        local_id = f"{LOCAL_PREFIX}{uuid.uuid4().hex[:12]}"
+        return self._insert(local_id, "create", {"task": task})
+
+    def update(self, page_id, **properties):
+        """Queues a Status/Priority update, merged into any pending update of the same page."""
+        def merge(payload):
+            payload.update(properties)
+            return payload
+        return self._enqueue(self.resolve(page_id), "update", dict(properties), merge)
+
+    def add_comment(self, page_id, comment):
+        return self._enqueue(self.resolve(page_id), "comments", {"add": [comment], "delete": []},
+                             lambda payload: {**payload, "add": payload["add"] + [comment]})
+
+    def delete_comment(self, page_id, comment_id):
+        def merge(payload):
+            # Deleting a comment that was never sent just drops it
+            added = [c for c in payload["add"] if c["id"] != comment_id]
+            deleted = payload["delete"] if len(added) < len(payload["add"]) else payload["delete"] + [comment_id]
+            return {"add": added, "delete": deleted}
+        return self._enqueue(self.resolve(page_id), "comments", {"add": [], "delete": [comment_id]}, merge)
+
+    def _enqueue(self, page_id, kind, payload, merge):
+        row = self.conn.execute(
+            "SELECT id, payload FROM ops WHERE page_id = ? AND kind = ? ORDER BY id DESC LIMIT 1", (page_id, kind)
+        ).fetchone()
+        if row and row[0] != self._inflight:
+            with self.conn:
+                self.conn.execute("UPDATE ops SET payload = ? WHERE id = ?", (json.dumps(merge(json.loads(row[1]))), row[0]))
+            self.coalesced += 1
+            return Ticket(row[0], page_id, self._future(row[0]))
+        return self._insert(page_id, kind, payload)
+
+    def _insert(self, page_id, kind, payload):
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO ops (page_id, kind, payload, created) VALUES (?, ?, ?, ?)",
+                (page_id, kind, json.dumps(payload), time.time())
+            )
+        self.enqueued += 1
+        self._wakeup.set()
+        return Ticket(cursor.lastrowid, page_id, self._future(cursor.lastrowid))
+
+    def _future(self, op_id):
+        if op_id not in self._futures:
+            self._futures[op_id] = asyncio.get_running_loop().create_future()
+        return self._futures[op_id]
+
+    def _resolve_future(self, op_id, ok, value):
+        future = self._futures.pop(op_id, None)
+        if future and not future.done():
+            future.set_result((ok, value))
+
+    # --- Ids -------------------------------------------------------------
+
+    def resolve(self, page_id):
+        """Maps a confirmed local id to its Notion page id (other ids pass through)."""
+        if not page_id or not page_id.startswith(LOCAL_PREFIX):
+            return page_id
+        row = self.conn.execute("SELECT page_id FROM id_map WHERE local_id = ?", (page_id,)).fetchone()
+        return row[0] if row else page_id
+
+    def pending(self):
+        """Queued operations as (kind, page_id, payload), oldest first (for overlaying local state)."""
+        rows = self.conn.execute("SELECT kind, page_id, payload FROM ops ORDER BY id").fetchall()
+        return [(kind, page_id, json.loads(payload)) for kind, page_id, payload in rows]
+
+    def has_pending(self, page_id):
+        return self.conn.execute("SELECT 1 FROM ops WHERE page_id = ? LIMIT 1", (page_id,)).fetchone() is not None
+
+    # --- Drain -----------------------------------------------------------
+
+    # Operations on a locally created page wait for its create (which rewrites their page_id)
+    _SENDABLE = "(kind = 'create' OR page_id NOT LIKE ?)"
+
+    def _next_op(self):
+        """Oldest due operation whose page exists in Notion; returns (op, seconds until the next due one)."""
+        now = time.time()
+        row = self.conn.execute(
+            f"SELECT id, page_id, kind, payload, attempts FROM ops WHERE next_attempt <= ? AND {self._SENDABLE} ORDER BY id LIMIT 1",
+            (now, LOCAL_PREFIX + "%")
+        ).fetchone()
+        if row:
+            op_id, page_id, kind, payload, attempts = row
+            return (op_id, page_id, kind, json.loads(payload), attempts), None
+        next_due = self.conn.execute(
+            f"SELECT MIN(next_attempt) FROM ops WHERE {self._SENDABLE}", (LOCAL_PREFIX + "%",)
+        ).fetchone()[0]
+        return None, (next_due - now if next_due else None)
+
+    async def run(self):
+        """Background drain loop (one request in flight; the token bucket paces them)."""
+        logger.info(f"Notion outbox started ({self.size()} queued).")
+        while True:
+            self._wakeup.clear()
+            op, wait = self._next_op()
+            if op is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._send(*op)
+
+    async def _send(self, op_id, page_id, kind, payload, attempts):
+        self._inflight = op_id
+        try:
+            if kind == "create":
+                result = await self.notion_sync.create_task_page(payload["task"])
+                if not result:
+                    raise OutboxError("Notion is not configured")
+                with self.conn:
+                    self.conn.execute("INSERT OR REPLACE INTO id_map (local_id, page_id) VALUES (?, ?)", (page_id, result))
+                    # Operations queued against the local id can go out now
+                    self.conn.execute("UPDATE ops SET page_id = ? WHERE page_id = ? AND kind != 'create'", (result, page_id))
+                if self.on_created:
+                    self.on_created(page_id, result)
+            elif kind == "update":
+                result = await self.notion_sync.update_task_properties(page_id, **payload)
+            else:
+                result = await self.notion_sync.apply_comment_changes(page_id, payload["add"], payload["delete"])
+        except Exception as e:
+            self._retry_or_fail(op_id, page_id, kind, payload, attempts, e)
+            return
+        finally:
+            self._inflight = None
+
+        with self.conn:
+            self.conn.execute("DELETE FROM ops WHERE id = ?", (op_id,))
+        self.sent += 1
+        self._resolve_future(op_id, True, result)
+
+    async def drain(self, timeout=10.0):
+        """
+        Waits up to timeout seconds for operations that are due now to be sent (call on shutdown
+        while run() is still going). Anything left, e.g. ops backing off, stays queued on disk.
+        """
+        deadline = time.monotonic() + timeout
+        while self._inflight is not None or self._next_op()[0] is not None:
+            if time.monotonic() >= deadline:
+                logger.warning(f"Notion outbox drain timed out with {self.size()} operations queued.")
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def _retry_or_fail(self, op_id, page_id, kind, payload, attempts, error):
+        if not isinstance(error, CircuitOpenError):
+            attempts += 1  # Waiting out an open circuit doesn't use up attempts
+        retryable, server_delay = classify_error(error)
+        retryable = retryable and not isinstance(error, OutboxError)
+        if retryable and attempts < self.max_attempts:
+            # A 429 already paused the token bucket for Retry-After and an open circuit says
+            # when to come back; other failures back off here
+            if getattr(error, "status", None) == 429:
+                delay = 0
+            elif server_delay is not None:
+                delay = server_delay
+            else:
+                delay = min(2 ** attempts, MAX_BACKOFF_SECONDS)
+            with self.conn:
+                self.conn.execute("UPDATE ops SET attempts = ?, next_attempt = ? WHERE id = ?", (attempts, time.time() + delay, op_id))
+            self.retries += 1
+            logger.warning(f"Notion {kind} for {page_id} failed ({error}); retry {attempts} in {delay:.0f}s.")
+            return
+
+        self.failed += 1
+        logger.error(f"Giving up on Notion {kind} for {page_id} after {attempts} attempts: {error}")
+        failed = [(op_id, kind, payload)]
+        if kind == "create":
+            # Nothing queued against a page that will never exist can succeed
+            failed += [(row[0], row[1], json.loads(row[2])) for row in self.conn.execute(
+                "SELECT id, kind, payload FROM ops WHERE page_id = ? AND kind != 'create'", (page_id,)).fetchall()]
+        with self.conn:
+            self.conn.executemany("DELETE FROM ops WHERE id = ?", [(failed_id,) for failed_id, _, _ in failed])
+        for failed_id, failed_kind, failed_payload in failed:
+            if self.on_failed:
+                self.on_failed(failed_kind, page_id, failed_payload)
+            self._resolve_future(failed_id, False, str(error))
+
+    def size(self):
+        return self.conn.execute("SELECT COUNT(*) FROM ops").fetchone()[0]
+
+    def get_stats(self):
+        return {
+            "queued": self.size(),
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "sent": self.sent,
+            "retries": self.retries,
+            "failed": self.failed,
+            "rate_limiter": self.notion_sync.rate_limiter.get_stats()
+        }
@@ -1,7 +1,22 @@
-from notion_client import AsyncClient
+from notion_client import AsyncClient, APIResponseError
+import asyncio
+import time
+from notion_client.client import ClientOptions
 import logging
 import os
-from utils import retry_with_backoff
+from utils import retry_with_backoff, retry_after_seconds, TokenBucket, BREAKERS, classify_error, record_outcome
+from link_index import LinkIndex
+from config import LINK_INDEX_FILE, NOTION_RATE_LIMIT, NOTION_COMMENT_CACHE_SECONDS, NOTION_TIMEOUT_SECONDS
+from http_pool import http_pool
+
+RICH_TEXT_MAX_CHARS = 2000  # Notion limit per rich_text segment
+RICH_TEXT_MAX_SEGMENTS = 100  # Notion limit per property
+
+STATUS_MAP = {
+    "active": "Active",
+    "done": "Done",
+    "rejected": "Rejected"
+}
 
 logger = logging.getLogger(__name__)
 
@@ -22,29 +37,86 @@ class NotionSync:
                 self.database_id = f"{self.database_id[:8]}-{self.database_id[8:12]}-{self.database_id[12:16]}-{self.database_id[16:20]}-{self.database_id[20:]}"
                 
         self.token = os.getenv("NOTION_TOKEN")
+        self.data_source_id = None  # Resolved lazily on Notion API versions with data sources
+        self.link_index = LinkIndex(LINK_INDEX_FILE)
+        self._link_seeding = None  # In-flight seed_link_index task, shared by concurrent callers
+        # Every request (reads and outbox writes) shares one budget under Notion's ~3 req/s limit
+        self.rate_limiter = TokenBucket(NOTION_RATE_LIMIT)
+        # AgentComments text per page: {"text", "edited" (page last_edited_time), "fetched" (epoch)}
+        self._comment_cache = {}
+        self._comment_locks = {}
+        # Local comment writes are numbered; a read only caches if no write to its page finished since it started
+        self._comment_write_seq = 0
+        self._comment_written = {}  # page_id -> seq of the last local write
+        self.comment_cache_seconds = NOTION_COMMENT_CACHE_SECONDS
+        self.comment_cache_hits = 0
+        self.comment_cache_misses = 0
         
     def _get_client(self):
         """Lazy initialization of AsyncClient to ensure it attaches to the current loop."""
         if not self.notion and self.token:
-            self.notion = AsyncClient(auth=self.token)
+            # Shares the process-wide connection pool instead of opening its own
+            options = {"auth": self.token, "client": http_pool.client("notion", NOTION_TIMEOUT_SECONDS),
+                       "timeout_ms": int(NOTION_TIMEOUT_SECONDS * 1000)}
+            if "retry" in getattr(ClientOptions, "__dataclass_fields__", {}):
+                options["retry"] = False  # 429s are paced by our token bucket and retried by the outbox
+            self.notion = AsyncClient(**options)
             logger.info("Notion AsyncClient initialized (Lazy).")
         return self.notion
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
+    async def _call(self, method, **kwargs):
+        """
+        Issues one API call through the Notion circuit breaker and the shared token bucket.
+        A 429 pauses the bucket for Retry-After.
+        """
+        breaker = BREAKERS["notion"]
+        breaker.allow()
+        try:
+            await self.rate_limiter.acquire()
+            result = await method(**kwargs)
+        except Exception as e:
+            if isinstance(e, APIResponseError) and e.status == 429:
+                self.rate_limiter.pause(retry_after_seconds(e) or 1.0)
+            record_outcome(breaker, classify_error(e)[0])
+            raise
+        finally:
+            breaker.release_trial()  # A cancelled trial must not wedge the breaker half-open
+        breaker.record_success()
+        return result
+
+    async def _query_database(self, **kwargs):
+        """Queries the task database (databases.query on older clients, data_sources.query on newer ones)."""
+        client = self._get_client()
+        if hasattr(client.databases, "query"):
+            return await self._call(client.databases.query, database_id=self.database_id, **kwargs)
+
+        if not self.data_source_id:
+            database = await self._call(client.databases.retrieve, database_id=self.database_id)
+            self.data_source_id = database["data_sources"][0]["id"]
+        return await self._call(client.data_sources.query, data_source_id=self.data_source_id, **kwargs)
+
+    async def _iter_database_pages(self, **kwargs):
+        """Yields every page of the task database, following pagination cursors."""
+        cursor = None
+        while True:
+            if cursor:
+                kwargs["start_cursor"] = cursor
+            response = await self._query_database(page_size=100, **kwargs)
+            for page in response.get("results", []):
+                yield page
+            if not response.get("has_more") or not response.get("next_cursor"):
+                break
+            cursor = response["next_cursor"]
+
     async def create_task_page(self, task):
-        """Creates a page in the database asynchronously."""
+        """Creates a page in the database asynchronously (retried by the outbox)."""
         if not self._get_client() or not self.database_id: return None
 
         try:
             priority_val = task.get('priority', 0)
             
             # Map Status
-            status_map = {
-                "active": "Active",
-                "done": "Done",
-                "rejected": "Rejected"
-            }
-            status_val = status_map.get(task.get("status", "active"), "Active")
+            status_val = STATUS_MAP.get(task.get("status", "active"), "Active")
 
             # Define properties first
             properties = {
@@ -69,73 +141,71 @@ class NotionSync:
             if task.get('deadline'):
                 properties["Deadline"] = {"rich_text": [{"text": {"content": task.get('deadline')}}]}
 
-            new_page = await self._get_client().pages.create(
+            new_page = await self._call(
+                self._get_client().pages.create,
                 parent={"database_id": self.database_id},
                 properties=properties
             )
             logger.info(f"Synced task to Notion: {new_page['id']}")
+            self.link_index.add(task.get('link'), new_page['id'])
             return new_page['id']
             
         except Exception as e:
             logger.error(f"Failed to sync to Notion: {e}")
-            raise e  # Raise to trigger retry
+            raise e  # Raise so the outbox retries
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
-    async def update_task_status(self, page_id, status):
-        """Updates the status select property asynchronously."""
-        if not self.notion or not page_id: return
+    async def update_task_properties(self, page_id, status=None, priority=None):
+        """Updates Status and/or Priority in one request (retried by the outbox)."""
+        if not self._get_client() or not page_id: return False
+
+        properties = {}
+        if status is not None:
+            properties["Status"] = {"status": {"name": STATUS_MAP.get(status, "Active")}}
+        if priority is not None:
+            properties["Priority"] = {"number": int(priority)}
+        if not properties: return True
 
         try:
-            status_map = {
-                "active": "Active",
-                "done": "Done",
-                "rejected": "Rejected"
-            }
-            status_val = status_map.get(status, "Active")
-            
-            await self.notion.pages.update(
-                page_id=page_id,
-                properties={
-                    "Status": {
-                        "status": {"name": status_val}
-                    }
-                }
-            )
-            logger.info(f"Updated Notion Page {page_id} to {status_val}")
+            await self._call(self._get_client().pages.update, page_id=page_id, properties=properties)
+            logger.info(f"Updated Notion Page {page_id}: {', '.join(properties)}")
+            return True
         except Exception as e:
             logger.error(f"Failed to update Notion Page: {e}")
             raise e
 
     @retry_with_backoff(retries=3, backoff_in_seconds=1)
-    async def find_task_by_link(self, link):
-        """Checks if a task with the given link already exists using search asynchronously."""
-        if not self._get_client() or not self.database_id or not link: return None
-        
-        try:
-            # Search for pages (recent typically appear first in search results)
-            response = await self.notion.search(
-                filter={"value": "page", "property": "object"},
-                sort={"direction": "descending", "timestamp": "last_edited_time"}
-            )
-            
-            # Verify the PROPERTY "Link"
-            for page in response.get("results", []):
-                # Verify DB ID
-                page_db_id = page.get("parent", {}).get("database_id", "").replace("-", "")
-                target_db_id = self.database_id.replace("-", "")
-                if page_db_id != target_db_id: continue
+    async def seed_link_index(self):
+        """Crawls every page of the database once to seed the local link index."""
+        if not self._get_client() or not self.database_id: return
 
-                props = page.get("properties", {})
-                page_link = props.get("Link", {}).get("url", "")
-                
-                if page_link == link:
-                    return page['id']
-                    
-            return None
+        try:
+            pairs = []
+            async for page in self._iter_database_pages():
+                page_link = page.get("properties", {}).get("Link", {}).get("url")
+                if page_link:
+                    pairs.append((page_link, page["id"]))
+            self.link_index.seed(pairs)
         except Exception as e:
-            logger.error(f"Failed to check task existence via search: {e}")
+            logger.error(f"Failed to seed link index: {e}")
             raise e
 
+    async def ensure_link_index(self):
+        """Seeds the link index unless that was already done; concurrent callers share one crawl."""
+        if not self._get_client() or not self.database_id or self.link_index.is_seeded():
+            return
+        if self._link_seeding is None or self._link_seeding.done():
+            self._link_seeding = asyncio.create_task(self.seed_link_index())
+        await asyncio.shield(self._link_seeding)
+
+    async def find_task_by_link(self, link):
+        """Checks if a task with the given link already exists using the local link index."""
+        if not self._get_client() or not self.database_id or not link: return None
+
+        # Seeded at startup (TaskManager.warm_link_index); waits for that crawl if it is still running
+        if not self.link_index.is_seeded():
+            await self.ensure_link_index()
+        return self.link_index.get(link)
+
     def _parse_comments_text(self, full_text):
         """Helper to parse raw comment text into structured list."""
         comments = []
@@ -162,188 +232,220 @@ class NotionSync:
                     })
         return comments[::-1] # Newest first
 
+    def _page_to_task(self, page, read_seq=None):
+        """Converts a database page into the internal task format (read_seq: see _cache_comments)."""
+        props = page.get("properties", {})
+        
+        # Safe Extraction Helpers
+        def get_title(p):
+            return p.get("title", [])[0].get("text", {}).get("content", "") if p.get("title") else "Untitled"
+        
+        def get_select(p):
+            # Handle both 'select' and 'status' types
+            if "select" in p: return p.get("select", {}).get("name", "") if p.get("select") else ""
+            if "status" in p: return p.get("status", {}).get("name", "") if p.get("status") else ""
+            return ""
+
+        def get_number(p):
+            return p.get("number", 0)
+        
+        def get_rich_text(p):
+            return p.get("rich_text", [])[0].get("text", {}).get("content", "") if p.get("rich_text") else ""
+        
+        def get_url(p):
+            return p.get("url", "")
+
+        status = get_select(props.get("Status", {})).lower()
+        
+        # Parse comments directly here to avoid N+1 fetches (long threads span several segments)
+        comments_text = self._join_rich_text(props.get("AgentComments", {}))
+        self._cache_comments(page["id"], comments_text, page.get("last_edited_time", ""), read_seq)
+
+        # Internal format
+        return {
+            "id": page["id"], # Use Notion Page ID as internal ID
+            "summary": get_title(props.get("Name", {})),
+            "status": status if status else "active",
+            "priority": get_number(props.get("Priority", {})),
+            "sender": get_rich_text(props.get("Sender", {})),
+            "link": get_url(props.get("Link", {})),
+            "deadline": get_rich_text(props.get("Deadline", {})),
+            "comments": self._parse_comments_text(comments_text), # Include comments
+            "notion_page_id": page["id"],
+            "last_edited_time": page.get("last_edited_time", "")
+        }
+
+    def _task_filter(self, status=None, min_priority=None, edited_since=None):
+        """Builds a database query filter; returns None when nothing is filtered."""
+        conditions = []
+        if status:
+            conditions.append({"property": "Status", "status": {"equals": STATUS_MAP.get(status, status)}})
+        if min_priority is not None:
+            conditions.append({"property": "Priority", "number": {"greater_than_or_equal_to": min_priority}})
+        if edited_since:
+            # last_edited_time is minute-granular, so on_or_after re-reads the watermark minute
+            conditions.append({"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": edited_since}})
+        if len(conditions) > 1:
+            return {"and": conditions}
+        return conditions[0] if conditions else None
+
     @retry_with_backoff(retries=3, backoff_in_seconds=1)
-    async def get_tasks(self):
-        """Fetches all tasks from Notion database using search asynchronously."""
+    async def get_tasks(self, status=None, min_priority=None, edited_since=None):
+        """
+        Fetches tasks from the database, newest edit first, following every result page.
+        status / min_priority filter server-side; edited_since (ISO timestamp) returns only
+        pages edited since then, for incremental syncs.
+        """
         if not self._get_client() or not self.database_id: return []
 
         try:
-            response = await self._get_client().search(
-                filter={"value": "page", "property": "object"},
-                sort={"direction": "descending", "timestamp": "last_edited_time"}
-            )
-            
-            tasks = []
-            for page in response.get("results", []):
-                # Verify DB ID
-                page_db_id = page.get("parent", {}).get("database_id", "").replace("-", "")
-                target_db_id = self.database_id.replace("-", "")
-                
-                if page_db_id != target_db_id: continue
+            query = {"sorts": [{"timestamp": "last_edited_time", "direction": "descending"}]}
+            task_filter = self._task_filter(status, min_priority, edited_since)
+            if task_filter:
+                query["filter"] = task_filter
 
-                props = page.get("properties", {})
-                
-                # Safe Extraction Helpers
-                def get_title(p):
-                    return p.get("title", [])[0].get("text", {}).get("content", "") if p.get("title") else "Untitled"
-                
-                def get_select(p):
-                    # Handle both 'select' and 'status' types
-                    if "select" in p: return p.get("select", {}).get("name", "") if p.get("select") else ""
-                    if "status" in p: return p.get("status", {}).get("name", "") if p.get("status") else ""
-                    return ""
-
-                def get_number(p):
-                    return p.get("number", 0)
-                
-                def get_rich_text(p):
-                    return p.get("rich_text", [])[0].get("text", {}).get("content", "") if p.get("rich_text") else ""
-                
-                def get_url(p):
-                    return p.get("url", "")
-
-                status = get_select(props.get("Status", {})).lower()
-                summary = get_title(props.get("Name", {}))
-                
-                # Parse comments directly here to avoid N+1 fetches
-                comments_text = get_rich_text(props.get("AgentComments", {}))
-                comments = self._parse_comments_text(comments_text)
-
-                # Internal format
-                task = {
-                    "id": page["id"], # Use Notion Page ID as internal ID
-                    "summary": summary,
-                    "status": status if status else "active",
-                    "priority": get_number(props.get("Priority", {})),
-                    "sender": get_rich_text(props.get("Sender", {})),
-                    "link": get_url(props.get("Link", {})),
-                    "deadline": get_rich_text(props.get("Deadline", {})),
-                    "comments": comments, # Include comments
-                    "notion_page_id": page["id"]
-                }
-                tasks.append(task)
-                
+            tasks = []
+            read_seq = self._comment_write_seq
+            async for page in self._iter_database_pages(**query):
+                if page.get("archived") or page.get("in_trash"):
+                    continue
+                tasks.append(self._page_to_task(page, read_seq))
             return tasks
         except Exception as e:
             logger.error(f"Failed to fetch tasks from Notion: {e}")
             raise e
 
+    # --- Comments ------------------------------------------------------
+
+    def _join_rich_text(self, prop):
+        return "".join(t.get("text", {}).get("content", "") for t in prop.get("rich_text", []))
+
+    def _split_rich_text(self, text):
+        """
+        Splits comment text into rich_text segments of at most RICH_TEXT_MAX_CHARS, breaking
+        between lines where possible. Past RICH_TEXT_MAX_SEGMENTS the oldest lines are dropped.
+        """
+        segments, current = [], ""
+        for line in text.split("\n"):
+            piece = line if not current else "\n" + line
+            while len(current) + len(piece) > RICH_TEXT_MAX_CHARS:
+                if current:
+                    segments.append(current)
+                    current, piece = "", piece
+                else:
+                    segments.append(piece[:RICH_TEXT_MAX_CHARS])
+                    piece = piece[RICH_TEXT_MAX_CHARS:]
+            current += piece
+        if current:
+            segments.append(current)
+        if len(segments) > RICH_TEXT_MAX_SEGMENTS:
+            logger.warning(f"Comment thread exceeds {RICH_TEXT_MAX_SEGMENTS} segments; dropping the oldest.")
+            segments = segments[-RICH_TEXT_MAX_SEGMENTS:]
+        return [{"text": {"content": segment}} for segment in segments]
+
+    def _cache_comments(self, page_id, text, edited, read_seq=None):
+        """
+        Caches a page's comment text. read_seq is _comment_write_seq when the read started; the
+        text is dropped if a local write to the page finished since then, since the read may
+        predate it (last_edited_time is minute-granular, so it cannot tell). None means the
+        text is our own write.
+        """
+        if read_seq is not None and self._comment_written.get(page_id, 0) > read_seq:
+            return
+        self._comment_cache[page_id] = {"text": text, "edited": edited, "fetched": time.time()}
+
+    def _mark_comments_written(self, page_id):
+        self._comment_write_seq += 1
+        self._comment_written[page_id] = self._comment_write_seq
+
+    def _cached_comments(self, page_id):
+        """Cached comment text if fetched recently enough to trust, else None."""
+        cached = self._comment_cache.get(page_id)
+        if cached and time.time() - cached["fetched"] < self.comment_cache_seconds:
+            self.comment_cache_hits += 1
+            return cached["text"]
+        self.comment_cache_misses += 1
+        return None
+
+    async def _load_comments(self, page_id):
+        """Comment text from the cache, or from Notion (and cached). Call with the page lock held."""
+        text = self._cached_comments(page_id)
+        if text is None:
+            read_seq = self._comment_write_seq
+            page = await self._call(self._get_client().pages.retrieve, page_id=page_id)
+            text = self._join_rich_text(page.get("properties", {}).get("AgentComments", {}))
+            self._cache_comments(page_id, text, page.get("last_edited_time", ""), read_seq)
+        return text
+
+    def _comment_lock(self, page_id):
+        if page_id not in self._comment_locks:
+            self._comment_locks[page_id] = asyncio.Lock()
+        return self._comment_locks[page_id]
+
     @retry_with_backoff(retries=3, backoff_in_seconds=1)
     async def get_comments(self, page_id):
-        """Fetches comments from the AgentComments text property."""
+        """Returns comments from the AgentComments text property (cached per page)."""
         if not self._get_client() or not page_id: return []
 
         try:
-            page = await self._get_client().pages.retrieve(page_id)
-            props = page.get("properties", {})
-            rich_text = props.get("AgentComments", {}).get("rich_text", [])
-            full_text = "".join([t.get("text", {}).get("content", "") for t in rich_text])
-            
-            return self._parse_comments_text(full_text)
-            
+            async with self._comment_lock(page_id):
+                return self._parse_comments_text(await self._load_comments(page_id))
         except Exception as e:
             logger.error(f"Failed to fetch comments: {e}")
             raise e
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
-    async def add_comment(self, page_id, text, sender="Unknown"):
-        """Appends a comment to the AgentComments property."""
-        if not self._get_client() or not page_id: return None
-        
-        try:
-            import datetime
-            import uuid
-            
-            # timestamp
-            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            comment_id = str(uuid.uuid4())[:8] # Short ID
-            
-            new_line = f"[{comment_id}] {now} {sender}: {text}"
-            
-            # 1. Get existing text
-            page = await self._get_client().pages.retrieve(page_id)
-            props = page.get("properties", {})
-            rich_text = props.get("AgentComments", {}).get("rich_text", [])
-            current_text = "".join([t.get("text", {}).get("content", "") for t in rich_text])
-            
-            updated_text = current_text + ("\n" if current_text else "") + new_line
-            
-            # 3. Update
-            await self._get_client().pages.update(
-                page_id=page_id,
-                properties={
-                    "AgentComments": {
-                        "rich_text": [{"text": {"content": updated_text[:2000]}}]
-                    }
-                }
-            )
-            logger.info(f"Added comment to {page_id}: {text}")
-            return {
-                "id": comment_id,
-                "timestamp": now,
-                "sender": sender,
-                "text": text
-            }
-        except Exception as e:
-            logger.error(f"Failed to add comment: {e}")
-            raise e
+    def format_comment_line(self, comment):
+        """Serializes a comment into the AgentComments line format parsed by _parse_comments_text."""
+        return f"[{comment['id']}] {comment['timestamp']} {comment['sender']}: {comment['text']}"
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
-    async def delete_comment(self, page_id, comment_id):
-        """Removes a comment line by ID."""
+    async def apply_comment_changes(self, page_id, added=(), deleted=()):
+        """
+        Appends comment lines and removes lines by comment ID with a single write of the
+        AgentComments property (retried by the outbox). The page's comments are locked for the
+        read-modify-write, and the read comes from the cache when it is current.
+        Returns False if nothing changed.
+        """
         if not self._get_client() or not page_id: return False
         
         try:
-            # 1. Get existing text
-            page = await self._get_client().pages.retrieve(page_id)
-            props = page.get("properties", {})
-            rich_text = props.get("AgentComments", {}).get("rich_text", [])
-            current_text = "".join([t.get("text", {}).get("content", "") for t in rich_text])
-            
-            if not current_text: return False
-            
-            # 2. Filter lines
-            lines = current_text.split("\n")
-            new_lines = [line for line in lines if f"[{comment_id}]" not in line]
-            
-            if len(lines) == len(new_lines):
-                logger.warning(f"Comment {comment_id} not found.")
-                return False
-                
-            updated_text = "\n".join(new_lines)
-            
-            # 3. Update
-            await self._get_client().pages.update(
-                page_id=page_id,
-                properties={
-                    "AgentComments": {
-                        "rich_text": [{"text": {"content": updated_text[:2000]}}]
-                    }
-                }
-            )
-            logger.info(f"Deleted comment {comment_id} from {page_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to delete comment: {e}")
-            raise e
+            async with self._comment_lock(page_id):
+                # 1. Get existing text
+                current_text = await self._load_comments(page_id)
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
-    async def update_task_priority(self, page_id, priority):
-        """Updates the Priority number property asynchronously."""
-        if not self._get_client() or not page_id: return False
+                # 2. Filter deleted lines, append new ones
+                lines = [line for line in current_text.split("\n") if line]
+                new_lines = [line for line in lines if not any(f"[{comment_id}]" in line for comment_id in deleted)]
+                if deleted and len(lines) == len(new_lines) and not added:
+                    logger.warning(f"Comments {', '.join(deleted)} not found.")
+                    return False
+                new_lines += [self.format_comment_line(comment) for comment in added]
+                rich_text = self._split_rich_text("\n".join(new_lines))
 
-        try:
-            await self._get_client().pages.update(
-                page_id=page_id,
-                properties={
-                    "Priority": {
-                        "number": int(priority)
-                    }
-                }
-            )
-            logger.info(f"Updated Notion Page {page_id} Priority to {priority}")
+                # 3. Update
+                try:
+                    page = await self._call(
+                        self._get_client().pages.update,
+                        page_id=page_id,
+                        properties={"AgentComments": {"rich_text": rich_text}}
+                    )
+                except BaseException:
+                    # Page state unknown: re-read next time, and drop reads racing the write
+                    self._mark_comments_written(page_id)
+                    self._comment_cache.pop(page_id, None)
+                    raise
+                self._mark_comments_written(page_id)
+                self._cache_comments(page_id, "".join(t["text"]["content"] for t in rich_text), page.get("last_edited_time", ""))
+
+            logger.info(f"Updated comments on {page_id} (+{len(added)} / -{len(deleted)})")
             return True
+            
         except Exception as e:
-            logger.error(f"Failed to update Notion Page Priority: {e}")
+            logger.error(f"Failed to update comments: {e}")
             raise e
+
+    def get_comment_cache_stats(self):
+        return {
+            "pages": len(self._comment_cache),
+            "hits": self.comment_cache_hits,
+            "misses": self.comment_cache_misses
+        }
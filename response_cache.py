@@ -0,0 +1,106 @@
+import gzip
+import hashlib
+import inspect
+import json
+import logging
+from collections import OrderedDict
+
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """
+    Serialized dashboard API payloads, keyed by endpoint and rebuilt only when the version of
+    the data behind them changes (mutations bump those versions, which invalidates the entry).
+    Responses carry a strong ETag (a hash of the body, so it stays valid across restarts) and
+    a matching If-None-Match gets an empty 304. Bodies over gzip_min_bytes are stored gzipped
+    as well and served that way to clients that accept it.
+    """
+    def __init__(self, gzip_min_bytes=1024, max_entries=256):
+        self.gzip_min_bytes = gzip_min_bytes
+        self.max_entries = max_entries  # Keys include query strings, so evict least recently used
+        self.entries = OrderedDict()  # key -> {"version", "etag", "body", "gzip"}
+
+        # Counters
+        self.hits = 0
+        self.builds = 0
+        self.not_modified = 0
+        self.gzipped = 0
+        self.bytes_saved = 0  # By gzip, across responses actually sent
+
+    async def respond(self, request, key, version, build):
+        """
+        Serves the cached payload for key, calling build() (sync or async) to refresh it when
+        version differs from the cached one.
+        """
+        entry = self.entries.get(key)
+        if entry and entry["version"] == version:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        else:
+            payload = build()
+            if inspect.isawaitable(payload):
+                payload = await payload
+            entry = self._store(key, version, payload)
+
+        accepts_gzip = "gzip" in request.headers.get("accept-encoding", "")
+        use_gzip = accepts_gzip and entry["gzip"] is not None
+        # Strong ETags differ per encoding; either one means the client has this version
+        etag = f'"{entry["etag"]}-gz"' if use_gzip else f'"{entry["etag"]}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+        if self._matches(request.headers.get("if-none-match"), entry["etag"]):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        if use_gzip:
+            self.gzipped += 1
+            self.bytes_saved += len(entry["body"]) - len(entry["gzip"])
+            return Response(entry["gzip"], media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+        return Response(entry["body"], media_type="application/json", headers=headers)
+
+    def _store(self, key, version, payload):
+        body = json.dumps(payload, separators=(",", ":"), default=str).encode()
+        entry = {
+            "version": version,
+            "etag": hashlib.sha1(body).hexdigest()[:20],
+            "body": body,
+            "gzip": gzip.compress(body, compresslevel=6) if len(body) >= self.gzip_min_bytes else None
+        }
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.builds += 1
+        return entry
+
+    def _matches(self, if_none_match, etag):
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        for tag in if_none_match.split(","):
+            tag = tag.strip().removeprefix("W/").strip('"')
+            if tag in (etag, f"{etag}-gz"):
+                return True
+        return False
+
+    def invalidate(self, key=None):
+        """Drops one entry (or all), for data that changes without a version bump."""
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key, None)
+
+    def get_stats(self):
+        requests = self.hits + self.builds
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "builds": self.builds,
+            "hit_rate": round(self.hits / requests, 3) if requests else None,
+            "not_modified": self.not_modified,
+            "gzipped": self.gzipped,
+            "gzip_bytes_saved": self.bytes_saved
+        }
@@ -0,0 +1,250 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+CATCH_UP_POLICIES = ("once", "skip")  # once: run a missed job immediately; skip: wait for the next slot
+
+class CronSchedule:
+    """
+    Five-field cron expression (minute hour day-of-month month day-of-week, local time).
+    Fields accept *, numbers, lists, ranges and steps ("*/15", "1-5", "0,30"). Day of week
+    is 0-6 with 0 = Sunday; as in cron, if both day fields are restricted either may match.
+    """
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expr!r}")
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(field, lo, hi) for field, (lo, hi) in zip(fields, self.RANGES)
+        )
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field, lo, hi):
+        values = set()
+        for part in field.split(","):
+            base, _, step = part.partition("/")
+            if base == "*":
+                start, end = lo, hi
+            elif "-" in base:
+                start, end = (int(v) for v in base.split("-"))
+            else:
+                start = int(base)
+                end = hi if step else start
+            if start < lo or end > hi or start > end:
+                raise ValueError(f"Cron field {field!r} out of range {lo}-{hi}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return sorted(values)
+
+    def _day_matches(self, day):
+        if day.month not in self.months:
+            return False
+        dom = day.day in self.days
+        dow = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return dom and dow
+        return dom or dow
+
+    def next_after(self, ts):
+        """Epoch seconds of the first matching minute strictly after ts."""
+        start = datetime.fromtimestamp(ts).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(366 * 5):  # Covers any valid expression (e.g. Feb 29)
+            if self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate.timestamp()
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression never fires: {self.expr!r}")
+
+class IntervalSchedule:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def next_after(self, ts):
+        return ts + self.seconds
+
+class Job:
+    def __init__(self, name, schedule, func, catch_up, jitter, retry_seconds):
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"Unknown catch-up policy: {catch_up}")
+        self.name = name
+        self.schedule = schedule
+        self.func = func
+        self.catch_up = catch_up
+        self.jitter = jitter
+        self.retry_seconds = retry_seconds  # Re-run sooner than the schedule after a failure
+
+        self.last_run = None  # Epoch seconds, persisted
+        self.next_run = None  # Scheduled (pre-jitter) fire time
+        self.fire_at = None  # next_run + jitter
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped_overlaps = 0
+        self.last_duration = None
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.last_lag = None
+        self.max_lag = 0.0
+
+class Scheduler:
+    """
+    Single in-process scheduler: a heap of next fire times, one sleeping loop.
+    Cron and interval jobs persist their last run so restarts neither repeat nor silently
+    drop runs; a run missed while the process was down follows the job's catch-up policy.
+    """
+    def __init__(self, state_file="scheduler_state.json"):
+        self.state_file = state_file
+        self.jobs = {}
+        self._heap = []  # (fire_at, seq, name)
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._tasks = set()  # Running job tasks (the loop only keeps weak references)
+        self._state = self._load_state()
+
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.error(f"Failed to load scheduler state: {e}")
+        return {}
+
+    def _save_state(self):
+        self._state.update({name: job.last_run for name, job in self.jobs.items() if job.last_run})
+        try:
+            tmp_file = self.state_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(self._state, f, indent=2)
+            os.replace(tmp_file, self.state_file)
+        except Exception as e:
+            logger.error(f"Failed to save scheduler state: {e}")
+
+    def add_cron(self, name, expr, func, catch_up="once", jitter=0, retry_seconds=None):
+        """Registers an async callable to run on a cron expression."""
+        return self._add(Job(name, CronSchedule(expr), func, catch_up, jitter, retry_seconds))
+
+    def add_interval(self, name, seconds, func, catch_up="once", jitter=0, retry_seconds=None):
+        """Registers an async callable to run every `seconds` (first run immediately if it never ran)."""
+        return self._add(Job(name, IntervalSchedule(seconds), func, catch_up, jitter, retry_seconds))
+
+    def _add(self, job):
+        job.last_run = self._state.get(job.name)
+        now = time.time()
+        if job.last_run is None:
+            # Interval jobs start right away; cron jobs wait for their first slot
+            due = now if isinstance(job.schedule, IntervalSchedule) else job.schedule.next_after(now)
+        else:
+            due = job.schedule.next_after(job.last_run)
+            if due <= now:
+                if job.catch_up == "once":
+                    logger.info(f"Job {job.name} missed a run at {datetime.fromtimestamp(due):%Y-%m-%d %H:%M}; catching up.")
+                    due = now
+                else:
+                    due = self._next_slot(job, due, now)
+        self.jobs[job.name] = job
+        self._push(job, due)
+        return job
+
+    def _next_slot(self, job, due, now):
+        while due <= now:
+            due = job.schedule.next_after(due)
+        return due
+
+    def _push(self, job, due):
+        job.next_run = due
+        job.fire_at = due + (random.uniform(0, job.jitter) if job.jitter else 0)
+        self._seq += 1
+        heapq.heappush(self._heap, (job.fire_at, self._seq, job.name))
+        self._wakeup.set()
+
+    async def run(self):
+        """Main loop: sleeps until the earliest fire time (or a newly added job)."""
+        logger.info(f"Scheduler started with jobs: {', '.join(self.jobs) or 'none'}")
+        while True:
+            self._wakeup.clear()
+            timeout = max(self._heap[0][0] - time.time(), 0) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+                continue  # Heap changed; recompute the sleep
+            except asyncio.TimeoutError:
+                pass
+
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, seq, name = heapq.heappop(self._heap)
+                job = self.jobs.get(name)
+                if job is None or job.fire_at != fire_at:
+                    continue  # Stale entry (job re-scheduled)
+                self._fire(job, now)
+
+    def _fire(self, job, now):
+        job.last_lag = now - job.fire_at
+        job.max_lag = max(job.max_lag, job.last_lag)
+        if job.running:
+            job.skipped_overlaps += 1
+            logger.warning(f"Job {job.name} still running; skipping this run.")
+        else:
+            task = asyncio.create_task(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self._push(job, self._next_slot(job, job.schedule.next_after(job.next_run), now))
+
+    async def _execute(self, job):
+        job.running = True
+        job.last_run = time.time()
+        self._save_state()
+        start = time.perf_counter()
+        try:
+            await job.func()
+        except Exception as e:
+            job.failures += 1
+            logger.error(f"Job {job.name} failed: {e}")
+            if job.retry_seconds and time.time() + job.retry_seconds < job.next_run:
+                self._push(job, time.time() + job.retry_seconds)
+        finally:
+            job.running = False
+            job.runs += 1
+            job.last_duration = time.perf_counter() - start
+            job.total_duration += job.last_duration
+            job.max_duration = max(job.max_duration, job.last_duration)
+
+    def get_stats(self):
+        now = time.time()
+        overdue = [now - fire_at for fire_at, _, name in self._heap
+                   if fire_at <= now and self.jobs[name].fire_at == fire_at]
+        return {
+            "queue_lag_seconds": round(max(overdue, default=0.0), 3),
+            "jobs": {
+                name: {
+                    "schedule": job.schedule.expr if isinstance(job.schedule, CronSchedule) else f"every {job.schedule.seconds}s",
+                    "next_run": datetime.fromtimestamp(job.next_run).isoformat(timespec="seconds") if job.next_run else None,
+                    "last_run": datetime.fromtimestamp(job.last_run).isoformat(timespec="seconds") if job.last_run else None,
+                    "running": job.running,
+                    "runs": job.runs,
+                    "failures": job.failures,
+                    "skipped_overlaps": job.skipped_overlaps,
+                    "last_duration_seconds": round(job.last_duration, 3) if job.last_duration is not None else None,
+                    "avg_duration_seconds": round(job.total_duration / job.runs, 3) if job.runs else None,
+                    "max_duration_seconds": round(job.max_duration, 3),
+                    "last_lag_seconds": round(job.last_lag, 3) if job.last_lag is not None else None,
+                    "max_lag_seconds": round(job.max_lag, 3)
+                }
+                for name, job in self.jobs.items()
+            }
+        }
@@ -1,12 +1,26 @@
 from fastapi import FastAPI, Request
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import logging
+from utils import get_retry_stats
+from http_pool import http_pool
+from response_cache import ResponseCache
+from event_bus import event_bus
+import metrics
+from config import RESPONSE_GZIP_MIN_BYTES, SSE_HEARTBEAT_SECONDS
 
 # We will inject the TaskManager instance from main.py
 task_manager = None
 notification_callback = None
+chat_history = None
+message_pipeline = None
+analysis_batcher = None
+agent = None
+triage = None
+discussion_buffer = None
+digester = None
+job_scheduler = None
 
 app = FastAPI()
 app.add_middleware(
@@ -19,20 +33,65 @@ app.add_middleware(
 templates = Jinja2Templates(directory="templates")
 logger = logging.getLogger(__name__)
 
+# Serialized GET payloads, keyed by the version of the data behind them (see response_cache.py)
+response_cache = ResponseCache(gzip_min_bytes=RESPONSE_GZIP_MIN_BYTES)
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("dashboard.html", {"request": request})
 
+def _cache_key(name, request):
+    """Response cache key for a paginated endpoint: its name plus the normalized query string."""
+    return name + "?" + "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+
 @app.get("/api/tasks")
-async def get_tasks():
+async def get_tasks(request: Request, limit: int = 100, cursor: str = None, status: str = None,
+                    min_priority: int = None, max_priority: int = None, sender: str = None,
+                    since: str = None, until: str = None, q: str = None):
+    """
+    Tasks, most recently touched first: {"items": [...], "next_cursor": ...}. status takes a
+    comma-separated list; since/until are ISO timestamps (last edit); q matches the summary.
+    """
     if not task_manager:
-        return []
-    return await task_manager.get_tasks()
+        return {"items": [], "next_cursor": None}
+    if cursor is not None and not cursor.isdigit():
+        return JSONResponse(status_code=400, content={"error": "Invalid cursor"})
+
+    async def build():
+        tasks, next_cursor = await task_manager.query_tasks(
+            limit=limit, cursor=cursor, statuses=[x.strip() for x in status.split(",") if x.strip()] if status else None,
+            min_priority=min_priority, max_priority=max_priority, sender=sender, since=since, until=until, text=q)
+        return {"items": tasks, "next_cursor": next_cursor}
+    return await response_cache.respond(request, _cache_key("tasks", request), task_manager.mirror.version, build)
+
+@app.get("/api/events")
+async def stream_events(request: Request):
+    """Server-Sent Events: live task/audit/digest deltas (see event_bus.py). Resumes from Last-Event-ID."""
+    last_id = request.headers.get("last-event-id")
+    sub = event_bus.subscribe(int(last_id) if last_id and last_id.isdigit() else None)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                event = await sub.get(timeout=SSE_HEARTBEAT_SECONDS)
+                # Comment lines keep proxies from closing an idle stream
+                yield event_bus.format_sse(event) if event else ": ping\n\n"
+        finally:
+            sub.close()
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _task_not_found():
+    return JSONResponse(status_code=404, content={"error": "Task not found"})
 
 @app.post("/api/done/{task_id}")
 async def mark_done(task_id: str):
     if not task_manager:
         return JSONResponse(status_code=500, content={"error": "TaskManager not initialized"})
+    if not await task_manager.get_task(task_id):
+        return _task_not_found()
     
     # SSOT: Direct call
     await task_manager.mark_done(task_id)
@@ -47,6 +106,8 @@ async def mark_done(task_id: str):
 async def reject_task(task_id: str):
     if not task_manager:
         return JSONResponse(status_code=500, content={"error": "TaskManager not initialized"})
+    if not await task_manager.get_task(task_id):
+        return _task_not_found()
     
     # SSOT: Direct call
     await task_manager.reject_task(task_id)
@@ -56,21 +117,24 @@ async def reject_task(task_id: str):
 async def reopen_task(task_id: str):
     if not task_manager:
         return JSONResponse(status_code=500, content={"error": "TaskManager not initialized"})
+    if not await task_manager.get_task(task_id):
+        return _task_not_found()
     
     await task_manager.reopen_task(task_id)
     return {"status": "success", "task": task_id}
 
 @app.get("/api/discussions/history")
-async def get_discussion_history():
-    from discussion_buffer import DiscussionBuffer
-    db = DiscussionBuffer() # It loads from disk, so fresh instance is fine or can inject
-    return db.get_history()
+async def get_discussion_history(request: Request):
+    # Injected listener instance: a second DiscussionBuffer would compact the shared append log
+    if not discussion_buffer: return []
+    return await response_cache.respond(request, "discussions_history", discussion_buffer.history_version,
+                                        discussion_buffer.get_history)
 
 @app.get("/api/discussions/today")
-async def get_today_discussion():
-    from discussion_buffer import DiscussionBuffer
-    db = DiscussionBuffer()
-    return db.get_grouped_text() or "No discussions yet."
+async def get_today_discussion(request: Request):
+    if not discussion_buffer: return "No discussions yet."
+    return await response_cache.respond(request, "discussions_today", discussion_buffer.version,
+                                        lambda: discussion_buffer.get_grouped_text() or "No discussions yet.")
 
 from pydantic import BaseModel
 class CommentRequest(BaseModel):
@@ -111,17 +175,99 @@ async def update_priority(task_id: str, request: dict):
     priority = request.get("priority")
     if priority is None:
         return JSONResponse(status_code=400, content={"error": "Priority missing"})
+    try:
+        priority = int(priority)
+    except (TypeError, ValueError):
+        return JSONResponse(status_code=400, content={"error": "Priority must be an integer"})
+    if not await task_manager.get_task(task_id):
+        return _task_not_found()
         
-    success = await task_manager.update_priority(task_id, priority)
-    if success:
-        return {"status": "success", "task": task_id, "priority": priority}
-    return JSONResponse(status_code=500, content={"error": "Failed to update priority"})
+    await task_manager.update_priority(task_id, priority)
+    return {"status": "success", "task": task_id, "priority": priority}
 
 
+@app.get("/api/stats")
+async def get_stats():
+    if not task_manager: return {}
+    stats = {
+        "task_mirror": task_manager.get_cache_stats(),
+        "notion_outbox": task_manager.outbox.get_stats(),
+        "notion_comments": task_manager.notion_sync.get_comment_cache_stats()
+    }
+    if chat_history:
+        stats["chat_history"] = chat_history.get_stats()
+    if message_pipeline:
+        stats["pipeline"] = message_pipeline.get_stats()
+    if analysis_batcher:
+        stats["analysis_batcher"] = analysis_batcher.get_stats()
+    if agent:
+        stats["prompt"] = agent.get_prompt_stats()
+        if agent.analysis_cache:
+            stats["analysis_cache"] = agent.analysis_cache.get_stats()
+    if triage:
+        stats["triage"] = triage.get_stats()
+    if digester:
+        stats["digest"] = digester.get_stats()
+    if job_scheduler:
+        stats["scheduler"] = job_scheduler.get_stats()
+    stats["resilience"] = get_retry_stats()
+    stats["connections"] = http_pool.get_stats()
+    stats["response_cache"] = response_cache.get_stats()
+    stats["events"] = event_bus.get_stats()
+    if agent:
+        stats["connections"]["gemini_warm_up_seconds"] = agent.warm_up_seconds
+    return stats
+
+def _hit_ratio(hits, misses):
+    return hits / (hits + misses) if hits + misses else None
+
+def _cache_hit_ratios():
+    ratios = {("response",): _hit_ratio(response_cache.hits, response_cache.builds)}
+    if task_manager:
+        mirror = task_manager.mirror
+        ratios[("task_mirror",)] = _hit_ratio(mirror.hits, mirror.misses)
+        sync = task_manager.notion_sync
+        ratios[("notion_comments",)] = _hit_ratio(sync.comment_cache_hits, sync.comment_cache_misses)
+    if chat_history:
+        ratios[("chat_history",)] = _hit_ratio(chat_history.hits, chat_history.misses)
+    if agent and agent.analysis_cache:
+        ratios[("analysis",)] = _hit_ratio(agent.analysis_cache.hits, agent.analysis_cache.misses)
+    return ratios
+
+# Gauges are read at scrape time from the injected components
+metrics.Gauge("agent_pipeline_depth", "Messages queued or being processed.",
+              lambda: message_pipeline.get_stats()["depth"] if message_pipeline else None)
+metrics.Gauge("agent_notion_outbox_depth", "Notion writes waiting in the outbox.",
+              lambda: task_manager.outbox.size() if task_manager else None)
+metrics.Gauge("agent_llm_calls_in_flight", "Gemini requests awaiting a response.",
+              lambda: agent.llm_in_flight if agent else None)
+metrics.Gauge("agent_http_requests_in_flight", "Requests in flight on the shared HTTP pool.",
+              lambda: http_pool.transport.in_flight if http_pool.transport else None)
+metrics.Gauge("agent_event_subscribers", "Connected live event (SSE) clients.", lambda: len(event_bus.subscribers))
+metrics.Gauge("agent_cache_hit_ratio", "Hits / lookups per cache.", _cache_hit_ratios, labels=("cache",))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of the counters, gauges and stage latency histograms in metrics.py."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/audit")
-async def get_audit_log():
-    if not task_manager: return []
-    return await task_manager.get_audit_log()
+async def get_audit_log(request: Request, limit: int = 100, cursor: str = None, min_priority: int = None,
+                        max_priority: int = None, sender: str = None, since: str = None, until: str = None, q: str = None):
+    """
+    Audit entries, newest first: {"items": [...], "next_cursor": ...}. Priority is the evaluated
+    priority; q matches the message text or its summary.
+    """
+    if not task_manager: return {"items": [], "next_cursor": None}
+    if cursor is not None and not cursor.isdigit():
+        return JSONResponse(status_code=400, content={"error": "Invalid cursor"})
+
+    async def build():
+        entries, next_cursor = await task_manager.query_audit_log(
+            limit=limit, cursor=cursor, min_priority=min_priority, max_priority=max_priority,
+            sender=sender, since=since, until=until, text=q)
+        return {"items": entries, "next_cursor": next_cursor}
+    return await response_cache.respond(request, _cache_key("audit", request), task_manager.audit_store.version, build)
 
 class CreateTaskRequest(BaseModel):
     summary: str
@@ -0,0 +1,76 @@
+import sqlite3
+
+MAX_PAGE_SIZE = 1000
+
+def like_pattern(text):
+    """SQL LIKE pattern for a case-insensitive "contains" match (use with ESCAPE '\\')."""
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+class TaskIndex:
+    """
+    In-memory SQLite index over the task mirror for filtered, cursor-paginated queries.
+    Rows carry only the filterable columns; seq orders tasks most-recently-touched first
+    and doubles as the pagination cursor (stable while other tasks change).
+    """
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute(
+            "CREATE TABLE tasks (id TEXT PRIMARY KEY, seq INTEGER NOT NULL, status TEXT, priority INTEGER, "
+            "sender TEXT COLLATE NOCASE, edited TEXT, summary TEXT)"
+        )
+        self.conn.execute("CREATE INDEX tasks_seq ON tasks (seq)")
+        self.conn.execute("CREATE INDEX tasks_status ON tasks (status, seq)")
+        self.conn.execute("CREATE INDEX tasks_sender ON tasks (sender, seq)")
+        self.conn.execute("CREATE INDEX tasks_edited ON tasks (edited)")
+
+    def _row(self, task, seq, edited):
+        return (task["id"], seq, task.get("status"), task.get("priority"), task.get("sender") or "",
+                edited or task.get("last_edited_time") or "", task.get("summary") or "")
+
+    def rebuild(self, rows):
+        """Replaces the index with (task, seq) pairs."""
+        with self.conn:
+            self.conn.execute("DELETE FROM tasks")
+            self.conn.executemany("INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?)", [self._row(t, seq, None) for t, seq in rows])
+
+    def upsert(self, task, seq, edited=None):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?)", self._row(task, seq, edited))
+
+    def rename(self, old_id, new_id):
+        with self.conn:
+            self.conn.execute("UPDATE tasks SET id = ? WHERE id = ?", (new_id, old_id))
+
+    def remove(self, task_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def query(self, limit=100, cursor=None, statuses=None, min_priority=None, max_priority=None,
+              sender=None, since=None, until=None, text=None):
+        """
+        Returns (task ids, next cursor or None), most recently touched first. since/until compare
+        against last_edited_time (ISO strings, so a date prefix such as "2026-01-31" works).
+        """
+        where, params = [], []
+        if cursor is not None:
+            where.append("seq < ?"); params.append(int(cursor))
+        if statuses:
+            where.append(f"status IN ({','.join('?' * len(statuses))})"); params.extend(statuses)
+        if min_priority is not None:
+            where.append("priority >= ?"); params.append(min_priority)
+        if max_priority is not None:
+            where.append("priority <= ?"); params.append(max_priority)
+        if sender:
+            where.append("sender = ?"); params.append(sender)
+        if since:
+            where.append("edited >= ?"); params.append(since)
+        if until:
+            where.append("edited < ?"); params.append(until)
+        if text:
+            where.append("summary LIKE ? ESCAPE '\\'"); params.append(like_pattern(text))
+
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        sql = "SELECT id, seq FROM tasks" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY seq DESC LIMIT ?"
+        rows = self.conn.execute(sql, params + [limit + 1]).fetchall()
+        next_cursor = str(rows[limit - 1][1]) if len(rows) > limit else None
+        return [task_id for task_id, _ in rows[:limit]], next_cursor
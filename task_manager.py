@@ -1,16 +1,83 @@
 from datetime import datetime
+import asyncio
 import logging
+import time
+import uuid
 from notion_sync import NotionSync
+from notion_outbox import NotionOutbox, OutboxError
+from task_mirror import TaskMirror
+from audit_store import AuditStore
+from event_bus import event_bus
+from config import TASK_MIRROR_FILE, TASK_MIRROR_REFRESH_SECONDS, TASK_MIRROR_FULL_SYNC_SECONDS, AUDIT_LOG_DIR, AUDIT_SEGMENT_MAX_BYTES, AUDIT_COMPRESS_SEGMENTS, NOTION_OUTBOX_FILE
 
 logger = logging.getLogger(__name__)
 
 class TaskManager:
-    def __init__(self, storage_file="tasks.json"):
-        # Storage file argument kept for compatibility but ignored
+    def __init__(self, storage_file=None):
         self.notion_sync = NotionSync()
+        # Local write-through mirror of the Notion database (reads never hit Notion once warm)
+        self.mirror = TaskMirror(storage_file or TASK_MIRROR_FILE)
+        self.audit_store = AuditStore(AUDIT_LOG_DIR, max_segment_bytes=AUDIT_SEGMENT_MAX_BYTES, compress=AUDIT_COMPRESS_SEGMENTS)
+        # Writes are applied to the mirror immediately and reach Notion through the outbox
+        self.outbox = NotionOutbox(self.notion_sync, NOTION_OUTBOX_FILE, on_created=self._on_page_created, on_failed=self._on_write_failed)
+
+    async def _confirm(self, ticket, result):
+        """With wait=True, blocks until Notion confirmed the write; returns result, or a falsy value on failure."""
+        try:
+            await ticket
+            return result
+        except OutboxError:
+            return None if isinstance(result, dict) else False
+
+    def _publish_task(self, page_id):
+        task = self.mirror.get(page_id)
+        if task:
+            event_bus.publish("task.upsert", task)
+
+    def _on_page_created(self, local_id, page_id):
+        task = self.mirror.get(local_id)
+        self.mirror.rename(local_id, page_id)
+        if task:
+            self.notion_sync.link_index.add(task.get("link"), page_id)
+            event_bus.publish("task.rename", {"old_id": local_id, "new_id": page_id})
+
+    def _on_write_failed(self, kind, page_id, payload):
+        # Creates are rolled back locally; other writes are corrected by the next mirror refresh
+        if kind == "create":
+            self.mirror.remove(page_id)
+            self.notion_sync.link_index.remove(payload["task"].get("link"))
+            event_bus.publish("task.remove", {"id": page_id})
+        event_bus.publish("notice", {"text": f"Notion rejected a queued {kind} (page {page_id}).", "level": "error"})
+
+    def _apply_pending(self, kind, page_id, payload, publish=True):
+        """Applies a queued (not yet confirmed) write to the mirror and, with publish, announces the result."""
+        if kind == "create":
+            task = payload["task"]
+            self.mirror.upsert({
+                "id": page_id,
+                "summary": task["summary"],
+                "status": task.get("status", "active"),
+                "priority": task.get("priority", 0),
+                "sender": task.get("sender", ""),
+                "link": task.get("link") or "",
+                "deadline": task.get("deadline") or "",
+                "comments": [],
+                "notion_page_id": page_id
+            })
+        elif kind == "update":
+            self.mirror.update(page_id, **{k: int(v) if k == "priority" else v for k, v in payload.items()})
+        else:
+            task = self.mirror.get(page_id)
+            if task:
+                comments = [c for c in task.get("comments", []) if c.get("id") not in payload["delete"]]
+                known = {c.get("id") for c in comments}
+                comments = [c for c in reversed(payload["add"]) if c["id"] not in known] + comments
+                self.mirror.update(page_id, comments=comments)
+        if publish:
+            self._publish_task(page_id)
         
-    async def add_task(self, priority: int, summary: str, sender: str, link: str, deadline: str = None, user_id: int = None):
-        """Adds a new task directly to Notion."""
+    async def add_task(self, priority: int, summary: str, sender: str, link: str, deadline: str = None, user_id: int = None, wait: bool = False):
+        """Adds a new task locally and queues its creation in Notion (wait=True returns once it exists there)."""
         logger.info(f"Adding task to Notion: {summary}")
         
         task_data = {
@@ -35,36 +102,115 @@ class TaskManager:
                     "is_new": False
                 }
 
-        page_id = await self.notion_sync.create_task_page(task_data)
-        
-        # Return a mock task object for immediate UI feedback if needed, 
-        # though the dashboard should re-fetch.
-        return {
-            "id": page_id,
+        ticket = self.outbox.create(task_data)
+        self._apply_pending("create", ticket.page_id, {"task": task_data})
+        # Later messages with the same link deduplicate against the local id
+        self.notion_sync.link_index.add(link, ticket.page_id)
+
+        result = {
+            "id": ticket.page_id,
             "summary": summary,
             "priority": priority,
             "status": "active",
             "is_new": True
         }
+        if wait:
+            try:
+                result["id"] = await ticket
+            except OutboxError:
+                result["id"] = None
+        return result
 
-    async def mark_done(self, task_id: str):
-        """Updates Notion status to Done."""
+    async def _update(self, task_id, wait, **fields):
+        page_id = self.outbox.resolve(task_id)
+        ticket = self.outbox.update(page_id, **fields)
+        self._apply_pending("update", page_id, fields)
+        return await self._confirm(ticket, True) if wait else ticket
+
+    async def mark_done(self, task_id: str, wait: bool = False):
+        """Marks a task Done (queued for Notion)."""
         logger.info(f"Marking task done: {task_id}")
-        await self.notion_sync.update_task_status(task_id, 'done')
+        return await self._update(task_id, wait, status='done')
 
-    async def reject_task(self, task_id: str):
-        """Updates Notion status to Rejected."""
+    async def reject_task(self, task_id: str, wait: bool = False):
+        """Marks a task Rejected (queued for Notion)."""
         logger.info(f"Marking task rejected: {task_id}")
-        await self.notion_sync.update_task_status(task_id, 'rejected')
+        return await self._update(task_id, wait, status='rejected')
 
-    async def reopen_task(self, task_id: str):
-        """Updates Notion status to Active."""
+    async def reopen_task(self, task_id: str, wait: bool = False):
+        """Marks a task Active again (queued for Notion)."""
         logger.info(f"Reopening task: {task_id}")
-        await self.notion_sync.update_task_status(task_id, 'active')
+        return await self._update(task_id, wait, status='active')
 
     async def get_tasks(self):
-        """Fetches tasks directly from Notion."""
-        return await self.notion_sync.get_tasks()
+        """Returns tasks from the local mirror, syncing from Notion only when it is cold."""
+        if self.mirror.is_warm():
+            return self.mirror.get_all()
+
+        self.mirror.misses += 1
+        return await self.refresh()
+
+    async def query_tasks(self, limit=100, cursor=None, **filters):
+        """One page of tasks from the mirror's index (syncing first if it is cold); returns (tasks, next cursor)."""
+        if not self.mirror.is_warm():
+            self.mirror.misses += 1
+            await self.refresh()
+        return self.mirror.query(limit=limit, cursor=cursor, **filters)
+
+    async def refresh(self, full=None):
+        """
+        Re-syncs the local mirror with Notion. Incremental by default: only pages edited since
+        the mirror's watermark are fetched. A full sync (which also drops pages deleted in
+        Notion) runs when forced, on a cold mirror, or every TASK_MIRROR_FULL_SYNC_SECONDS.
+        """
+        if full is None:
+            since_full = time.time() - (self.mirror.last_full_refresh or 0)
+            full = not self.mirror.watermark or since_full >= TASK_MIRROR_FULL_SYNC_SECONDS
+
+        if full:
+            tasks = await self.notion_sync.get_tasks()
+            self.mirror.replace_all(tasks)
+        else:
+            tasks = await self.notion_sync.get_tasks(edited_since=self.mirror.watermark)
+            self.mirror.merge(tasks)
+        # Writes still in the outbox are newer than what Notion returned
+        for kind, page_id, payload in self.outbox.pending():
+            self._apply_pending(kind, page_id, payload, publish=False)
+        # Dashboards refetch after a full sync (it may drop pages); incremental changes go out as deltas
+        if full:
+            event_bus.publish("tasks.reset")
+        else:
+            for task in tasks:
+                self._publish_task(task["id"])
+        # Pages created directly in Notion also become visible to deduplication
+        self.notion_sync.link_index.add_many([(t["link"], t["id"]) for t in tasks if t.get("link")])
+        logger.info(f"Task mirror refreshed ({'full' if full else 'incremental'}, {len(tasks)} tasks fetched).")
+        return self.mirror.get_all(count=False)
+
+    async def warm_link_index(self):
+        """Seeds the deduplication link index at startup so the first message doesn't wait on the crawl."""
+        try:
+            await self.notion_sync.ensure_link_index()
+        except Exception as e:
+            logger.warning(f"Link index seeding failed; the first lookup will retry: {e}")
+
+    async def start_refresh_loop(self, interval=TASK_MIRROR_REFRESH_SECONDS):
+        """Background loop keeping the mirror in sync with edits made directly in Notion."""
+        logger.info(f"Task mirror refresh loop started (every {interval}s).")
+        while True:
+            try:
+                await self.refresh()
+                await asyncio.sleep(interval)
+            except asyncio.CancelledError:
+                logger.info("Task mirror refresh loop stopped.")
+                break
+            except Exception as e:
+                logger.error(f"Task mirror refresh failed: {e}")
+                await asyncio.sleep(interval)
+
+    def get_cache_stats(self):
+        """Returns hit/miss and staleness counters for the task mirror."""
+        return self.mirror.get_stats()
 
     async def get_recent_done_tasks(self, limit: int = 5):
         """Returns most recently completed tasks from Notion."""
@@ -113,54 +259,64 @@ class TaskManager:
             "deadline_tasks": deadline_tasks
         }
 
-    async def add_comment(self, task_id, text, sender):
-        """Adds a comment to a task."""
-        return await self.notion_sync.add_comment(task_id, text, sender)
+    async def add_comment(self, task_id, text, sender, wait: bool = False):
+        """Adds a comment to a task (queued for Notion) and returns it."""
+        comment = {
+            "id": str(uuid.uuid4())[:8],  # Short ID
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "sender": sender,
+            "text": text
+        }
+        page_id = self.outbox.resolve(task_id)
+        ticket = self.outbox.add_comment(page_id, comment)
+        self._apply_pending("comments", page_id, {"add": [comment], "delete": []})
+        return await self._confirm(ticket, comment) if wait else comment
+
+    async def get_task(self, task_id):
+        """Returns a task (by page ID or a queued create's temporary ID), or None if unknown."""
+        if not self.mirror.is_warm():
+            await self.refresh()
+        return self.mirror.get(self.outbox.resolve(task_id))
 
     async def get_comments(self, task_id):
-        """Fetches comments for a task."""
-        return await self.notion_sync.get_comments(task_id)
+        """Fetches comments for a task (from the mirror while writes to it are queued)."""
+        page_id = self.outbox.resolve(task_id)
+        task = self.mirror.get(page_id)
+        if task and self.outbox.has_pending(page_id):
+            return task.get("comments", [])
+        return await self.notion_sync.get_comments(page_id)
 
-    async def delete_comment(self, task_id, comment_id):
-        """Deletes a comment from a task."""
-        return await self.notion_sync.delete_comment(task_id, comment_id)
+    async def delete_comment(self, task_id, comment_id, wait: bool = False):
+        """Deletes a comment from a task (queued for Notion)."""
+        page_id = self.outbox.resolve(task_id)
+        task = self.mirror.get(page_id)
+        if task and comment_id not in {c.get("id") for c in task.get("comments", [])}:
+            return False
+        ticket = self.outbox.delete_comment(page_id, comment_id)
+        self._apply_pending("comments", page_id, {"add": [], "delete": [comment_id]})
+        return await self._confirm(ticket, True) if wait else True
 
-    async def update_priority(self, task_id, priority):
-        """Updates the priority of a task."""
-        return await self.notion_sync.update_task_priority(task_id, priority)
+    async def update_priority(self, task_id, priority, wait: bool = False):
+        """Updates the priority of a task (queued for Notion)."""
+        return await self._update(task_id, wait, priority=int(priority))
 
     async def log_audit(self, message_data, evaluation):
-        """Logs an AI evaluation to a local JSON file for auditing."""
-        import json
-        
+        """Appends an AI evaluation to the local audit log."""
         entry = {
             "timestamp": datetime.now().isoformat(),
             "sender": message_data.get("sender"),
             "text": message_data.get("text"),
             "evaluation": evaluation
         }
-        
-        # Load existing log
-        log_file = "audit_log.json"
-        try:
-            with open(log_file, 'r') as f:
-                logs = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            logs = []
-            
-        logs.insert(0, entry)
-        # Keep last 500 entries
-        logs = logs[:500]
-        
-        with open(log_file, 'w') as f:
-            json.dump(logs, f, indent=2)
+        self.audit_store.append(entry)
+        event_bus.publish("audit.append", entry)
 
-    async def get_audit_log(self, limit=100):
-        """Returns the audit log."""
-        import json
-        try:
-            with open("audit_log.json", 'r') as f:
-                logs = json.load(f)
-                return logs[:limit]
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+    async def get_audit_log(self, limit=100, since=None):
+        """Returns audit entries, newest first. With since, only entries newer than that timestamp."""
+        if since:
+            return self.audit_store.since(since, limit=limit)
+        return self.audit_store.newest(limit)
+
+    async def query_audit_log(self, limit=100, cursor=None, **filters):
+        """One page of audit entries, newest first (see AuditStore.query); returns (entries, next cursor)."""
+        return self.audit_store.query(limit=limit, cursor=cursor, **filters)
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from config import TASK_MIRROR_SAVE_DELAY_MS
+from task_index import TaskIndex
+
+logger = logging.getLogger(__name__)
+
+class TaskMirror:
+    """
+    In-process copy of the Notion task database, persisted to a local JSON file.
+    Tasks are kept most-recently-touched first, matching Notion's last_edited_time ordering.
+    Changes made within save_delay_ms of each other are saved with one (atomic) file write.
+    """
+    def __init__(self, storage_file="tasks.json", save_delay_ms=TASK_MIRROR_SAVE_DELAY_MS):
+        self.storage_file = storage_file
+        self.save_delay = save_delay_ms / 1000
+        self._save_handle = None
+        self.tasks = {}  # task id -> task dict, oldest first (insertion order)
+        self.last_refresh = None  # epoch seconds of the last sync with Notion
+        self.last_full_refresh = None  # epoch seconds of the last full (non-incremental) sync
+        self.watermark = None  # newest last_edited_time seen, for incremental syncs
+        self.version = 0  # Bumped on every content change (dashboard response cache key)
+        self._snapshot = None
+        self.index = TaskIndex()  # Filtered, paginated queries
+        self._seq = 0  # Touch counter: higher = more recently touched
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.incremental_refreshes = 0
+        self.write_throughs = 0
+        self.saves = 0
+
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.storage_file):
+            return
+        try:
+            with open(self.storage_file, 'r') as f:
+                data = json.load(f)
+            # Older tasks.json files were a bare list; those are not trusted as a mirror.
+            if isinstance(data, dict):
+                self._replace(data.get("tasks", []))
+                self.last_refresh = data.get("last_refresh")
+                self.last_full_refresh = data.get("last_full_refresh", self.last_refresh)
+                self.watermark = data.get("watermark")
+                logger.info(f"Loaded {len(self.tasks)} tasks from local mirror.")
+        except Exception as e:
+            logger.error(f"Failed to load task mirror: {e}")
+
+    def _save(self):
+        """Schedules a save at the end of the current window (or saves now outside the event loop)."""
+        if self._save_handle:
+            return
+        try:
+            loop = asyncio.get_running_loop() if self.save_delay > 0 else None
+        except RuntimeError:
+            loop = None
+        if loop:
+            self._save_handle = loop.call_later(self.save_delay, self.flush)
+        else:
+            self.flush()
+
+    def flush(self):
+        """Writes the mirror to disk now: to a temp file, then swapped in so a crash can't truncate it."""
+        if self._save_handle:
+            self._save_handle.cancel()
+            self._save_handle = None
+        tmp_file = self.storage_file + ".tmp"
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump({
+                    "last_refresh": self.last_refresh,
+                    "last_full_refresh": self.last_full_refresh,
+                    "watermark": self.watermark,
+                    "tasks": self.get_all(count=False)
+                }, f)
+            os.replace(tmp_file, self.storage_file)
+            self.saves += 1
+        except Exception as e:
+            logger.error(f"Failed to save task mirror: {e}")
+
+    def close(self):
+        """Writes pending changes (call on shutdown)."""
+        if self._save_handle:
+            self.flush()
+
+    def _replace(self, tasks):
+        """Rebuilds the mirror from a newest-first task list."""
+        self.tasks = {t["id"]: t for t in reversed(tasks) if t.get("id")}
+        self._seq = len(self.tasks)
+        self.index.rebuild(zip(self.tasks.values(), range(1, self._seq + 1)))
+        self._changed()
+
+    def _changed(self):
+        self._snapshot = None
+        self.version += 1
+
+    def is_warm(self):
+        """True once the mirror holds a sync from Notion (this run or a previous one)."""
+        return self.last_refresh is not None
+
+    def get_all(self, count=True):
+        """Returns all tasks, most recently touched first, as a tuple shared by callers until the next change."""
+        if count:
+            self.hits += 1
+        if self._snapshot is None:
+            self._snapshot = tuple(reversed(self.tasks.values()))
+        return self._snapshot
+
+    def get(self, task_id):
+        return self.tasks.get(task_id)
+
+    def replace_all(self, tasks):
+        """Replaces the mirror with a fresh newest-first list from Notion."""
+        self._replace(tasks)
+        self.last_refresh = self.last_full_refresh = time.time()
+        self.watermark = max((t.get("last_edited_time") or "" for t in tasks), default="") or None
+        self.refreshes += 1
+        self._save()
+
+    def merge(self, tasks):
+        """Applies a newest-first list of pages edited since the watermark (incremental sync)."""
+        for task in reversed(tasks):
+            self.tasks.pop(task["id"], None)
+            self.tasks[task["id"]] = task
+            self._seq += 1
+            self.index.upsert(task, self._seq)
+        if tasks:
+            self._changed()
+        self.watermark = max([self.watermark or ""] + [t.get("last_edited_time") or "" for t in tasks]) or None
+        self.last_refresh = time.time()
+        self.incremental_refreshes += 1
+        self._save()
+
+    def upsert(self, task):
+        """Inserts or replaces a task and moves it to the front."""
+        self.tasks.pop(task["id"], None)
+        self.tasks[task["id"]] = task
+        self._seq += 1
+        # Local writes count as edits now (Notion's last_edited_time catches up on the next sync)
+        self.index.upsert(task, self._seq, edited=datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"))
+        self._changed()
+        self.write_throughs += 1
+        self._save()
+
+    def update(self, task_id, **fields):
+        """Applies a partial update to a known task and moves it to the front."""
+        task = self.tasks.get(task_id)
+        if not task:
+            return None
+        self.upsert({**task, **fields})
+        return self.tasks[task_id]
+
+    def rename(self, old_id, new_id):
+        """Re-keys a task in place (a locally created task once Notion assigned its page id)."""
+        if old_id not in self.tasks:
+            return
+        self.tasks = {(new_id if k == old_id else k): ({**t, "id": new_id, "notion_page_id": new_id} if k == old_id else t)
+                      for k, t in self.tasks.items()}
+        self.index.rename(old_id, new_id)
+        self._changed()
+        self._save()
+
+    def remove(self, task_id):
+        if self.tasks.pop(task_id, None) is not None:
+            self.index.remove(task_id)
+            self._changed()
+            self._save()
+
+    def query(self, limit=100, cursor=None, **filters):
+        """One page of tasks matching filters (see TaskIndex.query); returns (tasks, next cursor)."""
+        self.hits += 1
+        ids, next_cursor = self.index.query(limit=limit, cursor=cursor, **filters)
+        return [self.tasks[task_id] for task_id in ids], next_cursor
+
+    def staleness(self):
+        """Seconds since the last sync (full or incremental), or None if never synced."""
+        if self.last_refresh is None:
+            return None
+        return time.time() - self.last_refresh
+
+    def get_stats(self):
+        staleness = self.staleness()
+        return {
+            "size": len(self.tasks),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "incremental_refreshes": self.incremental_refreshes,
+            "watermark": self.watermark,
+            "write_throughs": self.write_throughs,
+            "saves": self.saves,
+            "staleness_seconds": round(staleness, 1) if staleness is not None else None
+        }
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import agent as agent_module
+from agent import Agent, AnalysisBatcher
+
+SINGLE_RESULT = {"priority": 1, "summary": "single", "action_required": False}
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModel:
+    """Answers batch prompts with a canned response and single prompts with SINGLE_RESULT."""
+    def __init__(self, batch_text):
+        self.batch_text = batch_text
+        self.calls = []
+
+    async def generate_content_async(self, prompt, **kwargs):
+        if "BATCH MODE" in prompt:
+            self.calls.append("batch")
+            return FakeResponse(self.batch_text)
+        self.calls.append("single")
+        return FakeResponse(json.dumps(SINGLE_RESULT))
+
+def make_batcher(tmp_path, monkeypatch, batch_text):
+    prompt_file = tmp_path / "system_prompt.txt"
+    prompt_file.write_text("Memory: {{ memory_text }}\nChat: {{ message_text }}")
+    monkeypatch.setattr(agent_module, "PROMPT_FILE", str(prompt_file))
+    monkeypatch.setattr(agent_module, "ANALYSIS_CACHE_TTL_HOURS", 0)
+    monkeypatch.delenv("GENAI_KEY", raising=False)
+    agent = Agent()
+    agent.api_key = "test"
+    agent.model = FakeModel(batch_text)
+    return AnalysisBatcher(agent, window_ms=20, max_size=8), agent.model
+
+def analyze_all(batcher, count):
+    async def run():
+        return await asyncio.gather(*(batcher.analyze(f"message {i}", f"sender {i}", "shared", f"memory {i}")
+                                      for i in range(count)))
+    return asyncio.run(run())
+
+def batch_result(index, summary):
+    return {"index": index, "priority": 3, "summary": summary, "action_required": True}
+
+def test_batch_results_land_at_their_index(tmp_path, monkeypatch):
+    batch_text = json.dumps({"results": [batch_result(1, "second"), batch_result(0, "first")]})
+    batcher, model = make_batcher(tmp_path, monkeypatch, batch_text)
+
+    results = analyze_all(batcher, 2)
+    assert [r["summary"] for r in results] == ["first", "second"]
+    assert model.calls == ["batch"]
+    assert batcher.get_stats() == {"batches_sent": 1, "batched_messages": 2, "fallbacks": 0}
+
+def test_duplicate_and_out_of_range_indexes_fall_back_to_single_calls(tmp_path, monkeypatch):
+    batch_text = json.dumps({"results": [batch_result(0, "first"), batch_result(0, "again"),
+                                         batch_result(5, "nowhere"), batch_result(-1, "negative")]})
+    batcher, model = make_batcher(tmp_path, monkeypatch, batch_text)
+
+    results = analyze_all(batcher, 2)
+    assert results[0]["summary"] == "first"
+    assert results[1] == SINGLE_RESULT
+    assert model.calls == ["batch", "single"]
+    assert batcher.get_stats() == {"batches_sent": 1, "batched_messages": 1, "fallbacks": 1}
+
+def test_failed_batch_falls_back_to_single_calls(tmp_path, monkeypatch):
+    batcher, model = make_batcher(tmp_path, monkeypatch, "not json")
+
+    results = analyze_all(batcher, 2)
+    assert results == [SINGLE_RESULT, SINGLE_RESULT]
+    assert model.calls == ["batch", "single", "single"]
+    assert batcher.get_stats() == {"batches_sent": 0, "batched_messages": 0, "fallbacks": 2}
@@ -0,0 +1,26 @@
+from memory_manager import MemoryManager
+
+def make_manager(tmp_path):
+    return MemoryManager(storage_file=str(tmp_path / "memory.json"), dedup_threshold=0.85, dedup_mode="reject")
+
+def test_changed_value_is_stored(tmp_path):
+    manager = make_manager(tmp_path)
+    assert manager.add_memory("User prefers meetings in the morning before 11am")
+    assert manager.add_memory("User prefers meetings in the afternoon after 2pm")
+    assert manager.add_memory("User's manager is Alice Johnson from the platform team")
+    assert manager.add_memory("User's manager is Bob Smith from the platform team")
+    assert len(manager.memories) == 4
+
+def test_near_duplicate_wording_is_rejected(tmp_path):
+    manager = make_manager(tmp_path)
+    assert manager.add_memory("User prefers meetings in the morning before 11am")
+    assert not manager.add_memory("User prefers meetings in the morning before 11am.")
+    assert not manager.add_memory("user prefers meeting in the morning before 11am")
+    assert len(manager.memories) == 1
+
+def test_facts_without_words_are_not_duplicates(tmp_path):
+    manager = make_manager(tmp_path)
+    assert manager.add_memory("👍")
+    assert manager.add_memory("🎉🎉")
+    assert manager.find_near_duplicate("?!") is None
+    assert len(manager.memories) == 2
@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+from notion_outbox import NotionOutbox
+from utils import TokenBucket
+
+class FakeNotionSync:
+    """Records the calls the outbox makes instead of talking to Notion."""
+    def __init__(self):
+        self.rate_limiter = TokenBucket(1000)
+        self.calls = []
+        self.pages = 0
+
+    async def create_task_page(self, task):
+        self.pages += 1
+        page_id = f"page-{self.pages}"
+        self.calls.append(("create", page_id, task["summary"]))
+        return page_id
+
+    async def update_task_properties(self, page_id, **properties):
+        self.calls.append(("update", page_id, properties))
+        return True
+
+    async def apply_comment_changes(self, page_id, added=(), deleted=()):
+        self.calls.append(("comments", page_id, [c["id"] for c in added], list(deleted)))
+        return True
+
+async def drain(outbox):
+    runner = asyncio.create_task(outbox.run())
+    for _ in range(100):
+        if not outbox.size():
+            break
+        await asyncio.sleep(0.01)
+    runner.cancel()
+
+def comment(comment_id):
+    return {"id": comment_id, "timestamp": "2026-01-01 10:00", "sender": "User", "text": comment_id}
+
+def test_pending_updates_coalesce_into_one_request(tmp_path):
+    async def scenario():
+        notion = FakeNotionSync()
+        outbox = NotionOutbox(notion, db_path=str(tmp_path / "outbox.db"))
+        first = outbox.update("page-1", status="done")
+        outbox.update("page-1", priority=3)
+        last = outbox.update("page-1", status="active")
+        outbox.add_comment("page-1", comment("c1"))
+        outbox.add_comment("page-1", comment("c2"))
+        outbox.delete_comment("page-1", "c1")  # Never sent, so it just drops the addition
+        assert outbox.size() == 2
+        assert outbox.coalesced == 4
+
+        await drain(outbox)
+        assert notion.calls == [
+            ("update", "page-1", {"status": "active", "priority": 3}),
+            ("comments", "page-1", ["c2"], [])
+        ]
+        assert await first is True and await last is True
+    asyncio.run(scenario())
+
+def test_queued_operations_replay_after_a_crash(tmp_path):
+    db_path = str(tmp_path / "outbox.db")
+
+    async def before_crash():
+        outbox = NotionOutbox(FakeNotionSync(), db_path=db_path)
+        local_id = outbox.create({"summary": "Send the report"}).page_id
+        outbox.update(local_id, priority=4)
+        outbox.add_comment(local_id, comment("c1"))
+        return local_id  # The process dies before the drain loop runs
+
+    async def after_restart():
+        notion = FakeNotionSync()
+        outbox = NotionOutbox(notion, db_path=db_path)
+        assert outbox.size() == 3
+        await drain(outbox)
+        assert notion.calls == [
+            ("create", "page-1", "Send the report"),
+            ("update", "page-1", {"priority": 4}),
+            ("comments", "page-1", ["c1"], [])
+        ]
+        assert outbox.resolve(local_id) == "page-1"
+
+    local_id = asyncio.run(before_crash())
+    asyncio.run(after_restart())
+
+def test_next_op_skips_deferred_and_unconfirmed_pages(tmp_path):
+    async def scenario():
+        outbox = NotionOutbox(FakeNotionSync(), db_path=str(tmp_path / "outbox.db"))
+        deferred = outbox.update("page-1", status="done")
+        outbox.update("local:abc", priority=2)  # Its create was never queued, so it can't go out
+        due = outbox.update("page-2", status="done")
+        with outbox.conn:
+            outbox.conn.execute("UPDATE ops SET next_attempt = ? WHERE id = ?", (time.time() + 60, deferred.op_id))
+
+        op, wait = outbox._next_op()
+        assert op[0] == due.op_id and wait is None
+
+        with outbox.conn:
+            outbox.conn.execute("DELETE FROM ops WHERE id = ?", (due.op_id,))
+        op, wait = outbox._next_op()
+        assert op is None and 55 < wait <= 60
+    asyncio.run(scenario())
+
+def test_drain_waits_for_due_operations(tmp_path):
+    async def scenario():
+        notion = FakeNotionSync()
+        outbox = NotionOutbox(notion, db_path=str(tmp_path / "outbox.db"))
+        runner = asyncio.create_task(outbox.run())
+        outbox.update("page-1", status="done")
+        outbox.add_comment("page-2", comment("c1"))
+        assert await outbox.drain(timeout=1.0)
+        assert outbox.size() == 0 and len(notion.calls) == 2
+        runner.cancel()
+    asyncio.run(scenario())
@@ -0,0 +1,41 @@
+import asyncio
+
+import httpx
+
+import server
+
+class FakeTaskManager:
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.priorities = {}
+
+    async def get_task(self, task_id):
+        return self.tasks.get(task_id)
+
+    async def update_priority(self, task_id, priority):
+        self.priorities[task_id] = priority
+
+    async def mark_done(self, task_id):
+        self.tasks[task_id]["status"] = "done"
+
+def post(path, json=None):
+    async def request():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(path, json=json)
+    return asyncio.run(request())
+
+def test_task_endpoints_validate_input(monkeypatch):
+    manager = FakeTaskManager({"page-1": {"id": "page-1", "status": "active"}})
+    monkeypatch.setattr(server, "task_manager", manager)
+    monkeypatch.setattr(server, "notification_callback", None)
+
+    assert post("/api/priority/page-1", {"priority": "high"}).status_code == 400
+    assert post("/api/priority/missing", {"priority": 2}).status_code == 404
+    assert post("/api/done/missing").status_code == 404
+    assert manager.priorities == {}
+
+    response = post("/api/priority/page-1", {"priority": "2"})
+    assert response.status_code == 200 and response.json()["priority"] == 2
+    assert post("/api/done/page-1").status_code == 200
+    assert manager.priorities == {"page-1": 2} and manager.tasks["page-1"]["status"] == "done"
@@ -0,0 +1,38 @@
+import asyncio
+import json
+
+from task_mirror import TaskMirror
+
+def task(task_id, status="active"):
+    return {"id": task_id, "summary": task_id, "status": status, "priority": 1}
+
+def read_tasks(path):
+    with open(path) as f:
+        return [t["id"] for t in json.load(f)["tasks"]]
+
+def test_changes_in_one_window_are_saved_once(tmp_path):
+    path = tmp_path / "tasks.json"
+
+    async def scenario():
+        mirror = TaskMirror(str(path), save_delay_ms=20)
+        for i in range(50):
+            mirror.upsert(task(f"t{i}"))
+        mirror.update("t0", status="done")
+        assert not path.exists()
+        await asyncio.sleep(0.05)
+        assert mirror.saves == 1
+        assert read_tasks(path)[0] == "t0"
+
+        mirror.remove("t1")
+        mirror.close()  # Shutdown writes the pending change without waiting for the window
+        assert mirror.saves == 2
+        assert "t1" not in read_tasks(path)
+    asyncio.run(scenario())
+
+def test_saves_immediately_outside_the_event_loop(tmp_path):
+    path = tmp_path / "tasks.json"
+    mirror = TaskMirror(str(path), save_delay_ms=20)
+    mirror.upsert(task("t0"))
+    assert read_tasks(path) == ["t0"]
+    assert not (tmp_path / "tasks.json.tmp").exists()
+    assert TaskMirror(str(path)).get("t0")["summary"] == "t0"
@@ -0,0 +1,191 @@
+"""
+Local pre-LLM triage: a hashed n-gram naive Bayes classifier that predicts whether a message
+is noise (priority 4, no action) before it is sent to Gemini. Trained offline from the audit log.
+
+Usage:
+    python triage.py train [--audit audit_log] [--model triage_model.json] [--threshold 0.97]
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import zlib
+
+logger = logging.getLogger(__name__)
+
+NUM_BUCKETS = 1 << 18
+ALPHA = 0.5  # Additive smoothing
+TOKEN_RE = re.compile(r"\w+")
+SKIP_SUMMARIES = {"Analysis failed", "No API Key"}
+
+def extract_features(text):
+    """Hashed word unigrams and bigrams (crc32, stable across processes)."""
+    tokens = TOKEN_RE.findall((text or "").casefold())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    if not grams:
+        grams = ["<empty>"]
+    return [zlib.crc32(g.encode()) % NUM_BUCKETS for g in grams]
+
+def is_noise_label(evaluation):
+    """LLM label: noise means priority 4 (or missing) and no action required."""
+    return evaluation.get("priority", 4) >= 4 and not evaluation.get("action_required", False)
+
+def labeled_examples(entries):
+    """(text, is_noise) pairs from audit entries, skipping failed analyses and triage's own verdicts."""
+    examples = []
+    for entry in entries:
+        evaluation = entry.get("evaluation") or {}
+        if evaluation.get("source") == "triage" or evaluation.get("summary") in SKIP_SUMMARIES:
+            continue
+        if not entry.get("text"):
+            continue
+        examples.append((entry["text"], is_noise_label(evaluation)))
+    return examples
+
+class TriageClassifier:
+    def __init__(self, model=None):
+        self.model = model
+        self._log_priors = None
+        self._log_likelihoods = None
+
+        # Shadow/online agreement with the LLM (positive class = noise)
+        self.true_positives = 0
+        self.false_positives = 0
+        self.false_negatives = 0
+        self.true_negatives = 0
+        self.skipped = 0
+
+        if model:
+            self._prepare()
+
+    @classmethod
+    def load(cls, path):
+        """Loads a trained model, or returns an untrained classifier if the file is missing."""
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, 'r') as f:
+                return cls(json.load(f))
+        except Exception as e:
+            logger.error(f"Failed to load triage model: {e}")
+            return cls()
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.model, f)
+
+    def is_ready(self):
+        return self.model is not None
+
+    def _prepare(self):
+        """Precomputes log probabilities so scoring is a few dict lookups per n-gram."""
+        totals = self.model["class_counts"]
+        n = totals["noise"] + totals["signal"]
+        self._log_priors = {c: math.log((totals[c] + 1) / (n + 2)) for c in ("noise", "signal")}
+        self._log_likelihoods = {}
+        for c in ("noise", "signal"):
+            counts = self.model["feature_counts"][c]
+            denominator = self.model["feature_totals"][c] + ALPHA * NUM_BUCKETS
+            self._log_likelihoods[c] = (
+                {int(b): math.log((v + ALPHA) / denominator) for b, v in counts.items()},
+                math.log(ALPHA / denominator)  # Unseen bucket
+            )
+
+    @classmethod
+    def train(cls, examples):
+        feature_counts = {"noise": {}, "signal": {}}
+        feature_totals = {"noise": 0, "signal": 0}
+        class_counts = {"noise": 0, "signal": 0}
+        for text, is_noise in examples:
+            c = "noise" if is_noise else "signal"
+            class_counts[c] += 1
+            for bucket in extract_features(text):
+                feature_counts[c][bucket] = feature_counts[c].get(bucket, 0) + 1
+                feature_totals[c] += 1
+        return cls({
+            "buckets": NUM_BUCKETS,
+            "class_counts": class_counts,
+            "feature_counts": {c: {str(b): v for b, v in counts.items()} for c, counts in feature_counts.items()},
+            "feature_totals": feature_totals
+        })
+
+    def score(self, text):
+        """Probability that the text is noise, or None without a model."""
+        if not self.model:
+            return None
+        log_p = {}
+        for c in ("noise", "signal"):
+            known, unseen = self._log_likelihoods[c]
+            log_p[c] = self._log_priors[c] + sum(known.get(b, unseen) for b in extract_features(text))
+        # Normalize in log space to avoid underflow on long texts
+        diff = max(min(log_p["signal"] - log_p["noise"], 700), -700)
+        return 1.0 / (1.0 + math.exp(diff))
+
+    def record(self, noise_score, threshold, llm_is_noise):
+        """Tracks how the triage verdict compares with the LLM's label."""
+        predicted_noise = noise_score >= threshold
+        if predicted_noise and llm_is_noise: self.true_positives += 1
+        elif predicted_noise: self.false_positives += 1
+        elif llm_is_noise: self.false_negatives += 1
+        else: self.true_negatives += 1
+
+    def get_stats(self):
+        return {
+            "ready": self.is_ready(),
+            "skipped_llm_calls": self.skipped,
+            **precision_recall(self.true_positives, self.false_positives, self.false_negatives, self.true_negatives)
+        }
+
+def precision_recall(tp, fp, fn, tn):
+    return {
+        "true_positives": tp,
+        "false_positives": fp,
+        "false_negatives": fn,
+        "true_negatives": tn,
+        "precision": round(tp / (tp + fp), 3) if tp + fp else None,
+        "recall": round(tp / (tp + fn), 3) if tp + fn else None
+    }
+
+def evaluate(classifier, examples, threshold):
+    tp = fp = fn = tn = 0
+    for text, is_noise in examples:
+        predicted_noise = classifier.score(text) >= threshold
+        if predicted_noise and is_noise: tp += 1
+        elif predicted_noise: fp += 1
+        elif is_noise: fn += 1
+        else: tn += 1
+    return precision_recall(tp, fp, fn, tn)
+
+def main():
+    from audit_store import AuditStore
+    from config import TRIAGE_MODEL_PATH, TRIAGE_THRESHOLD, AUDIT_LOG_DIR
+
+    parser = argparse.ArgumentParser(description="Train the local triage classifier from the audit log.")
+    parser.add_argument("command", choices=["train"])
+    parser.add_argument("--audit", default=AUDIT_LOG_DIR, help="Audit log directory")
+    parser.add_argument("--model", default=TRIAGE_MODEL_PATH)
+    parser.add_argument("--threshold", type=float, default=TRIAGE_THRESHOLD)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of newest entries held out for evaluation")
+    args = parser.parse_args()
+
+    # Audit entries are newest first; hold out the newest slice to mimic future traffic
+    examples = labeled_examples(AuditStore(args.audit, read_only=True).iter_newest())
+    if len(examples) < 20:
+        print(f"Not enough labeled audit entries to train ({len(examples)}).")
+        return
+    split = int(len(examples) * args.holdout)
+    holdout, training = examples[:split], examples[split:]
+
+    report = evaluate(TriageClassifier.train(training), holdout, args.threshold)
+    print(f"Holdout ({len(holdout)} messages, threshold {args.threshold}): "
+          f"precision={report['precision']} recall={report['recall']} "
+          f"(tp={report['true_positives']} fp={report['false_positives']} fn={report['false_negatives']} tn={report['true_negatives']})")
+
+    # Ship a model trained on everything
+    TriageClassifier.train(examples).save(args.model)
+    print(f"Saved model trained on {len(examples)} messages to {args.model}.")
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,247 @@
 import asyncio
 import logging
 import functools
+import random
+import time
+from email.utils import parsedate_to_datetime
 
 logger = logging.getLogger(__name__)
 
-def retry_with_backoff(retries=3, backoff_in_seconds=1):
+RETRYABLE_STATUSES = {408, 409, 420, 425, 429, 500, 502, 503, 504}
+FATAL_EXCEPTIONS = (TypeError, ValueError, KeyError, AttributeError, NotImplementedError)
+MAX_SERVER_DELAY_SECONDS = 300
+
+# Retry counters per decorated function: {"calls", "retries", "gave_up", "fatal", "short_circuited"}
+RETRY_METRICS = {}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+    def __init__(self, breaker, retry_in):
+        super().__init__(f"{breaker} circuit open; retry in {retry_in:.0f}s")
+        self.breaker = breaker
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    """
+    Shared per-backend breaker: after `failure_threshold` consecutive transient failures it
+    opens and callers fail fast for `reset_seconds`, then one trial call (half-open) decides
+    whether it closes again or re-opens.
+    """
+    def __init__(self, name, failure_threshold=5, reset_seconds=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+        # Counters
+        self.transitions = {"open": 0, "half_open": 0, "closed": 0}
+        self.rejected = 0
+
+    def _set_state(self, state):
+        if state != self.state:
+            logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+            self.state = state
+            self.transitions[state] += 1
+
+    def allow(self):
+        """Raises CircuitOpenError while open; lets one trial call through once reset_seconds passed."""
+        if self.state == "closed":
+            return
+        retry_in = self.opened_at + self.reset_seconds - time.monotonic()
+        if self.state == "open" and retry_in <= 0:
+            self._set_state("half_open")
+        if self.state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError(self.name, max(retry_in, 0.0))
+
+    def release_trial(self):
+        """Frees the half-open trial slot if its call ended without an outcome (e.g. cancelled)."""
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self._trial_in_flight = False
+        self._set_state("closed")
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state("open")
+
+    def get_stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.transitions["open"],
+            "rejected_calls": self.rejected
+        }
+
+BREAKERS = {name: CircuitBreaker(name) for name in ("notion", "gemini", "telegram")}
+
+def error_status(error):
+    """HTTP-like status of an API error: Notion .status, google-api-core .code, Pyrogram .CODE."""
+    for attr in ("status", "code", "CODE"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    return None
+
+def classify_error(error):
+    """
+    Returns (retryable, server_delay). Rate limits, timeouts, conflicts, 5xx and network errors
+    are retryable; other 4xx and programming errors are fatal. server_delay is the wait the
+    backend asked for (Retry-After, Telegram FLOOD_WAIT, open circuit), if any.
+    """
+    if isinstance(error, CircuitOpenError):
+        return True, error.retry_in
+    status = error_status(error)
+    if status is not None:
+        delay = retry_after_seconds(error)
+        if status == 420 and isinstance(getattr(error, "value", None), int):
+            delay = error.value  # Telegram FLOOD_WAIT_X
+        return status in RETRYABLE_STATUSES, delay
+    if isinstance(error, FATAL_EXCEPTIONS):
+        return False, None
+    return True, None  # Timeouts, connection resets and other transport errors
+
+def record_outcome(circuit, retryable):
+    """Feeds a failed call into a breaker. A fatal (4xx) answer still proves the backend is up."""
+    if retryable:
+        circuit.record_failure()
+    else:
+        circuit.record_success()
+
+def decorrelated_jitter(previous, base, cap):
+    """Next backoff: uniform between base and 3x the previous sleep, capped (AWS decorrelated jitter)."""
+    return min(cap, random.uniform(base, previous * 3))
+
+def retry_with_backoff(retries=3, backoff_in_seconds=1, max_backoff_in_seconds=30, breaker=None):
     """
-    Decorator to retry an async function with exponential backoff.
+    Decorator to retry an async function on retryable errors with decorrelated jitter,
+    honouring server-provided delays. Fatal errors are raised at once. With `breaker` (a
+    BREAKERS name), calls fail fast while that backend's circuit is open.
     """
     def decorator(func):
+        metrics = RETRY_METRICS.setdefault(func.__qualname__, {"calls": 0, "retries": 0, "gave_up": 0, "fatal": 0, "short_circuited": 0})
+        circuit = BREAKERS[breaker] if breaker else None
+
         @functools.wraps(func)
         async def wrapper(*args, **kwargs):
+            metrics["calls"] += 1
             x = 0
+            wait = backoff_in_seconds
             while True:
                 try:
-                    return await func(*args, **kwargs)
+                    if circuit:
+                        circuit.allow()
+                    try:
+                        result = await func(*args, **kwargs)
+                    finally:
+                        if circuit:
+                            circuit.release_trial()  # A cancelled trial must not wedge the breaker half-open
+                    if circuit:
+                        circuit.record_success()
+                    return result
                 except Exception as e:
+                    if isinstance(e, CircuitOpenError):
+                        metrics["short_circuited"] += 1
+                        raise e
+                    retryable, server_delay = classify_error(e)
+                    if circuit:
+                        record_outcome(circuit, retryable)
+                    if not retryable:
+                        metrics["fatal"] += 1
+                        raise e
                     if x == retries:
+                        metrics["gave_up"] += 1
                         logger.error(f"Function {func.__name__} failed after {retries} retries. Error: {e}")
                         raise e
-                    
-                    wait = (backoff_in_seconds * 2 ** x)
-                    logger.warning(f"Function {func.__name__} failed with {e}. Retrying in {wait}s...")
+
+                    wait = decorrelated_jitter(wait, backoff_in_seconds, max_backoff_in_seconds)
+                    if server_delay is not None:
+                        wait = min(max(wait, server_delay), MAX_SERVER_DELAY_SECONDS)
+                    metrics["retries"] += 1
+                    logger.warning(f"Function {func.__name__} failed with {e}. Retrying in {wait:.1f}s...")
                     await asyncio.sleep(wait)
                     x += 1
         return wrapper
     return decorator
+
+def get_retry_stats():
+    return {
+        "retries": {name: dict(m) for name, m in RETRY_METRICS.items()},
+        "breakers": {name: b.get_stats() for name, b in BREAKERS.items()}
+    }
+
+def retry_after_seconds(error):
+    """Seconds requested by a Retry-After header on an HTTP error (seconds or HTTP date), else None."""
+    headers = getattr(error, "headers", None)
+    value = headers.get("retry-after") if headers else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """
+    Async token bucket shared by every caller of one API: `rate` requests per second with bursts
+    up to `capacity`. pause() stops all callers, e.g. for a 429's Retry-After.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+        # Counters
+        self.acquired = 0
+        self.waited_seconds = 0.0
+        self.pauses = 0
+
+    async def acquire(self):
+        async with self._lock:
+            start = time.monotonic()
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+            self.acquired += 1
+            self.waited_seconds += time.monotonic() - start
+
+    def pause(self, seconds):
+        """Blocks all acquirers for `seconds` and drains the burst allowance."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self._updated = self._paused_until  # No burst credit accrues while paused
+        self.pauses += 1
+        logger.warning(f"Rate limited; pausing requests for {seconds:.1f}s.")
+
+    def get_stats(self):
+        return {
+            "rate_per_second": self.rate,
+            "acquired": self.acquired,
+            "waited_seconds": round(self.waited_seconds, 3),
+            "pauses": self.pauses
+        }